@@ -0,0 +1,245 @@
+"""
+This module mixes the hit sounds of a chart into its music track offline, for video export.
+
+Every hit sound is added at the exact sample its note is hit at, with no channel limit, so no sound is dropped and
+no timing is quantized to frames. The song is read, mixed and written chunk by chunk, so memory stays bounded on long
+songs. NumPy is required.
+
+"""
+
+import argparse
+import time
+import wave
+
+try:
+    import numpy as np
+except ImportError:  # only required by this module.
+    np = None
+
+from chart import *
+
+__all__ = ["read_wav", "wav_chunk_reader", "get_hit_sound_offsets", "mixdown_result", "mix_hit_sounds"]
+
+DEFAULT_SAMPLE_RATE = 48000
+DEFAULT_CHANNELS = 2
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("NumPy is required for audio mixdown.")
+
+
+def _decode_frames(data: bytes, sample_width: int, channels: int):
+    """Decodes little endian PCM frames into a float32 (frames, channels) array in [-1, 1]."""
+    if sample_width == 1:
+        samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif sample_width == 2:
+        samples = np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768.0
+    elif sample_width == 3:
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        value = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        value = np.where(value >= 1 << 23, value - (1 << 24), value)
+        samples = value.astype(np.float32) / float(1 << 23)
+    elif sample_width == 4:
+        samples = (np.frombuffer(data, dtype="<i4").astype(np.float64) / float(1 << 31)).astype(np.float32)
+    else:
+        raise ValueError("Unsupported sample width: %d" % sample_width)
+    return samples.reshape(-1, channels)
+
+
+def _convert(samples, rate: int, channels: int, target_rate: int, target_channels: int):
+    """Converts a (frames, channels) array to another channel count and sample rate."""
+    if channels != target_channels:
+        mono = samples.mean(axis=1, keepdims=True)
+        samples = np.repeat(mono, target_channels, axis=1)
+    if rate != target_rate and len(samples) > 0:
+        count = max(1, int(round(len(samples) * target_rate / rate)))
+        positions = np.arange(count, dtype=np.float64) * (rate / target_rate)
+        source = np.arange(len(samples), dtype=np.float64)
+        samples = np.stack([np.interp(positions, source, samples[:, c]) for c in range(target_channels)], axis=1)
+    return np.ascontiguousarray(samples, dtype=np.float32)
+
+
+def read_wav(path: str, target_rate: int or None = None, target_channels: int or None = None):
+    """
+    Reads a whole PCM wav file.\n
+    :param path: The path to the file.
+    :param target_rate: The sample rate to convert to. None to keep the rate of the file.
+    :param target_channels: The channel count to convert to. None to keep the channels of the file.
+    :return: A tuple of a float32 (frames, channels) array and the sample rate.
+    """
+    _require_numpy()
+    with wave.open(path, "rb") as reader:
+        rate = reader.getframerate()
+        channels = reader.getnchannels()
+        samples = _decode_frames(reader.readframes(reader.getnframes()), reader.getsampwidth(), channels)
+    target_rate = rate if target_rate is None else target_rate
+    target_channels = channels if target_channels is None else target_channels
+    return _convert(samples, rate, channels, target_rate, target_channels), target_rate
+
+
+class wav_chunk_reader:
+    """Reads a PCM wav file chunk by chunk, as float32 (frames, channels) arrays."""
+    __slots__ = ("reader", "rate", "channels", "sample_width", "frame_count")
+
+    def __init__(self, path: str):
+        _require_numpy()
+        self.reader = wave.open(path, "rb")
+        self.rate = self.reader.getframerate()
+        self.channels = self.reader.getnchannels()
+        self.sample_width = self.reader.getsampwidth()
+        self.frame_count = self.reader.getnframes()
+
+    def read(self, frames: int):
+        """Reads up to given number of frames. The result is shorter at the end of the file."""
+        return _decode_frames(self.reader.readframes(frames), self.sample_width, self.channels)
+
+    def close(self):
+        self.reader.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def get_hit_sound_offsets(notes: list[phi_note], offset: float, rate: int):
+    """
+    Gets the sample offset of every note in the song.\n
+    :param notes: The notes of the chart.
+    :param offset: The chart offset in seconds. A note at real time t is hit at t + offset in the song.
+    :param rate: The sample rate.
+    :return: A tuple of int64 sample offsets and int8 note types, sorted by offset.
+    """
+    _require_numpy()
+    times = np.fromiter((n.real_time for n in notes), dtype=np.float64, count=len(notes))
+    types = np.fromiter((n.note_type for n in notes), dtype=np.int8, count=len(notes))
+    offsets = np.rint((times + offset) * rate).astype(np.int64)
+    order = np.argsort(offsets, kind="stable")
+    return offsets[order], types[order]
+
+
+class mixdown_result:
+    """Represents the summary of a mixdown."""
+    __slots__ = ("sample_rate", "channels", "frames", "notes_mixed", "clipped_samples", "seconds")
+
+    def __init__(self, sample_rate: int, channels: int, frames: int, notes_mixed: int, clipped_samples: int,
+                 seconds: float):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frames = frames
+        self.notes_mixed = notes_mixed
+        self.clipped_samples = clipped_samples
+        self.seconds = seconds
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def mix_hit_sounds(chart: phi_chart, output_path: str, sound_paths: dict[int, str], song_path: str or None = None,
+                   gain: float = 1.0, hit_sound_gain: float = 1.0, chunk_seconds: float = 10.0,
+                   tail: float = 1.0) -> mixdown_result:
+    """
+    Mixes the hit sound of every note into the song and writes a 16 bit PCM wav file.\n
+    :param chart: The chart.
+    :param output_path: The path to the output wav file.
+    :param sound_paths: Maps note types to the wav files of their hit sounds. Notes of other types are silent.
+    :param song_path: The path to the song wav file. None to mix the hit sounds over silence.
+    :param gain: The gain applied to the mix before it is clipped to 16 bits.
+    :param hit_sound_gain: The gain applied to every hit sound.
+    :param chunk_seconds: The length of the chunks the song is processed in.
+    :param tail: Seconds of silence kept after the last hit sound when the song is shorter.
+    :return: A summary of the mixdown.
+    """
+    _require_numpy()
+    start_clock = time.perf_counter()
+    song = None if song_path is None else wav_chunk_reader(song_path)
+    try:
+        rate = DEFAULT_SAMPLE_RATE if song is None else song.rate
+        channels = DEFAULT_CHANNELS if song is None else song.channels
+        loaded = {}
+        for path in set(sound_paths.values()):
+            loaded[path] = read_wav(path, rate, channels)[0] * np.float32(hit_sound_gain)
+        samples = {ty: loaded[path] for ty, path in sound_paths.items()}
+        offsets, types = get_hit_sound_offsets([n for n in chart.notes if n.note_type in samples], chart.offset,
+                                               rate)
+        lengths = np.array([len(samples[ty]) for ty in types.tolist()], dtype=np.int64)
+        ends = offsets + lengths
+        max_length = int(lengths.max()) if len(lengths) > 0 else 0
+
+        song_frames = 0 if song is None else song.frame_count
+        last_end = int(ends.max()) if len(ends) > 0 else 0
+        total = max(song_frames, last_end + int(tail * rate) if len(ends) > 0 else 0)
+        chunk = max(1, int(chunk_seconds * rate))
+        mixed = np.count_nonzero(ends > 0)
+        clipped = 0
+        type_list = types.tolist()
+        offset_list = offsets.tolist()
+
+        with wave.open(output_path, "wb") as writer:
+            writer.setnchannels(channels)
+            writer.setsampwidth(2)
+            writer.setframerate(rate)
+            first = 0
+            for c0 in range(0, total, chunk):
+                c1 = min(c0 + chunk, total)
+                buffer = np.zeros((c1 - c0, channels), dtype=np.float32)
+                if song is not None and c0 < song_frames:
+                    part = song.read(c1 - c0)
+                    buffer[:len(part)] = part
+
+                # every sound ends within max_length samples, so the sounds ending before the chunk are skipped.
+                while first < len(offset_list) and offset_list[first] + max_length <= c0:
+                    first += 1
+                last = int(np.searchsorted(offsets, c1, side="left"))
+                for j in range(first, last):
+                    o = offset_list[j]
+                    sound = samples[type_list[j]]
+                    a = max(o, c0)
+                    b = min(o + len(sound), c1)
+                    if a < b:
+                        buffer[a - c0:b - c0] += sound[a - o:b - o]
+
+                if gain != 1.0:
+                    buffer *= np.float32(gain)
+                out_of_range = np.abs(buffer) > 1.0
+                clipped += int(np.count_nonzero(out_of_range))
+                np.clip(buffer, -1.0, 1.0, out=buffer)
+                writer.writeframes((buffer * 32767.0).astype("<i2").tobytes())
+    finally:
+        if song is not None:
+            song.close()
+    return mixdown_result(rate, channels, total, int(mixed), clipped, time.perf_counter() - start_clock)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mixes the hit sounds of a chart into its song.")
+    parser.add_argument("chart", help="chart json file")
+    parser.add_argument("output", help="output wav file")
+    parser.add_argument("--song", help="song wav file; without it the hit sounds are mixed over silence")
+    parser.add_argument("--tap", help="tap and hold hit sound wav file")
+    parser.add_argument("--drag", help="drag hit sound wav file")
+    parser.add_argument("--flick", help="flick hit sound wav file")
+    parser.add_argument("--gain", type=float, default=1.0, help="gain of the whole mix")
+    parser.add_argument("--hit-sound-gain", type=float, default=1.0, help="gain of every hit sound")
+    parser.add_argument("--chunk-seconds", type=float, default=10.0)
+    args = parser.parse_args()
+
+    sound_paths = {}
+    if args.tap is not None:
+        sound_paths[NOTE_TYPE_TAP] = args.tap
+        sound_paths[NOTE_TYPE_HOLD] = args.tap
+    if args.drag is not None:
+        sound_paths[NOTE_TYPE_DRAG] = args.drag
+    if args.flick is not None:
+        sound_paths[NOTE_TYPE_FLICK] = args.flick
+
+    result = mix_hit_sounds(open_chart_file(args.chart), args.output, sound_paths, args.song, args.gain,
+                            args.hit_sound_gain, args.chunk_seconds)
+    print("mixed %d notes into %.1f s of audio in %.2f s, %d samples clipped" %
+          (result.notes_mixed, result.frames / result.sample_rate, result.seconds, result.clipped_samples))
+
+
+if __name__ == "__main__":
+    main()
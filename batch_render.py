@@ -0,0 +1,305 @@
+"""
+This module renders a queue of charts in one process. One hidden window, frame buffer and set of skin textures serve
+every job; between jobs only the chart state and the illustration are replaced, see offline_renderer.load_chart().
+
+Jobs come from a manifest, or from a directory scan where every subdirectory holds a chart, its music and its
+illustration. A failing job is recorded and the queue goes on. The report, with the throughput of every job, is
+rewritten after each job, so an interrupted run still leaves one.
+
+"""
+
+import argparse
+import csv
+import json
+import os
+import time
+import traceback
+
+from chart import open_chart_file
+from chart_renderer import render_options
+from offline_render import *
+from resource_loader import resource_loader
+from resource_manager import resource_manager, find_skin_images
+from sdl_render import sdl_window
+
+__all__ = ["batch_job", "batch_result", "batch_renderer", "scan_jobs", "load_manifest", "SINK_EXTENSIONS"]
+
+# sink kind -> extension of the output files.
+SINK_EXTENSIONS: dict[str, str] = {"raw": ".raw", "y4m": ".y4m", "ffmpeg": ".mp4"}
+
+_CHART_EXTENSIONS = (".json",)
+_MUSIC_EXTENSIONS = (".wav", ".ogg", ".mp3", ".flac")
+_ILLUSTRATION_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+
+class batch_job:
+    """Represents one chart of a batch: its chart, music and illustration files, and where the video goes."""
+    __slots__ = ("name", "chart_path", "music_path", "illustration_path", "output_path")
+
+    def __init__(self, name: str, chart_path: str, music_path: str = "", illustration_path: str = "",
+                 output_path: str = ""):
+        """
+        Initializes a new job.\n
+        :param name: The name of the job in the report, unique in a batch.
+        :param chart_path: The path to the chart file.
+        :param music_path: The path to the music, muxed into ffmpeg output. Empty for none.
+        :param illustration_path: The path to the illustration image. Empty for no background.
+        :param output_path: The output file. Empty to name it after the job in the output directory.
+        """
+        self.name = name
+        self.chart_path = chart_path
+        self.music_path = music_path
+        self.illustration_path = illustration_path
+        self.output_path = output_path
+
+
+class batch_result:
+    """Represents the outcome of a job, one row of the report."""
+    __slots__ = ("name", "chart_path", "output_path", "status", "error", "frames", "load_seconds",
+                 "render_seconds")
+
+    def __init__(self, job: batch_job):
+        self.name = job.name
+        self.chart_path = job.chart_path
+        self.output_path = job.output_path
+        self.status = "pending"
+        self.error = ""
+        self.frames = 0
+        self.load_seconds = 0.0
+        self.render_seconds = 0.0
+
+    @property
+    def fps(self) -> float:
+        """The frames rendered per second, not counting the load time."""
+        return self.frames / self.render_seconds if self.render_seconds > 0 else 0.0
+
+    def to_dict(self) -> dict:
+        item = {name: getattr(self, name) for name in self.__slots__}
+        item["fps"] = self.fps
+        return item
+
+
+def _find_file(directory: str, names: list[str], extensions: tuple[str, ...]) -> str:
+    for name in names:
+        if os.path.splitext(name)[1].lower() in extensions:
+            return os.path.join(directory, name)
+    return ""
+
+
+def scan_jobs(directory: str) -> list[batch_job]:
+    """
+    Finds a job in every subdirectory holding a chart file, sorted by name. The first file of each kind is taken:
+    a .json chart, a .wav, .ogg, .mp3 or .flac music, and a .png or .jpg illustration.\n
+    :param directory: The directory to scan.
+    :return: The jobs, named after their subdirectories.
+    """
+    jobs = []
+    for entry in sorted(os.scandir(directory), key=lambda e: e.name):
+        if not entry.is_dir():
+            continue
+        names = sorted(os.listdir(entry.path))
+        chart_path = _find_file(entry.path, names, _CHART_EXTENSIONS)
+        if chart_path == "":
+            continue
+        jobs.append(batch_job(entry.name, chart_path, _find_file(entry.path, names, _MUSIC_EXTENSIONS),
+                              _find_file(entry.path, names, _ILLUSTRATION_EXTENSIONS)))
+    return jobs
+
+
+def load_manifest(path: str) -> list[batch_job]:
+    """
+    Reads jobs from a JSON manifest: a list of objects with a "chart" and optionally "music", "illustration",
+    "output" and "name". Relative paths are relative to the manifest.\n
+    :param path: The path to the manifest.
+    :return: The jobs. Unnamed ones are named after their chart file.
+    """
+    with open(path, "r", encoding="utf-8") as file_stream:
+        items = json.load(file_stream)
+    base = os.path.dirname(os.path.abspath(path))
+
+    def resolve(value: str) -> str:
+        return os.path.join(base, value) if value != "" else ""
+
+    jobs = []
+    for item in items:
+        if "chart" not in item:
+            raise ValueError("A manifest entry has no chart: %r" % item)
+        chart_path = resolve(item["chart"])
+        name = item.get("name", os.path.splitext(os.path.basename(chart_path))[0])
+        jobs.append(batch_job(name, chart_path, resolve(item.get("music", "")),
+                              resolve(item.get("illustration", "")), resolve(item.get("output", ""))))
+    names = [job.name for job in jobs]
+    if len(set(names)) != len(names):
+        raise ValueError("Job names in a manifest must be unique.")
+    return jobs
+
+
+class batch_renderer:
+    """
+    Renders jobs one after another with one offline renderer. The skin is loaded once, and illustrations shared by
+    several charts are kept by a resource_manager.
+    """
+    __slots__ = ("options", "output_dir", "sink_kind", "pixel_format", "tail", "window", "loader", "resources",
+                 "renderer", "results")
+
+    def __init__(self, options: render_options, output_dir: str, sink_kind: str = "y4m", pixel_format: str = "rgba",
+                 image_paths: dict[str, str] or None = None, hit_effect_path: str = "", cache_dir: str or None = None,
+                 budget: int = 256 << 20, tail: float = 1.0):
+        """
+        Initializes a new batch renderer. init_headless() must be called first.\n
+        :param options: Render options shared by every job.
+        :param output_dir: The directory of the outputs of jobs without an output path.
+        :param sink_kind: "raw", "y4m" or "ffmpeg", see SINK_EXTENSIONS.
+        :param pixel_format: The pixel format of raw and ffmpeg output, one of the keys of PIXEL_FORMATS.
+        :param image_paths: Note images to load once, see global_resource.init_images().
+        :param hit_effect_path: The hit effect sprite sheet, see resource_manager.load_hit_effect(). Empty for none.
+        :param cache_dir: The directory of the scaled illustration cache. None to scale them in every run.
+        :param budget: The memory in bytes the textures of released illustrations may keep, see resource_manager.
+        :param tail: Seconds rendered after the last note.
+        """
+        if sink_kind not in SINK_EXTENSIONS:
+            raise ValueError("Unknown sink: %s" % sink_kind)
+        self.options = options
+        self.output_dir = output_dir
+        self.sink_kind = sink_kind
+        self.pixel_format = "yuv420p" if sink_kind == "y4m" else pixel_format
+        self.tail = tail
+        self.window = sdl_window("Autoplay", options.width, options.height, hidden=True, software=True)
+        self.loader = resource_loader()
+        self.resources = resource_manager(self.window.renderer, budget, self.loader, cache_dir)
+        if image_paths:
+            self.resources.load_skin(image_paths)
+        if hit_effect_path != "":
+            self.resources.load_hit_effect(hit_effect_path)
+        self.renderer: offline_renderer or None = None
+        self.results: list[batch_result] = []
+
+    def get_output_path(self, job: batch_job) -> str:
+        if job.output_path != "":
+            return job.output_path
+        return os.path.join(self.output_dir, job.name + SINK_EXTENSIONS[self.sink_kind])
+
+    def open_sink(self, job: batch_job, output_path: str) -> frame_sink:
+        options = self.options
+        if self.sink_kind == "y4m":
+            return y4m_frame_sink(output_path, options.width, options.height, options.fps)
+        if self.sink_kind == "ffmpeg":
+            return encoder_pipe_sink(get_ffmpeg_command(output_path, options.width, options.height, options.fps,
+                                                        self.pixel_format, audio_path=job.music_path))
+        return raw_frame_sink(output_path)
+
+    def render_job(self, job: batch_job) -> batch_result:
+        """Renders one job. Errors are recorded in the result instead of raised."""
+        result = batch_result(job)
+        result.output_path = self.get_output_path(job)
+        try:
+            start = time.perf_counter()
+            chart = open_chart_file(job.chart_path)
+            if job.music_path != "" and not os.path.isfile(job.music_path):
+                raise FileNotFoundError("Music not found: %s" % job.music_path)
+            if self.renderer is None:
+                self.renderer = offline_renderer(chart, self.options, job.illustration_path, self.pixel_format,
+                                                 window=self.window, resources=self.resources)
+            else:
+                self.renderer.load_chart(chart, job.illustration_path)
+            frame_count = self.renderer.get_frame_count(get_chart_duration(chart, self.tail))
+            result.load_seconds = time.perf_counter() - start
+
+            os.makedirs(os.path.dirname(os.path.abspath(result.output_path)), exist_ok=True)
+            start = time.perf_counter()
+            with self.open_sink(job, result.output_path) as sink:
+                result.frames = self.renderer.render(sink, frame_count)
+            result.render_seconds = time.perf_counter() - start
+            result.status = "ok"
+        except Exception as e:
+            result.status = "failed"
+            result.error = "".join(traceback.format_exception_only(type(e), e)).strip()
+            if self.renderer is not None:
+                self.renderer.renderer.unload_chart()
+        return result
+
+    def run(self, jobs: list[batch_job], report_path: str or None = None) -> list[batch_result]:
+        """
+        Renders jobs in order.\n
+        :param jobs: The jobs.
+        :param report_path: The report file, written after every job: CSV if it ends with ".csv", JSON otherwise.
+            None to write no report.
+        :return: The results of the jobs, in order.
+        """
+        self.results = []
+        for job in jobs:
+            self.results.append(self.render_job(job))
+            if report_path is not None:
+                self.export_report(report_path)
+        return self.results
+
+    def get_summary(self) -> dict:
+        succeeded = [result for result in self.results if result.status == "ok"]
+        frames = sum(result.frames for result in succeeded)
+        render_seconds = sum(result.render_seconds for result in succeeded)
+        return {"jobs": len(self.results), "succeeded": len(succeeded), "failed": len(self.results) - len(succeeded),
+                "frames": frames, "load_seconds": sum(result.load_seconds for result in self.results),
+                "render_seconds": render_seconds, "fps": frames / render_seconds if render_seconds > 0 else 0.0,
+                "resources": self.resources.to_dict()}
+
+    def export_report(self, path: str):
+        """Writes one row per job to a CSV file, or the summary and every job to a JSON file."""
+        rows = [result.to_dict() for result in self.results]
+        if path.lower().endswith(".csv"):
+            with open(path, "w", newline="") as file_stream:
+                writer = csv.DictWriter(file_stream, list(batch_result.__slots__) + ["fps"])
+                writer.writeheader()
+                writer.writerows(rows)
+        else:
+            with open(path, "w") as file_stream:
+                json.dump({"summary": self.get_summary(), "jobs": rows}, file_stream, indent=2)
+
+    def destroy(self):
+        if self.renderer is not None:
+            self.renderer.destroy()
+            self.renderer = None
+        self.resources.destroy()
+        self.loader.shutdown()
+        self.window.destroy()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.destroy()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Renders a queue of charts offline with one renderer.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--manifest", help="JSON list of {chart, music, illustration, output, name} entries")
+    source.add_argument("--scan", help="directory with one subdirectory of chart, music and illustration per job")
+    parser.add_argument("--output-dir", default=".", help="directory of outputs of jobs without an output path")
+    parser.add_argument("--report", default="batch_report.json", help="report file, .csv or .json")
+    parser.add_argument("--sink", choices=tuple(SINK_EXTENSIONS.keys()), default="y4m")
+    parser.add_argument("--pixel-format", choices=tuple(PIXEL_FORMATS.keys()), default="rgba",
+                        help="pixel format of raw and ffmpeg output; y4m always uses yuv420p")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--fps", type=int, default=60)
+    parser.add_argument("--skin", help="directory of note images named as global_resource.image_names, e.g. tap.png")
+    parser.add_argument("--hit-effect", default="", help="hit effect sprite sheet")
+    parser.add_argument("--cache-dir", help="directory to cache illustrations scaled to the frame size in")
+    parser.add_argument("--budget-mb", type=int, default=256, help="memory kept for released illustrations")
+    args = parser.parse_args()
+
+    jobs = load_manifest(args.manifest) if args.manifest is not None else scan_jobs(args.scan)
+    image_paths = find_skin_images(args.skin) if args.skin is not None else {}
+
+    init_headless()
+    options = render_options(args.width, args.height, args.fps)
+    with batch_renderer(options, args.output_dir, args.sink, args.pixel_format, image_paths, args.hit_effect,
+                        args.cache_dir, args.budget_mb << 20) as batch:
+        batch.run(jobs, args.report)
+        summary = batch.get_summary()
+    print("%d of %d jobs rendered, %d frames at %.1f fps." %
+          (summary["succeeded"], summary["jobs"], summary["frames"], summary["fps"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,4 @@
+"""
+Benchmarks of PyPhiAutoGen. Run the modules from the repository root, e.g. ``python -m benchmarks.bench_chart_loading``.
+
+"""
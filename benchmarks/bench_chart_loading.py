@@ -0,0 +1,67 @@
+"""
+Compares the chart loading paths: the former eval() based open_chart_string against the json backends, with text,
+bytes and stream input, and with compact loading.
+
+Usage: python -m benchmarks.bench_chart_loading [CHART_FILE ...] [--repeat N]
+
+Without chart files, a synthetic chart of the default size is generated.
+
+"""
+
+import argparse
+import io
+import time
+
+from benchmarks.chart_generator import generate_chart_json
+from chart import *
+
+
+def legacy_open_chart_string(json_string: str) -> phi_chart:
+    """The loading path before the json backends were introduced."""
+    return phi_chart(eval(json_string))
+
+
+def measure(func, repeat: int) -> float:
+    """Runs func repeat times and returns the best wall time in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def get_cases(json_bytes: bytes) -> list[tuple[str, object]]:
+    json_text = json_bytes.decode("utf-8")
+    cases = [("eval (legacy)", lambda: legacy_open_chart_string(json_text))]
+    for backend in get_json_backends():
+        cases += [
+            ("%s str" % backend, lambda b=backend: open_chart_string(json_text, backend=b)),
+            ("%s bytes" % backend, lambda b=backend: open_chart_string(json_bytes, backend=b)),
+            ("%s stream" % backend, lambda b=backend: open_chart_stream(io.BytesIO(json_bytes), backend=b)),
+            ("%s bytes compact" % backend, lambda b=backend: open_chart_string(json_bytes, True, b)),
+        ]
+    return cases
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks chart loading paths.")
+    parser.add_argument("charts", nargs="*", help="chart json files")
+    parser.add_argument("--repeat", type=int, default=5, help="repetitions per case; the best time is reported")
+    args = parser.parse_args()
+
+    inputs = [(path, None) for path in args.charts] or [("<synthetic formatVersion 3>", generate_chart_json())]
+    for path, json_bytes in inputs:
+        if json_bytes is None:
+            with open(path, "rb") as file_stream:
+                json_bytes = file_stream.read()
+        print("%s (%.1f KiB)" % (path, len(json_bytes) / 1024))
+        baseline = None
+        for name, func in get_cases(json_bytes):
+            elapsed = measure(func, args.repeat)
+            baseline = elapsed if baseline is None else baseline
+            print("  %-24s %9.2f ms  x%.2f" % (name, elapsed * 1e3, baseline / elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Measures the per-call cost of the ctypes draw wrappers in sdl_render, sdl_line and sdl_transparent_cover, against
+their former implementations which allocated new ctypes objects on every call.
+
+Usage: python -m benchmarks.bench_draw_calls [--calls N] [--repeat N]
+
+The window is tiny and uses the software renderer, so the timings are dominated by the Python to C call overhead
+rather than by pixel work. set_draw_color alternates between two colors, so both sides make the SDL call; the
+set_draw_color(same) case sets one color again and again, which sdl_renderer skips by caching the color.
+
+"""
+
+import argparse
+import os
+import time
+
+# must be set before SDL is loaded.
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+from sdl2 import SDL_Init, SDL_Quit, SDL_INIT_VIDEO
+
+from sdl_render import *
+from sdl_line import sdl_line
+from sdl_transparent_cover import sdl_transparent_cover
+
+
+def legacy_set_draw_color(renderer: sdl_renderer, r: int, g: int, b: int, a: int):
+    SDL_SetRenderDrawColor(renderer.handle, c_uint8(r), c_uint8(g), c_uint8(b), c_uint8(a))
+
+
+def legacy_get_draw_color(renderer: sdl_renderer) -> tuple[int, int, int, int]:
+    r = c_uint8(0)
+    g = c_uint8(0)
+    b = c_uint8(0)
+    a = c_uint8(0)
+    SDL_GetRenderDrawColor(renderer.handle, byref(r), byref(g), byref(b), byref(a))
+    return r.value, g.value, b.value, a.value
+
+
+def legacy_fill(renderer: sdl_renderer):
+    SDL_RenderFillRect(renderer.handle, POINTER(SDL_Rect)())
+
+
+def legacy_draw_cover(cover: sdl_transparent_cover):
+    raw_col = legacy_get_draw_color(cover.parent)
+    legacy_set_draw_color(cover.parent, cover.r, cover.g, cover.b, cover.a)
+    legacy_fill(cover.parent)
+    legacy_set_draw_color(cover.parent, *raw_col)
+
+
+def legacy_draw_line(line: sdl_line, x_center: int, y_center: int, rotation: float):
+    dst = SDL_Rect(x_center - line.w // 2, y_center - line.h // 2, line.w, line.h)
+    SDL_RenderCopyEx(line.parent.handle, line.tex.handle, POINTER(SDL_Rect)(), byref(dst), c_double(rotation),
+                     SDL_Point(line.w // 2, line.h // 2), SDL_RendererFlip(0))
+
+
+def measure(func, calls: int, repeat: int) -> float:
+    """Calls func calls times, repeat times, and returns the best time per call in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for i in range(calls):
+            func(i)
+        best = min(best, time.perf_counter() - start)
+    return best / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the per-call cost of the SDL draw wrappers.")
+    parser.add_argument("--calls", type=int, default=20000, help="calls per repetition")
+    parser.add_argument("--repeat", type=int, default=5, help="repetitions per case; the best time is reported")
+    args = parser.parse_args()
+
+    SDL_Init(SDL_INIT_VIDEO)
+    try:
+        window = sdl_window("bench", 16, 16, hidden=True, software=True)
+        renderer = window.renderer
+        line = sdl_line(renderer, 8, 2)
+        cover = sdl_transparent_cover(renderer, (0, 0, 0, 0x6F))
+        cases = [
+            ("set_draw_color", lambda i: legacy_set_draw_color(renderer, 0, 0, 0, 255 - (i & 1)),
+             lambda i: renderer.set_draw_color(0, 0, 0, 255 - (i & 1))),
+            ("set_draw_color(same)", lambda i: legacy_set_draw_color(renderer, 0, 0, 0, 255),
+             lambda i: renderer.set_draw_color(0, 0, 0, 255)),
+            ("fill", lambda i: legacy_fill(renderer), lambda i: renderer.fill()),
+            ("draw_cover", lambda i: legacy_draw_cover(cover), lambda i: cover.draw_cover()),
+            ("sdl_line.draw", lambda i: legacy_draw_line(line, 8, 8, i * 0.5),
+             lambda i: line.draw(8, 8, i * 0.5)),
+        ]
+        print("%-20s %12s %12s" % ("case", "legacy (us)", "now (us)"))
+        for name, legacy, current in cases:
+            before = measure(legacy, args.calls, args.repeat)
+            after = measure(current, args.calls, args.repeat)
+            print("%-20s %12.3f %12.3f  x%.2f" % (name, before * 1e6, after * 1e6, before / after))
+        line.destroy()
+        window.destroy()
+    finally:
+        SDL_Quit()
+
+
+if __name__ == "__main__":
+    main()
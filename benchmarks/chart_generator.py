@@ -0,0 +1,125 @@
+"""
+Generates synthetic Phigros charts of configurable size, in the formatVersion 1 and 3 layouts that chart.py accepts.
+
+"""
+
+import json
+import random
+
+__all__ = ["chart_size", "generate_chart", "generate_chart_json", "write_chart"]
+
+
+class chart_size:
+    """Represents the size settings of a synthetic chart. Event counts are per judge line."""
+    __slots__ = ("lines", "notes_per_line", "speed_events", "move_events", "rotate_events", "disappear_events",
+                 "duration", "bpm")
+
+    def __init__(self, lines: int = 30, notes_per_line: int = 100, speed_events: int = 100, move_events: int = 100,
+                 rotate_events: int = 100, disappear_events: int = 20, duration: float = 180.0, bpm: float = 150.0):
+        self.lines = lines
+        self.notes_per_line = notes_per_line
+        self.speed_events = speed_events
+        self.move_events = move_events
+        self.rotate_events = rotate_events
+        self.disappear_events = disappear_events
+        self.duration = duration
+        self.bpm = bpm
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def _split_ticks(rng: random.Random, total: int, count: int) -> list[tuple[int, int]]:
+    """Splits [0, total) into count contiguous (start, end) tick ranges. The last range is open-ended."""
+    count = max(1, min(count, total))
+    cuts = sorted(rng.sample(range(1, total), count - 1)) if count > 1 else []
+    bounds = [0] + cuts + [total]
+    ranges = [(bounds[i], bounds[i + 1]) for i in range(count)]
+    ranges[-1] = (ranges[-1][0], 1e9)  # the last event lasts until the end of the song, like real charts.
+    return ranges
+
+
+def _generate_line(rng: random.Random, version: int, size: chart_size) -> dict:
+    bpm = size.bpm
+    total_ticks = max(2, int(size.duration * bpm / 1.875))
+
+    speed_events = []
+    floor_pos = 0.0
+    for start_tm, end_tm in _split_ticks(rng, total_ticks, size.speed_events):
+        value = rng.uniform(0.5, 2.5)
+        ev = {"startTime": start_tm, "endTime": end_tm, "value": value}
+        if version == 3:
+            ev["floorPosition"] = floor_pos
+        speed_events.append(ev)
+        floor_pos += (min(end_tm, total_ticks) - start_tm) * value * 1.875 / bpm
+
+    def get_floor_position(tick: int) -> float:
+        y = 0.0
+        for e in speed_events:
+            if tick < e["endTime"]:
+                return y + (tick - e["startTime"]) * e["value"] * 1.875 / bpm
+            y += (e["endTime"] - e["startTime"]) * e["value"] * 1.875 / bpm
+        return y
+
+    move_events = []
+    for start_tm, end_tm in _split_ticks(rng, total_ticks, size.move_events):
+        x1, x2, y1, y2 = rng.uniform(0.1, 0.9), rng.uniform(0.1, 0.9), rng.uniform(0.1, 0.9), rng.uniform(0.1, 0.9)
+        if version == 3:
+            move_events.append({"startTime": start_tm, "endTime": end_tm,
+                                "start": x1, "end": x2, "start2": y1, "end2": y2})
+        else:
+            # format 1 packs x (in 1/880) and y (in 1/520) into one number.
+            move_events.append({"startTime": start_tm, "endTime": end_tm,
+                                "start": int(x1 * 880) * 1000 + int(y1 * 520),
+                                "end": int(x2 * 880) * 1000 + int(y2 * 520)})
+
+    rotate_events = [{"startTime": start_tm, "endTime": end_tm,
+                      "start": rng.uniform(-180, 180), "end": rng.uniform(-180, 180)}
+                     for start_tm, end_tm in _split_ticks(rng, total_ticks, size.rotate_events)]
+    disappear_events = [{"startTime": start_tm, "endTime": end_tm,
+                         "start": rng.choice((0.0, 1.0, rng.random())), "end": rng.choice((0.0, 1.0, rng.random()))}
+                        for start_tm, end_tm in _split_ticks(rng, total_ticks, size.disappear_events)]
+
+    notes = {"notesAbove": [], "notesBelow": []}
+    for _ in range(size.notes_per_line):
+        tick = rng.randrange(total_ticks)
+        note_type = rng.choice((1, 1, 2, 3, 4))
+        notes[rng.choice(("notesAbove", "notesAbove", "notesBelow"))].append({
+            "type": note_type,
+            "time": tick,
+            "positionX": rng.uniform(-8, 8),
+            "holdTime": rng.randint(8, 64) if note_type == 3 else 0,
+            "speed": 1.0 if note_type != 3 else rng.uniform(0.8, 1.5),
+            "floorPosition": get_floor_position(tick)
+        })
+
+    return {"bpm": bpm, "notesAbove": notes["notesAbove"], "notesBelow": notes["notesBelow"],
+            "speedEvents": speed_events, "judgeLineMoveEvents": move_events,
+            "judgeLineRotateEvents": rotate_events, "judgeLineDisappearEvents": disappear_events}
+
+
+def generate_chart(version: int = 3, size: chart_size or None = None, seed: int = 0) -> dict:
+    """
+    Generates a synthetic chart.\n
+    :param version: The chart format version, 1 or 3.
+    :param size: The size settings. None for the default size.
+    :param seed: The random seed. The same seed and settings always produce the same chart.
+    :return: The chart dictionary, as json.load() would return it.
+    """
+    if version not in (1, 3):
+        raise ValueError("Only formatVersion 1 and 3 are supported.")
+    size = chart_size() if size is None else size
+    rng = random.Random(seed)
+    lines = [_generate_line(rng, version, size) for _ in range(size.lines)]
+    return {"formatVersion": version, "offset": 0.0,
+            "numOfNotes": sum(len(line["notesAbove"]) + len(line["notesBelow"]) for line in lines),
+            "judgeLineList": lines}
+
+
+def generate_chart_json(version: int = 3, size: chart_size or None = None, seed: int = 0) -> bytes:
+    return json.dumps(generate_chart(version, size, seed)).encode("utf-8")
+
+
+def write_chart(path: str, version: int = 3, size: chart_size or None = None, seed: int = 0):
+    with open(path, "wb") as file_stream:
+        file_stream.write(generate_chart_json(version, size, seed))
@@ -0,0 +1,160 @@
+"""
+Runs the benchmark suite on synthetic charts and writes machine-readable results.
+
+Usage: python -m benchmarks.run [--versions 1 3] [--lines N] [--notes N] [--events N] [--frames N] [--output FILE]
+
+The rendering benchmarks use the SDL dummy video driver and the software renderer, so no display is required.
+
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+# must be set before SDL is loaded.
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("SDL_RENDER_DRIVER", "software")
+
+from benchmarks.chart_generator import *
+
+RESULT_FORMAT_VERSION = 1
+
+
+class benchmark_result:
+    """Represents the result of one benchmark case."""
+    __slots__ = ("name", "chart_version", "seconds", "count", "unit")
+
+    def __init__(self, name: str, chart_version: int, seconds: float, count: int, unit: str):
+        self.name = name
+        self.chart_version = chart_version
+        self.seconds = seconds
+        self.count = count
+        self.unit = unit
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "chart_version": self.chart_version, "seconds": self.seconds,
+                "count": self.count, "unit": self.unit,
+                "microseconds_per_unit": self.seconds / self.count * 1e6 if self.count > 0 else None}
+
+
+def best_of(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_loading(json_data: bytes, version: int, repeat: int) -> list[benchmark_result]:
+    from chart import phi_chart, parse_chart_json, open_chart_string
+    content = parse_chart_json(json_data)
+    return [
+        benchmark_result("open_chart_string", version,
+                         best_of(lambda: open_chart_string(json_data), repeat), 1, "chart"),
+        benchmark_result("phi_chart", version, best_of(lambda: phi_chart(content), repeat), 1, "chart"),
+    ]
+
+
+def bench_rendering(json_data: bytes, version: int, frames: int, width: int, height: int) -> list[benchmark_result]:
+    from sdl2 import SDL_Init, SDL_Quit, SDL_INIT_VIDEO
+    from chart import open_chart_string
+    from chart_renderer import chart_renderer, judge_line_renderer, render_options
+    from pipelined_render import frame_pipeline
+
+    SDL_Init(SDL_INIT_VIDEO)
+    try:
+        chart = open_chart_string(json_data)
+        options = render_options(width, height)
+        renderer = chart_renderer(chart, options)
+
+        line_renderers = [judge_line_renderer(line, renderer.window, options) for line in chart.lines]
+        start = time.perf_counter()
+        for _ in range(frames):
+            for line_renderer in line_renderers:
+                line_renderer.advance_frame()
+        advance_seconds = time.perf_counter() - start
+        for line_renderer in line_renderers:
+            line_renderer.draw_line.destroy()
+
+        start = time.perf_counter()
+        for _ in range(frames):
+            renderer.render_frame()
+            renderer.window.renderer.present()
+        render_seconds = time.perf_counter() - start
+
+        # the same frames, with the state computed ahead by a producer thread.
+        with frame_pipeline(renderer, mode="thread") as pipeline:
+            start = time.perf_counter()
+            pipeline.start(0, frames)
+            while pipeline.render_frame():
+                renderer.window.renderer.present()
+            pipelined_seconds = time.perf_counter() - start
+        renderer.window.destroy()
+    finally:
+        SDL_Quit()
+
+    return [
+        benchmark_result("judge_line_renderer.advance_frame", version, advance_seconds, frames, "frame"),
+        benchmark_result("chart_renderer.render_frame", version, render_seconds, frames, "frame"),
+        benchmark_result("frame_pipeline.render_frame", version, pipelined_seconds, frames, "frame"),
+    ]
+
+
+def get_environment() -> dict:
+    env = {"python": sys.version, "implementation": platform.python_implementation(),
+           "platform": platform.platform(), "time": time.strftime("%Y-%m-%dT%H:%M:%S%z")}
+    try:
+        import sdl2
+        version = sdl2.SDL_version()
+        sdl2.SDL_GetVersion(version)
+        env["sdl"] = "%d.%d.%d" % (version.major, version.minor, version.patch)
+    except ImportError:
+        env["sdl"] = None
+    return env
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the PyPhiAutoGen benchmark suite.")
+    parser.add_argument("--versions", type=int, nargs="+", default=[1, 3], help="chart format versions")
+    parser.add_argument("--lines", type=int, default=30)
+    parser.add_argument("--notes", type=int, default=100, help="notes per line")
+    parser.add_argument("--events", type=int, default=100, help="speed, move and rotate events per line")
+    parser.add_argument("--disappear-events", type=int, default=20, help="disappear events per line")
+    parser.add_argument("--duration", type=float, default=180.0, help="song duration in seconds")
+    parser.add_argument("--frames", type=int, default=600, help="frames to render")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--repeat", type=int, default=3, help="repetitions of the loading cases")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-render", action="store_true", help="skip the benchmarks which require SDL")
+    parser.add_argument("--output", help="write the results as json to this file instead of stdout")
+    args = parser.parse_args()
+
+    size = chart_size(args.lines, args.notes, args.events, args.events, args.events, args.disappear_events,
+                      args.duration)
+    results: list[benchmark_result] = []
+    for version in args.versions:
+        json_data = generate_chart_json(version, size, args.seed)
+        results += bench_loading(json_data, version, args.repeat)
+        if not args.no_render:
+            results += bench_rendering(json_data, version, args.frames, args.width, args.height)
+
+    report = {"format": RESULT_FORMAT_VERSION, "environment": get_environment(),
+              "config": dict(size.to_dict(), frames=args.frames, width=args.width, height=args.height,
+                             seed=args.seed),
+              "results": [r.to_dict() for r in results]}
+    text = json.dumps(report, indent=2)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, "w") as file_stream:
+            file_stream.write(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,14 @@ This module provides several types and functions to access Phigros chart.
 import json
 import copy
 
+try:
+    import orjson
+except ImportError:  # orjson is an optional, faster json backend.
+    orjson = None
+
+from event_index import phi_line_timeline
+from event_table import phi_line_tables, tables_available
+
 NOTE_TYPE_TAP = 1
 NOTE_TYPE_DRAG = 2
 NOTE_TYPE_HOLD = 3
@@ -17,7 +25,7 @@ NOTE_DIRECTION_REVERSED = 1
 __all__ = ["NOTE_TYPE_TAP", "NOTE_TYPE_FLICK", "NOTE_TYPE_HOLD", "NOTE_TYPE_DRAG",
            "phi_speed_event", "phi_move_event", "phi_note", "phi_chart", "phi_event_base",
            "phi_judge_line", "phi_rotate_event", "phi_ver3_event_base", "phi_disappear_event",
-           "open_chart_file", "open_chart_string"]
+           "open_chart_file", "open_chart_string", "open_chart_stream", "parse_chart_json", "get_json_backends"]
 
 
 class phi_speed_event:
@@ -37,6 +45,9 @@ class phi_speed_event:
     def get_value_unchecked(self, real_time: float) -> float:
         return (real_time - self.real_start_time) * self.value + self.floor_position
 
+    def get_end_value(self) -> float:
+        return (self.real_end_time - self.real_start_time) * self.value + self.floor_position
+
 
 class phi_event_base:
     """Represents a basic Phigros event."""
@@ -63,6 +74,10 @@ class phi_event_base:
         t1 = 1 - t2
         return self.start * t1 + self.end * t2
 
+    def get_end_value(self) -> float:
+        """Gets the value this event ends with. Unlike get_value_unchecked, it works for zero-length events."""
+        return self.end
+
 
 class phi_ver3_event_base(phi_event_base):
     """Represents a Phigros event with new format."""
@@ -79,6 +94,9 @@ class phi_ver3_event_base(phi_event_base):
         t1 = 1 - t2
         return self.start * t1 + self.end * t2, 1 - self.start2 * t1 - self.end2 * t2
 
+    def get_end_value(self) -> tuple[float, float]:
+        return self.end, 1 - self.end2
+
 
 class phi_move_event(phi_ver3_event_base):
     """
@@ -318,56 +336,248 @@ def get_notes(line_content: dict[str, list], list_name: str, bpm: float):
     return note_list
 
 
+# the fields of the records made by _compact_object(), in order. Objects with these keys, in any order, are parsed into
+# tuples of their values instead of dictionaries when a chart is opened compact.
+_SPEED_RECORD_FIELDS = ("startTime", "endTime", "value", "floorPosition")
+_SPEED_RECORD_FIELDS_NO_FLOOR = ("startTime", "endTime", "value")
+_EVENT_RECORD_FIELDS = ("startTime", "endTime", "start", "end", "start2", "end2")
+_VER1_EVENT_RECORD_FIELDS = ("startTime", "endTime", "start", "end")
+_NOTE_RECORD_FIELDS = ("type", "time", "positionX", "holdTime", "speed", "floorPosition")
+
+_RECORD_LAYOUTS = (_EVENT_RECORD_FIELDS, _NOTE_RECORD_FIELDS, _SPEED_RECORD_FIELDS, _VER1_EVENT_RECORD_FIELDS,
+                   _SPEED_RECORD_FIELDS_NO_FLOOR)
+_RECORD_KEYS = frozenset(_RECORD_LAYOUTS)
+
+
+def _compact_object(pairs: list[tuple]):
+    """The object_pairs_hook of compact parsing, which turns events and notes into tuples, see _RECORD_LAYOUTS."""
+    if not pairs:
+        return {}
+    keys, values = zip(*pairs)
+    if keys in _RECORD_KEYS:  # the order charts are written in.
+        return values
+    fields = dict(pairs)
+    for layout in _RECORD_LAYOUTS:
+        if all(name in fields for name in layout):
+            return tuple([fields[name] for name in layout])
+    return fields
+
+
+def get_speed_events_from_records(records: list[tuple], chart_ver: int, bpm: float):
+    """Extracts speed events from the records of compact parsing, as get_speed_events_from_dict()."""
+    ret = list[phi_speed_event]()
+    y = 0.0
+
+    for record in records:
+        start_tm = max(record[0], 0)
+        end_tm = record[1]
+        value = record[2]
+
+        if len(record) > 3:
+            floor_pos = record[3]
+        else:
+            floor_pos = y
+            y += (end_tm - start_tm) * value * 1.875 / bpm
+        ret.append(phi_speed_event(start_tm, end_tm, floor_pos, value, bpm))
+
+    if chart_ver != 3:
+        ret = rearrange_speed_events(ret, bpm)
+
+    return ret
+
+
+def get_movement_events_from_records(records: list[tuple], chart_ver: int, bpm: float):
+    """Extracts movement events from the records of compact parsing, as get_movement_events()."""
+    ret = list[phi_move_event]()
+
+    if chart_ver != 3:
+        for record in records:
+            start = record[2]
+            end = record[3]
+            ret.append(phi_move_event(start / 1e3 / 880, end / 1e3 / 880, start % 1e3 / 520, end % 1e3 / 520,
+                                      record[0], record[1], bpm))
+        return rearrange_move_events(ret, bpm)
+
+    for start_tm, end_tm, start, end, start2, end2 in records:
+        ret.append(phi_move_event(start, end, start2, end2, start_tm, end_tm, bpm))
+    return ret
+
+
+def get_typed_ver1_events_from_records(records: list[tuple], ev_type: type, bpm: float):
+    """Extracts events of old format from the records of compact parsing, as get_typed_ver1_events()."""
+    ret = list[ev_type]()
+
+    for record in records:
+        ret.append(ev_type(record[2], record[3], record[0], record[1], bpm))
+
+    return rearrange_ver1_events(ret, ev_type, bpm)
+
+
+def get_notes_from_records(records: list[tuple], direction: int, bpm: float):
+    """Extracts notes from the records of compact parsing, as get_notes()."""
+    note_list: list[phi_note] = []
+
+    for ty, tm, pos_x, hold_tm, speed, floor_pos in records:
+        note_list.append(phi_note(tm, ty, floor_pos, speed, pos_x, hold_tm, bpm, direction))
+    note_list.sort(key=lambda x: x.time, reverse=False)
+    return note_list
+
+
 class phi_judge_line:
     """Represents a judge line structure."""
     __slots__ = ("content", "speed_events", "move_events", "rotate_events", "disappear_events", "notes_above",
                  "notes_below", "num_notes_above", "num_notes_below", "num_notes", "chart_version",
-                 "offset", "index", "bpm")
+                 "offset", "index", "bpm", "tables", "timeline", "deferred_events")
 
-    def __init__(self, content: dict, index: int, chart_ver: int):
+    def __init__(self, content: dict, index: int, chart_ver: int, build_tables: bool = True,
+                 keep_content: bool = True):
         """
         Initializes a new judge line structure.\n
         :param content: The dict extracted from the json chart, containing judge line information.
         :param index: The index to this judge line, which determines the render order.
         :param chart_ver: Chart version.
+        :param build_tables: Whether to build the columnar event tables. Ignored if NumPy is not installed.
+        :param keep_content: Whether to keep the dict in the content field. If false, the field is None.
         """
+        bpm: float = content["bpm"]
+        self.assign(content if keep_content else None, index, chart_ver, bpm,
+                    get_speed_events_from_dict(content, chart_ver),
+                    get_movement_events(content["judgeLineMoveEvents"], chart_ver, bpm),
+                    get_typed_ver1_events(content["judgeLineRotateEvents"], phi_rotate_event, bpm),
+                    get_typed_ver1_events(content["judgeLineDisappearEvents"], phi_disappear_event, bpm),
+                    get_notes(content, "notesAbove", bpm),
+                    get_notes(content, "notesBelow", bpm),
+                    build_tables)
+
+    def assign(self, content: dict or None, index: int, chart_ver: int, bpm: float,
+               speed_events: list[phi_speed_event], move_events: list[phi_move_event],
+               rotate_events: list[phi_rotate_event], disappear_events: list[phi_disappear_event],
+               notes_above: list[phi_note], notes_below: list[phi_note], build_tables: bool = True):
+        """Assigns every field with resolved events and notes, and builds the indices on them."""
+        self.deferred_events = None
         self.content = content
         self.index: int = index
         self.chart_version = chart_ver
-        self.bpm: float = content["bpm"]
-        self.speed_events = get_speed_events_from_dict(content, chart_ver)
-        self.rotate_events: list[phi_rotate_event] = get_typed_ver1_events(
-            content["judgeLineRotateEvents"], phi_rotate_event, self.bpm
-        )
-        self.disappear_events: list[phi_disappear_event] = get_typed_ver1_events(
-            content["judgeLineDisappearEvents"], phi_disappear_event, self.bpm
-        )
-        self.move_events = get_movement_events(content["judgeLineMoveEvents"], chart_ver, self.bpm)
-        self.notes_above: list[phi_note] = get_notes(content, "notesAbove", self.bpm)
-        self.notes_below: list[phi_note] = get_notes(content, "notesBelow", self.bpm)
+        self.bpm: float = bpm
+        self.speed_events = speed_events
+        self.move_events = move_events
+        self.rotate_events = rotate_events
+        self.disappear_events = disappear_events
+        self.notes_above = notes_above
+        self.notes_below = notes_below
         self.num_notes_above: int = len(self.notes_above)
         self.num_notes_below: int = len(self.notes_below)
         self.num_notes: int = self.num_notes_above + self.num_notes_below
+        self.timeline: phi_line_timeline = phi_line_timeline.from_judge_line(self)
+        self.tables: phi_line_tables or None = \
+            phi_line_tables.from_judge_line(self) if build_tables and tables_available else None
+
+    @classmethod
+    def from_events(cls, index: int, chart_ver: int, bpm: float,
+                    speed_events: list[phi_speed_event], move_events: list[phi_move_event],
+                    rotate_events: list[phi_rotate_event], disappear_events: list[phi_disappear_event],
+                    notes_above: list[phi_note], notes_below: list[phi_note], build_tables: bool = True):
+        """
+        Initializes a new judge line with events and notes which are already resolved and rearranged.\n
+        The content field of the returned line is None.
+        """
+        line = cls.__new__(cls)
+        line.assign(None, index, chart_ver, bpm, speed_events, move_events, rotate_events, disappear_events,
+                    notes_above, notes_below, build_tables)
+        return line
+
+    @classmethod
+    def from_records(cls, content: dict, index: int, chart_ver: int, build_tables: bool = True):
+        """
+        Initializes a new judge line from a line dictionary of compact parsing, whose events and notes are tuples,
+        see parse_chart_json(). The content field of the returned line is None.
+        """
+        bpm: float = content["bpm"]
+        return cls.from_events(index, chart_ver, bpm,
+                               get_speed_events_from_records(content["speedEvents"], chart_ver, bpm),
+                               get_movement_events_from_records(content["judgeLineMoveEvents"], chart_ver, bpm),
+                               get_typed_ver1_events_from_records(content["judgeLineRotateEvents"], phi_rotate_event,
+                                                                  bpm),
+                               get_typed_ver1_events_from_records(content["judgeLineDisappearEvents"],
+                                                                  phi_disappear_event, bpm),
+                               get_notes_from_records(content["notesAbove"], NOTE_DIRECTION_NORMAL, bpm),
+                               get_notes_from_records(content["notesBelow"], NOTE_DIRECTION_REVERSED, bpm),
+                               build_tables)
+
+    @classmethod
+    def from_deferred_events(cls, index: int, chart_ver: int, bpm: float, build_events,
+                             notes_above: list[phi_note], notes_below: list[phi_note],
+                             tables: phi_line_tables or None = None):
+        """
+        Initializes a new judge line whose events are built later, e.g. from the records of a compiled chart. The
+        event lists and the timeline are None until ensure_events() builds them.\n
+        The content field of the returned line is None.\n
+        :param index: The index to this judge line, which determines the render order.
+        :param chart_ver: Chart version.
+        :param bpm: The bpm of the line.
+        :param build_events: A function returning the resolved and rearranged speed, move, rotate and disappear event
+            lists.
+        :param notes_above: The notes above the line.
+        :param notes_below: The notes below the line.
+        :param tables: The columnar event tables, which must match the events. None for no table.
+        :return: The judge line.
+        """
+        line = cls.__new__(cls)
+        line.content = None
+        line.index = index
+        line.chart_version = chart_ver
+        line.bpm = bpm
+        line.notes_above = notes_above
+        line.notes_below = notes_below
+        line.num_notes_above = len(notes_above)
+        line.num_notes_below = len(notes_below)
+        line.num_notes = line.num_notes_above + line.num_notes_below
+        line.tables = tables
+        line.speed_events = line.move_events = line.rotate_events = line.disappear_events = None
+        line.timeline = None
+        line.deferred_events = build_events
+        return line
+
+    def ensure_events(self):
+        """Builds the event lists and the timeline of a line from from_deferred_events(), unless they are built."""
+        build_events = self.deferred_events
+        if build_events is None:
+            return
+        speed_events, move_events, rotate_events, disappear_events = build_events()
+        self.speed_events = speed_events
+        self.move_events = move_events
+        self.rotate_events = rotate_events
+        self.disappear_events = disappear_events
+        self.timeline = phi_line_timeline.from_judge_line(self)
+        self.deferred_events = None
 
 
 class phi_chart:
     """Represents a chart structure."""
     __slots__ = ("content", "version", "offset", "numOfNotes", "lines", "notes")
 
-    def __init__(self, content: dict):
+    def __init__(self, content: dict, keep_content: bool = True):
         """
         Initializes a new chart object with specified dictionary extracted from json.
         :param content: The dictionary containing chart data.
+        :param keep_content: Whether to keep the dictionaries in the content fields of the chart and its lines. If
+            false, only the compact event and note structures are kept, and the dictionaries can be freed.
         """
-        self.content: dict = content
-        self.version: int = content["formatVersion"]
-        self.offset: float = content["offset"]
-        self.numOfNotes: int = 0
-        self.lines: list[phi_judge_line] = []  # Use [] to initialize; BUILD_LIST code is faster.
+        version: int = content["formatVersion"]
+        lines: list[phi_judge_line] = []  # Use [] to initialize; BUILD_LIST code is faster.
         line_id = 0
         for data in content["judgeLineList"]:
-            self.lines.append(phi_judge_line(data, line_id, self.version))
+            lines.append(phi_judge_line(data, line_id, version, keep_content=keep_content))
             line_id += 1
+        self.assign(content if keep_content else None, version, content["offset"], lines)
+
+    def assign(self, content: dict or None, version: int, offset: float, lines: list[phi_judge_line]):
+        """Assigns every field with built judge lines, and merges their notes into the global note list."""
+        self.content = content
+        self.version: int = version
+        self.offset: float = offset
+        self.numOfNotes: int = 0
+        self.lines: list[phi_judge_line] = lines
         self.notes: list[phi_note] = []
         for line in self.lines:
             self.notes += line.notes_above
@@ -392,14 +602,106 @@ class phi_chart:
                     # for python always passes object reference.
                     n.multi_highlight = True
 
+    @classmethod
+    def from_lines(cls, version: int, offset: float, lines: list[phi_judge_line]):
+        """
+        Initializes a new chart with judge lines which are already built. The content field of the returned chart is
+        None.
+        """
+        chart = cls.__new__(cls)
+        chart.assign(None, version, offset, lines)
+        return chart
+
+    @classmethod
+    def from_compact_content(cls, content: dict, records: bool = False):
+        """
+        Initializes a new chart without keeping its dictionaries. Every line dictionary is dropped from content as soon
+        as its line is built, so they are not all alive next to the built lines. The content is left with no line.\n
+        :param content: The dictionary containing chart data.
+        :param records: Whether the events and notes are the tuples of compact parsing, see parse_chart_json().
+        :return: The chart.
+        """
+        version: int = content["formatVersion"]
+        line_list: list = content["judgeLineList"]
+        lines: list[phi_judge_line] = []
+        for line_id in range(len(line_list)):
+            data = line_list[line_id]
+            line_list[line_id] = None
+            lines.append(phi_judge_line.from_records(data, line_id, version) if records
+                         else phi_judge_line(data, line_id, version, keep_content=False))
+        return cls.from_lines(version, content["offset"], lines)
+
+    def ensure_events(self):
+        """Builds the events of every judge line, see phi_judge_line.ensure_events()."""
+        for line in self.lines:
+            line.ensure_events()
+
+
+def get_json_backends() -> list[str]:
+    """Gets the names of available json backends, the fastest first."""
+    return ["json"] if orjson is None else ["orjson", "json"]
 
-def open_chart_file(file_name: str) -> phi_chart:
-    """Opens a chart file, initializes a new chart instance with the file content and returns the chart object."""
-    with open(file_name) as file_stream:
-        json_data = json.load(file_stream)
-    return phi_chart(json_data)
+
+def parse_chart_json(json_data: str or bytes or bytearray or memoryview, backend: str or None = None,
+                     records: bool = False) -> dict:
+    """
+    Parses json text of a chart. The text is never evaluated as Python code.\n
+    :param json_data: The json text. Bytes are parsed directly, without decoding them to a string first.
+    :param backend: "json" or "orjson". None to use the fastest one installed.
+    :param records: Whether to parse events and notes into tuples of their values instead of dictionaries, which
+        take about a third less memory, see phi_judge_line.from_records(). Only the json backend supports it, at
+        the cost of a slower parse.
+    :return: The dictionary containing chart data.
+    """
+    if backend is None:
+        backend = get_json_backends()[0]
+    if backend == "orjson":
+        if orjson is None:
+            raise ValueError("The orjson backend is not installed.")
+        if records:
+            raise ValueError("The orjson backend cannot parse records.")
+        return orjson.loads(json_data)
+    if backend == "json":
+        if isinstance(json_data, memoryview):
+            json_data = json_data.tobytes()
+        return json.loads(json_data, object_pairs_hook=_compact_object) if records else json.loads(json_data)
+    raise ValueError("Unknown json backend: %s" % backend)
+
+
+def _load_chart(json_data: str or bytes or bytearray or memoryview, compact: bool, backend: str or None) -> phi_chart:
+    if not compact:
+        return phi_chart(parse_chart_json(json_data, backend))
+    if backend is None:
+        backend = get_json_backends()[0]
+    # json parses compact charts straight into records; orjson has no hook, but its dictionaries are freed per line.
+    records = backend == "json"
+    return phi_chart.from_compact_content(parse_chart_json(json_data, backend, records), records)
+
+
+def open_chart_file(file_name: str, compact: bool = False, backend: str or None = None) -> phi_chart:
+    """
+    Opens a chart file, initializes a new chart instance with the file content and returns the chart object.\n
+    :param file_name: The path to the chart file.
+    :param compact: If true, no json dictionary is kept in the content fields. The json backend parses events and
+        notes into tuples instead of dictionaries, see parse_chart_json().
+    :param backend: The json backend. See parse_chart_json().
+    """
+    with open(file_name, "rb") as file_stream:
+        json_data = file_stream.read()
+    return _load_chart(json_data, compact, backend)
 
 
-def open_chart_string(json_string: str) -> phi_chart:
+def open_chart_string(json_string: str or bytes or bytearray or memoryview, compact: bool = False,
+                      backend: str or None = None) -> phi_chart:
     """Converts the json string to a dictionary, and returns a new chart instance with it."""
-    return phi_chart(eval(json_string))
+    return _load_chart(json_string, compact, backend)
+
+
+def open_chart_stream(stream, compact: bool = False, backend: str or None = None) -> phi_chart:
+    """
+    Reads json text from a file-like object, and returns a new chart instance with it.\n
+    :param stream: A binary or text stream. It is read once, and binary data is parsed without decoding.
+    :param compact: If true, no json dictionary is kept in the content fields, see open_chart_file().
+    :param backend: The json backend. See parse_chart_json().
+    """
+    return _load_chart(stream.read(), compact, backend)
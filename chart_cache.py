@@ -0,0 +1,333 @@
+"""
+This module provides a compiled binary form of Phigros charts, and a cache directory which stores compiled charts
+keyed by the hash of their source json.
+
+A compiled chart holds the resolved and rearranged events and notes of every judge line as flat float64 records, so
+loading it skips json parsing and event rearrangement. Compiled files are memory-mapped when loaded. With NumPy, the
+records stay in the map: the columnar event tables are views over it, so the file stays mapped as long as the chart
+lives, and the event objects are only built when a line is rendered (see phi_judge_line.ensure_events()). Without
+NumPy, the records are copied out of the map.
+
+File layout (little endian):
+    header      magic, format version, sha256 of the source json, source size, chart offset, chart version,
+                number of judge lines
+    line table  for every judge line: bpm and the number of speed, move, rotate, disappear events,
+                notes above and notes below
+    data        float64 records of every judge line, in the order of the line table
+
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; without it, records are loaded into an array and no table is built.
+    np = None
+
+from chart import *
+from chart import NOTE_DIRECTION_NORMAL, NOTE_DIRECTION_REVERSED
+from event_table import phi_event_table, phi_line_tables, tables_available
+
+__all__ = ["CACHE_FORMAT_VERSION", "compile_chart", "write_compiled_chart", "read_compiled_chart", "chart_cache",
+           "get_line_counts", "get_line_records", "build_line_from_records"]
+
+CACHE_FORMAT_VERSION = 1
+CACHE_FILE_SUFFIX = ".phic"
+
+_MAGIC = b"PHIC"
+_HEADER = struct.Struct("<4sI32sqdiI")
+_LINE_ENTRY = struct.Struct("<d6I")
+_DATA_ALIGNMENT = 8
+
+# number of float64 fields in a record of each kind.
+_SPEED_FIELDS = 4  # start time, end time, floor position, value
+_MOVE_FIELDS = 6  # start, end, start2, end2, start time, end time
+_EVENT_FIELDS = 4  # start, end, start time, end time
+_NOTE_FIELDS = 6  # time, type, floor position, speed, position x, hold time
+
+
+def _data_offset(line_count: int) -> int:
+    size = _HEADER.size + _LINE_ENTRY.size * line_count
+    return (size + _DATA_ALIGNMENT - 1) // _DATA_ALIGNMENT * _DATA_ALIGNMENT
+
+
+def get_line_counts(line: phi_judge_line) -> tuple[int, int, int, int, int, int]:
+    """Gets the number of speed, move, rotate, disappear events, notes above and notes below of a judge line."""
+    line.ensure_events()
+    return (len(line.speed_events), len(line.move_events), len(line.rotate_events), len(line.disappear_events),
+            line.num_notes_above, line.num_notes_below)
+
+
+def get_line_records(line: phi_judge_line) -> list[float]:
+    """Flattens the events and notes of a judge line into float records, in the order of get_line_counts()."""
+    line.ensure_events()
+    data: list[float] = []
+    for ev in line.speed_events:
+        data += (ev.start_time, ev.end_time, ev.floor_position, ev.value)
+    for ev in line.move_events:
+        data += (ev.start, ev.end, ev.start2, ev.end2, ev.start_time, ev.end_time)
+    for ev in line.rotate_events:
+        data += (ev.start, ev.end, ev.start_time, ev.end_time)
+    for ev in line.disappear_events:
+        data += (ev.start, ev.end, ev.start_time, ev.end_time)
+    for n in line.notes_above:
+        data += (n.time, n.note_type, n.floor_position, n.speed, n.position_x, n.hold_time)
+    for n in line.notes_below:
+        data += (n.time, n.note_type, n.floor_position, n.speed, n.position_x, n.hold_time)
+    return data
+
+
+def compile_chart(chart: phi_chart, digest: bytes, source_size: int) -> bytes:
+    """
+    Compiles a chart into its binary form.\n
+    :param chart: The chart to compile.
+    :param digest: The sha256 digest of the source json, used to detect stale files.
+    :param source_size: The size in bytes of the source json.
+    :return: The compiled bytes.
+    """
+    header = _HEADER.pack(_MAGIC, CACHE_FORMAT_VERSION, digest, source_size, chart.offset, chart.version,
+                          len(chart.lines))
+    entries = []
+    data: list[float] = []
+    for line in chart.lines:
+        entries.append(_LINE_ENTRY.pack(line.bpm, *get_line_counts(line)))
+        data += get_line_records(line)
+    head = header + b"".join(entries)
+    padding = b"\0" * (_data_offset(len(chart.lines)) - len(head))
+    records = array("d", data)
+    if sys.byteorder != "little":
+        records.byteswap()
+    return head + padding + records.tobytes()
+
+
+def write_compiled_chart(chart: phi_chart, path: str, digest: bytes, source_size: int):
+    """Compiles a chart and writes it to given path atomically."""
+    temp_path = "%s.%d.tmp" % (path, os.getpid())
+    with open(temp_path, "wb") as file_stream:
+        file_stream.write(compile_chart(chart, digest, source_size))
+    os.replace(temp_path, path)
+
+
+def _split_records(data, pos: int, count: int, fields: int) -> tuple[list, int]:
+    """Splits count records of given number of fields, starting at pos, into one strided slice per field."""
+    end = pos + count * fields
+    return [data[pos + i:end:fields] for i in range(fields)], end
+
+
+def _to_floats(values) -> list[float]:
+    return values if isinstance(values, list) else values.tolist()
+
+
+def _get_real_times(start_times, end_times, bpm: float):
+    # the same arithmetic as the event objects, so the tables hold the same values.
+    return start_times * 1.875 / bpm, end_times * 1.875 / bpm
+
+
+def build_line_from_records(index: int, version: int, bpm: float, counts: tuple, data) -> phi_judge_line:
+    """
+    Builds a judge line from the float records made by get_line_records(). Its content field is None.\n
+    :param index: The index of the judge line.
+    :param version: The chart version.
+    :param bpm: The bpm of the judge line.
+    :param counts: The counts of get_line_counts().
+    :param data: The records: a list, an array("d") or a NumPy float64 array. The event tables of a NumPy array are
+        views over its records. Its event objects are built by phi_judge_line.ensure_events(), as are those of any
+        records without NumPy, where no table is built.
+    :return: The judge line.
+    """
+    num_speed, num_move, num_rotate, num_disappear, num_above, num_below = counts
+    speed, pos = _split_records(data, 0, num_speed, _SPEED_FIELDS)
+    move, pos = _split_records(data, pos, num_move, _MOVE_FIELDS)
+    rotate, pos = _split_records(data, pos, num_rotate, _EVENT_FIELDS)
+    disappear, pos = _split_records(data, pos, num_disappear, _EVENT_FIELDS)
+    above, pos = _split_records(data, pos, num_above, _NOTE_FIELDS)
+    below, pos = _split_records(data, pos, num_below, _NOTE_FIELDS)
+
+    def build_events():
+        speed_events = [phi_speed_event(start_tm, end_tm, floor_pos, value, bpm)
+                        for start_tm, end_tm, floor_pos, value in zip(*map(_to_floats, speed))]
+        move_events = [phi_move_event(start, end, start2, end2, start_tm, end_tm, bpm)
+                       for start, end, start2, end2, start_tm, end_tm in zip(*map(_to_floats, move))]
+        rotate_events, disappear_events = [[ev_type(start, end, start_tm, end_tm, bpm)
+                                            for start, end, start_tm, end_tm in zip(*map(_to_floats, columns))]
+                                           for ev_type, columns in ((phi_rotate_event, rotate),
+                                                                    (phi_disappear_event, disappear))]
+        return speed_events, move_events, rotate_events, disappear_events
+
+    # notes are built now: the chart merges them and marks the ones hit together.
+    note_lists = [[phi_note(tm, int(ty), floor_pos, note_speed, pos_x, hold_tm, bpm, direction)
+                   for tm, ty, floor_pos, note_speed, pos_x, hold_tm in zip(*map(_to_floats, columns))]
+                  for direction, columns in ((NOTE_DIRECTION_NORMAL, above), (NOTE_DIRECTION_REVERSED, below))]
+
+    if tables_available and not isinstance(data, np.ndarray):
+        # the tables are extracted from the event objects, so they are needed now.
+        return phi_judge_line.from_events(index, version, bpm, *build_events(), note_lists[0], note_lists[1])
+    tables = None
+    if tables_available:
+        tables = phi_line_tables.from_tables(
+            phi_event_table.from_arrays(*_get_real_times(speed[0], speed[1], bpm), floor_position=speed[2],
+                                        value=speed[3]),
+            phi_event_table.from_arrays(*_get_real_times(move[4], move[5], bpm), start=move[0], end=move[1],
+                                        start2=move[2], end2=move[3]),
+            phi_event_table.from_arrays(*_get_real_times(rotate[2], rotate[3], bpm), start=rotate[0], end=rotate[1]),
+            phi_event_table.from_arrays(*_get_real_times(disappear[2], disappear[3], bpm), start=disappear[0],
+                                        end=disappear[1]))
+    return phi_judge_line.from_deferred_events(index, version, bpm, build_events, note_lists[0], note_lists[1], tables)
+
+
+def _map_records(mapped: mmap.mmap, offset: int, count: int):
+    """
+    Gets the little endian float64 records at given offset of a map. With NumPy, they are a view over the map, which
+    keeps it open as long as the view or a slice of it lives. Without NumPy, they are copied into an array.
+    """
+    if np is not None:
+        return np.frombuffer(mapped, dtype="<f8", count=count, offset=offset).astype(np.float64, copy=False)
+    records = array("d")
+    with memoryview(mapped) as view, view[offset:offset + count * 8] as data:
+        records.frombytes(data)
+    if sys.byteorder != "little":
+        records.byteswap()
+    return records
+
+
+def _build_lines(version: int, entries: list[tuple], sizes: list[int], records) -> list[phi_judge_line]:
+    lines = []
+    pos = 0
+    for i, entry in enumerate(entries):
+        lines.append(build_line_from_records(i, version, entry[0], entry[1:], records[pos:pos + sizes[i]]))
+        pos += sizes[i]
+    return lines
+
+
+def read_compiled_chart(path: str, digest: bytes or None = None) -> phi_chart:
+    """
+    Memory-maps a compiled chart file and builds a chart from it. With NumPy, the file stays mapped until the chart
+    and its tables are freed; meanwhile it cannot be removed on Windows.\n
+    :param path: The path to the compiled file.
+    :param digest: The expected sha256 digest of the source json. None to skip the check.
+    :return: The chart object. Its content field is None.
+    :raise ValueError: The file is corrupted, stale, or written by another format version.
+    """
+    with open(path, "rb") as file_stream:
+        mapped = mmap.mmap(file_stream.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        if len(mapped) < _HEADER.size:
+            raise ValueError("Compiled chart file is truncated.")
+        magic, format_ver, file_digest, _, offset, version, line_count = _HEADER.unpack_from(mapped, 0)
+        if magic != _MAGIC or format_ver != CACHE_FORMAT_VERSION:
+            raise ValueError("Compiled chart file has an unknown format.")
+        if digest is not None and file_digest != digest:
+            raise ValueError("Compiled chart file does not match its source.")
+
+        if len(mapped) < _data_offset(line_count):
+            raise ValueError("Compiled chart file is truncated.")
+        entries = [_LINE_ENTRY.unpack_from(mapped, _HEADER.size + _LINE_ENTRY.size * i) for i in range(line_count)]
+        data_offset = _data_offset(line_count)
+        sizes = [c[0] * _SPEED_FIELDS + c[1] * _MOVE_FIELDS + (c[2] + c[3]) * _EVENT_FIELDS +
+                 (c[4] + c[5]) * _NOTE_FIELDS for c in (entry[1:] for entry in entries)]
+        if len(mapped) != data_offset + sum(sizes) * 8:
+            raise ValueError("Compiled chart file is truncated.")
+        records = _map_records(mapped, data_offset, sum(sizes))
+    except BaseException:
+        mapped.close()
+        raise
+    if np is None:
+        mapped.close()  # the records are copied; with NumPy, the views close the map when they are freed.
+
+    return phi_chart.from_lines(version, offset, _build_lines(version, entries, sizes, records))
+
+
+class chart_cache:
+    """
+    Represents a directory of compiled charts, keyed by the sha256 hash of their source json.\n
+    Stale or corrupted entries are rebuilt automatically. When the total size exceeds the limit, the least recently
+    used entries are evicted.
+    """
+    __slots__ = ("directory", "size_limit")
+
+    def __init__(self, directory: str, size_limit: int = 256 * 1024 * 1024):
+        """
+        Initializes a new cache.\n
+        :param directory: The cache directory. It is created if it does not exist.
+        :param size_limit: The maximum total size in bytes of the compiled files.
+        """
+        self.directory = directory
+        self.size_limit = size_limit
+        os.makedirs(directory, exist_ok=True)
+
+    def get_entry_path(self, digest: bytes) -> str:
+        return os.path.join(self.directory, digest.hex() + CACHE_FILE_SUFFIX)
+
+    def open_chart_string(self, json_data: bytes or str) -> phi_chart:
+        """
+        Loads a chart from its json text, using the compiled entry if there is a valid one.\n
+        :param json_data: The json text of the chart.
+        :return: The chart object. Its content field is None.
+        """
+        if isinstance(json_data, str):
+            json_data = json_data.encode("utf-8")
+        digest = hashlib.sha256(json_data).digest()
+        path = self.get_entry_path(digest)
+
+        if os.path.exists(path):
+            try:
+                chart = read_compiled_chart(path, digest)
+                os.utime(path)  # the modification time orders the entries for eviction.
+                return chart
+            except (OSError, ValueError, struct.error):
+                pass  # stale or corrupted, rebuild it.
+
+        chart = phi_chart(parse_chart_json(json_data), False)
+        write_compiled_chart(chart, path, digest, len(json_data))
+        self.evict()
+        return chart
+
+    def open_chart_file(self, file_name: str) -> phi_chart:
+        """Loads a chart file, using the compiled entry if there is a valid one."""
+        with open(file_name, "rb") as file_stream:
+            json_data = file_stream.read()
+        return self.open_chart_string(json_data)
+
+    def get_entries(self) -> list[tuple[str, int, float]]:
+        """Gets every entry in the cache as (path, size, modification time), least recently used first."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(CACHE_FILE_SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime))
+        entries.sort(key=lambda x: x[2])
+        return entries
+
+    def get_size(self) -> int:
+        return sum(entry[1] for entry in self.get_entries())
+
+    def evict(self):
+        """Removes the least recently used entries until the total size fits in the limit."""
+        entries = self.get_entries()
+        total = sum(entry[1] for entry in entries)
+        for path, size, _ in entries:
+            if total <= self.size_limit:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        """Removes every entry in the cache."""
+        for path, _, _ in self.get_entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
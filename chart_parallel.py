@@ -0,0 +1,161 @@
+"""
+This module provides parallel chart loading. Judge lines are independent of each other until their notes are merged,
+so they are resolved and rearranged in a process pool, and the global note list is merged in the parent process.
+
+No parsed json crosses the process boundary. Each worker reads and parses the source itself, by path when loading a
+file, and builds every n-th line of it. Workers send each line back as packed float records (see chart_cache), which
+are much smaller to pickle than the event and note objects. With NumPy, the parent keeps the records as the storage
+of the event tables, so it only creates the event and note objects. The pool is started once and reused by later
+calls, and a worker keeps the last file it parsed until the file changes.
+
+"""
+
+import multiprocessing
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; without it, records are copied into arrays and tables are extracted.
+    np = None
+
+from chart import *
+from chart_cache import get_line_counts, get_line_records, build_line_from_records
+
+__all__ = ["open_chart_string_parallel", "open_chart_file_parallel", "get_chart_pool", "shutdown_chart_pool"]
+
+_pool: ProcessPoolExecutor or None = None  # the pool shared by every call, see get_chart_pool().
+_pool_workers: int or None = None
+
+# in a worker: ((path, modification time, size, backend), content) of the last file parsed.
+_worker_content: tuple[tuple, dict] or None = None
+
+
+def get_chart_pool(max_workers: int or None = None) -> ProcessPoolExecutor:
+    """
+    Gets the process pool which builds judge lines, starting it on first use. It is restarted only if a different
+    number of workers is asked for.\n
+    :param max_workers: The number of worker processes. None to use every core.
+    :return: The pool.
+    """
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != max_workers:
+        shutdown_chart_pool()
+        _pool = ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context())
+        _pool_workers = max_workers
+    return _pool
+
+
+def shutdown_chart_pool():
+    """Stops the worker processes of get_chart_pool(), e.g. once every chart is loaded."""
+    global _pool, _pool_workers
+    if _pool is not None:
+        _pool.shutdown()
+    _pool = None
+    _pool_workers = None
+
+
+def _parse_source(source: str or bytes, backend: str or None) -> dict:
+    """Parses a chart in a worker, given the path to the file or the json bytes."""
+    global _worker_content
+    if isinstance(source, bytes):
+        return parse_chart_json(source, backend)
+    stat = os.stat(source)
+    key = (os.path.abspath(source), stat.st_mtime_ns, stat.st_size, backend)
+    if _worker_content is None or _worker_content[0] != key:
+        _worker_content = None  # frees the previous chart before parsing the next one.
+        with open(source, "rb") as file_stream:
+            _worker_content = (key, parse_chart_json(file_stream.read(), backend))
+    return _worker_content[1]
+
+
+def _build_packed_lines(task: tuple[str or bytes, str or None, int, int]) -> tuple[int, float, list[tuple]]:
+    """Builds the lines start, start + step, ... of a chart, and returns its version, offset and packed lines."""
+    source, backend, start, step = task
+    content = _parse_source(source, backend)
+    version: int = content["formatVersion"]
+    line_list: list[dict] = content["judgeLineList"]
+    packed = []
+    for index in range(start, len(line_list), step):
+        line = phi_judge_line(line_list[index], index, version, build_tables=False, keep_content=False)
+        packed.append((index, line.bpm, get_line_counts(line), array("d", get_line_records(line)).tobytes()))
+    return version, content["offset"], packed
+
+
+def _unpack_records(records: bytes):
+    if np is not None:
+        return np.frombuffer(records, dtype=np.float64)
+    data = array("d")
+    data.frombytes(records)
+    return data
+
+
+def _load_chart_parallel(source: str or bytes, max_workers: int or None, keep_content: bool,
+                         backend: str or None) -> phi_chart:
+    """
+    Builds a chart in the shared pool, splitting its lines between as many tasks as workers.\n
+    :param source: The path to the chart file, or the json bytes, which every worker parses.
+    :param max_workers: The number of worker processes of the shared pool, see get_chart_pool().
+    :param keep_content: Whether to keep the dictionaries in the content fields. The parent parses the chart for
+        them while the workers build the lines.
+    :param backend: The json backend. See parse_chart_json().
+    :return: The chart object.
+    """
+    step = max_workers or os.cpu_count() or 1
+    pool = get_chart_pool(max_workers)
+    futures = [pool.submit(_build_packed_lines, (source, backend, start, step)) for start in range(step)]
+
+    content = None
+    if keep_content:
+        if isinstance(source, bytes):
+            content = parse_chart_json(source, backend)
+        else:
+            with open(source, "rb") as file_stream:
+                content = parse_chart_json(file_stream.read(), backend)
+
+    version, offset, packed_lines = 0, 0.0, []
+    for future in futures:
+        version, offset, packed = future.result()
+        packed_lines += packed
+    packed_lines.sort(key=lambda packed_line: packed_line[0])
+
+    lines: list[phi_judge_line] = []
+    for i, bpm, counts, records in packed_lines:
+        line = build_line_from_records(i, version, bpm, counts, _unpack_records(records))
+        if keep_content:
+            line.content = content["judgeLineList"][i]
+        lines.append(line)
+
+    chart = phi_chart.from_lines(version, offset, lines)
+    chart.content = content
+    return chart
+
+
+def open_chart_string_parallel(json_string: str or bytes or bytearray or memoryview, max_workers: int or None = None,
+                               compact: bool = False, backend: str or None = None) -> phi_chart:
+    """
+    Converts the json string to a chart like open_chart_string(), building its judge lines in a process pool. The
+    json bytes are sent to every worker, which parses them.\n
+    :param json_string: The json text.
+    :param max_workers: The number of worker processes of the shared pool, see get_chart_pool().
+    :param compact: If true, the json dictionaries are not kept in the content fields, and the parent does not parse
+        the chart at all.
+    :param backend: The json backend. See parse_chart_json().
+    """
+    json_data = json_string.encode("utf-8") if isinstance(json_string, str) else bytes(json_string)
+    return _load_chart_parallel(json_data, max_workers, not compact, backend)
+
+
+def open_chart_file_parallel(file_name: str, max_workers: int or None = None, compact: bool = False,
+                             backend: str or None = None) -> phi_chart:
+    """
+    Opens a chart file like open_chart_file(), building its judge lines in a process pool. Only the path is sent to
+    the workers, which read the file themselves.\n
+    :param file_name: The path to the chart file.
+    :param max_workers: The number of worker processes of the shared pool, see get_chart_pool().
+    :param compact: If true, the json dictionaries are not kept in the content fields, and the parent does not parse
+        the chart at all.
+    :param backend: The json backend. See parse_chart_json().
+    """
+    return _load_chart_parallel(file_name, max_workers, not compact, backend)
@@ -3,11 +3,23 @@ import copy
 from chart import *
 from sdl_render import *
 from sdl_image import *
+from sdl_atlas import *
 from sdl_transparent_cover import *
 from sdl_line import *
-from math import sin, cos, pi
+from event_table import *
+from hit_effect import *
+from frame_profiler import *
+from frame_clock import frame_clock
+from array import array
+from bisect import bisect_left, bisect_right
+from math import sin, cos, pi, hypot
 from wav_audio import audio_file
 
+try:
+    import numpy as np
+except ImportError:  # only required for baking line states.
+    np = None
+
 
 class global_resource:
     """
@@ -33,6 +45,18 @@ class global_resource:
 
     note_sound_map: dict[int, audio_file] or None = None
 
+    image_names: tuple[str, ...] = ("tap", "flick", "hold_head", "hold_body", "hold_tail", "drag",
+                                    "tap_hl", "flick_hl", "hold_head_hl", "hold_body_hl", "drag_hl")
+
+    # all note images packed into one texture, see init_note_atlas().
+    note_atlas: sdl_texture_atlas or None = None
+    atlas_single_map: list[sdl_atlas_region or None] or None = None
+    atlas_hl_map: list[sdl_atlas_region or None] or None = None
+
+    # the frames of the hit effect animation, see init_hit_effect().
+    hit_effect_atlas: sdl_texture_atlas or None = None
+    hit_effect_frames: list[sdl_atlas_region] or None = None
+
     @classmethod
     def init_tap(cls, path: str, parent: sdl_renderer):
         cls.tap = sdl_image.open_image(path, parent)
@@ -64,6 +88,93 @@ class global_resource:
         cls.hold_head_hl = sdl_image.open_image(head_path, parent)
         cls.hold_body_hl = sdl_image.open_image(body_path, parent)
 
+    @classmethod
+    def init_images(cls, paths: dict[str, str], parent: sdl_renderer):
+        """
+        Loads note images by name, e.g. {"tap": "Tap.png", "tap_hl": "TapHL.png"}.\n
+        :param paths: Maps image names to file paths. Valid names are those listed in image_names.
+        :param parent: The renderer the textures belong to.
+        """
+        for name, path in paths.items():
+            if name not in cls.image_names:
+                raise ValueError("Unknown note image: %s" % name)
+            setattr(cls, name, sdl_image.open_image(path, parent))
+
+    @classmethod
+    def init_note_atlas(cls, paths: dict[str, str], parent: sdl_renderer, padding: int = 2):
+        """
+        Packs note images into one atlas texture, so that drawing notes of different types does not switch textures.
+        Once the atlas is loaded, get_instant_note_image() returns its regions instead of the separate images.\n
+        :param paths: Maps image names to file paths, as in init_images().
+        :param parent: The renderer the atlas texture belongs to.
+        :param padding: The transparent gap around every image in the atlas.
+        """
+        for name in paths:
+            if name not in cls.image_names:
+                raise ValueError("Unknown note image: %s" % name)
+        cls.destroy_note_atlas()
+        cls.use_note_atlas(sdl_texture_atlas.from_files(paths, parent, padding))
+
+    @classmethod
+    def use_note_atlas(cls, atlas: sdl_texture_atlas or None):
+        """
+        Sets an atlas of note images packed under their image names, e.g. by resource_manager.load_skin(). The
+        previous atlas is not destroyed.\n
+        :param atlas: The atlas. None to draw the separate images again.
+        """
+        cls.note_atlas = atlas
+        if atlas is None:
+            cls.atlas_single_map = None
+            cls.atlas_hl_map = None
+            return
+        region = atlas.get_region
+        cls.atlas_single_map = [region("tap"), region("drag"), None, region("flick")]
+        cls.atlas_hl_map = [region("tap_hl") or region("tap"), region("drag_hl") or region("drag"), None,
+                            region("flick_hl") or region("flick")]
+
+    @classmethod
+    def get_note_images(cls) -> list:
+        """
+        Gets the drawables of the instant notes indexed by note kind, see judge_line_renderer.get_note_kind(). The
+        atlas regions are returned if the atlas is loaded.\n
+        :return: A list of 8 drawables, None for the kinds without an image.
+        """
+        if cls.note_atlas is not None:
+            return cls.atlas_single_map + cls.atlas_hl_map
+        return [cls.tap, cls.drag, None, cls.flick, cls.tap_hl, cls.drag_hl, None, cls.flick_hl]
+
+    @classmethod
+    def destroy_note_atlas(cls):
+        if cls.note_atlas is not None:
+            cls.note_atlas.destroy()
+        cls.note_atlas = None
+        cls.atlas_single_map = None
+        cls.atlas_hl_map = None
+
+    @classmethod
+    def init_hit_effect(cls, path: str, parent: sdl_renderer, columns: int = 5, rows: int = 6):
+        """
+        Loads the hit effect animation from a sprite sheet of equally sized frames, ordered row by row.\n
+        :param path: The path to the sprite sheet.
+        :param parent: The renderer the texture belongs to.
+        :param columns: The number of frames in a row.
+        :param rows: The number of rows.
+        """
+        cls.destroy_hit_effect()
+        cls.use_hit_effect(sdl_texture_atlas.from_grid(path, parent, columns, rows))
+
+    @classmethod
+    def use_hit_effect(cls, atlas: sdl_texture_atlas or None):
+        """Sets a hit effect atlas made by sdl_texture_atlas.from_grid(), without destroying the previous one."""
+        cls.hit_effect_atlas = atlas
+        cls.hit_effect_frames = None if atlas is None else atlas.get_frames()
+
+    @classmethod
+    def destroy_hit_effect(cls):
+        if cls.hit_effect_atlas is not None:
+            cls.hit_effect_atlas.destroy()
+        cls.use_hit_effect(None)
+
     @classmethod
     def init_tap_hold_sound(cls, path: str):
         cls.tap_sound = audio_file.open_wav_file(path)
@@ -103,6 +214,13 @@ class render_resource:
     def open_file(cls, img_path: str, wav_path: str, parent: sdl_renderer):
         return cls(sdl_image.open_image(img_path, parent), audio_file.open_wav_file(wav_path))
 
+    def destroy(self):
+        if self.illustration_image is not None:
+            self.illustration_image.destroy()
+        if self.audio_file is not None:
+            self.audio_file.destroy()
+        self.illustration_image = self.audio_file = None
+
 
 class render_options:
     """Represents a structure indicating render options."""
@@ -126,52 +244,147 @@ class render_options:
 
 
 class hit_effect_player:
-    __slots__ = ("note_list", "index")
+    __slots__ = ("note_list", "note_times", "index", "clock", "muted")
 
-    def __init__(self, list_of_notes: list[phi_note]):
+    def __init__(self, list_of_notes: list[phi_note], clock: frame_clock or None = None, muted: bool = False):
+        """
+        Initializes a new player.\n
+        :param list_of_notes: The notes sorted by real time, usually phi_chart.notes.
+        :param clock: The shared frame clock, used by update() and seek().
+        :param muted: If true, notes are passed without playing their sounds.
+        """
         self.note_list = list_of_notes
+        self.note_times: list[float] = [n.real_time for n in list_of_notes]
         self.index: int = 0
+        self.clock = clock
+        self.muted = muted
+
+    def update(self):
+        """Plays the sounds of every note hit before the current time of the clock."""
+        self.play_time_less_than(self.clock.real_time)
+
+    def seek(self, tm: float or None = None):
+        """Skips to given time (or the current time of the clock) without playing the sounds in between."""
+        tm = self.clock.real_time if tm is None else tm
+        self.index = bisect_left(self.note_times, tm)
 
     def play_time_less_than(self, tm: float):
         len_of_notes = len(self.note_list)
+        # None if the sounds are not loaded, e.g. headless rendering.
+        sound_map = None if self.muted else global_resource.note_sound_map
         while self.index < len_of_notes:
             n = self.note_list[self.index]
             if n.real_time < tm:
-                global_resource.note_sound_map[n.note_type].async_play()
+                if sound_map is not None:
+                    sound_map[n.note_type].async_play()
                 self.index += 1
                 continue
             break
 
 
+class render_counters:
+    """Counts the work a renderer does and the work it skips. Reset it to start a new measurement."""
+    __slots__ = ("frames", "lines_drawn", "lines_transparent", "lines_offscreen", "alpha_updates",
+                 "alpha_updates_skipped")
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.frames = 0
+        self.lines_drawn = 0
+        self.lines_transparent = 0  # culled, because the alpha is 0.
+        self.lines_offscreen = 0  # culled, because no part of the line lies in the viewport.
+        self.alpha_updates = 0
+        self.alpha_updates_skipped = 0  # the alpha did not change, so no SDL call was made.
+
+    def to_dict(self) -> dict[str, int]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+# the values of every entry of frame_descriptor.lines and .notes. Effects are stored as HIT_EFFECT_FIELDS values.
+FRAME_LINE_FIELDS = 5  # line index, x, y, rotation, alpha.
+FRAME_NOTE_FIELDS = 4  # note kind, x, y, rotation.
+
+
+class frame_descriptor:
+    """
+    Represents everything drawn in one frame, computed from the chart state but independent of SDL: the visible
+    lines, the visible instant notes and the alive hit effects, packed into flat arrays.\n
+    A descriptor is filled by collect_frame() and drawn by chart_renderer.submit_frame(), so the two phases may run
+    on different threads or processes. It is picklable, and reused from frame to frame without reallocating.
+    """
+    __slots__ = ("frame_index", "real_time", "lines", "notes", "effects")
+
+    def __init__(self):
+        self.frame_index = 0
+        self.real_time = 0.0
+        self.lines = array("d")
+        self.notes = array("d")
+        self.effects = array("d")
+
+    def reset(self, frame_index: int, real_time: float):
+        """Empties the descriptor for a new frame, keeping the memory of its arrays."""
+        self.frame_index = frame_index
+        self.real_time = real_time
+        del self.lines[:]
+        del self.notes[:]
+        del self.effects[:]
+
+
 class judge_line_renderer:
-    """Represents a judge line renderer."""
-    __slots__ = ("judge_line", "win", "opt", "real_time", "line_x", "line_y", "rotation", "position_y", "draw_line",
-                 "instant_judged_map", "last_alpha_index", "last_move_index", "last_rotate_index")
+    """
+    Represents a judge line renderer.\n
+    Without a window, it only computes the line state and what is visible, e.g. to fill frame descriptors in a
+    producer thread or process. Such a renderer makes no SDL call and cannot draw.
+    """
+    __slots__ = ("judge_line", "win", "opt", "clock", "line_x", "line_y", "rotation", "position_y", "draw_line",
+                 "visible_notes", "batch", "line_alpha", "applied_alpha", "counters", "half_length", "half_width",
+                 "judged_above", "judged_below")
 
-    def __init__(self, line_data: phi_judge_line, parent_window: sdl_window, options: render_options):
+    def __init__(self, line_data: phi_judge_line, parent_window: sdl_window or None, options: render_options,
+                 clock: frame_clock or None = None, batch: sdl_draw_batch or None = None,
+                 counters: render_counters or None = None):
+        """
+        Initializes a new judge line renderer.\n
+        :param line_data: The judge line to render.
+        :param parent_window: The window to render at. None to compute the state only.
+        :param options: Render options.
+        :param clock: The frame clock shared with the chart renderer. None to create a private one.
+        :param batch: The draw batch shared with the chart renderer. None to draw every object directly.
+        :param counters: The counters shared with the chart renderer. None to create private ones.
+        """
+        line_data.ensure_events()  # lines loaded from a compiled chart build their events on first use.
         self.judge_line = line_data
         self.win = parent_window
         self.opt = options
-        self.real_time = 0.0  # in seconds
+        self.clock = frame_clock(options.fps) if clock is None else clock
         self.line_x = 0
         self.line_y = 0
         self.rotation = 0
         self.position_y = 0
-        self.last_alpha_index = 0
-        self.last_move_index = 0
-        self.last_rotate_index = 0
-        self.instant_judged_map = dict[float, bool]()
+        self.visible_notes = 0
+        self.judged_above = 0  # the judged-prefix cursors of the fixed notes, see phi_note_index.seek_judged().
+        self.judged_below = 0
+        self.batch = batch
+        self.counters = render_counters() if counters is None else counters
 
         scale = options.height / 18.75 if options.width > options.height * 0.75 else options.height / 14.0625
         line_len = int(options.width * 3)
         line_width = int(round(scale * 0.15 * 0.925))
+        self.half_length = line_len / 2
+        self.half_width = line_width / 2
 
-        self.draw_line = sdl_line(parent_window.renderer, line_len, line_width, options.get_line_color())
+        self.draw_line = None if parent_window is None else sdl_line(parent_window.renderer, line_len, line_width,
+                                                                     options.get_line_color())
+        self.line_alpha = 255
+        # the alpha last applied to the line texture, so unchanged values cost no SDL call.
+        self.applied_alpha = 255
 
-        for n in self.judge_line.notes_above:
-            self.instant_judged_map[n.real_time] = False
-        for n in self.judge_line.notes_below:
-            self.instant_judged_map[n.real_time] = False
+    @property
+    def real_time(self) -> float:
+        """The current chart time in seconds, taken from the clock."""
+        return self.clock.real_time
 
     def adjust_line_state(self):
         self.adjust_alpha()
@@ -180,59 +393,132 @@ class judge_line_renderer:
         self.adjust_speed()
 
     def adjust_speed(self):
-        real_time = self.real_time
-        for ev in self.judge_line.speed_events:
-            if ev.is_real_time_valid(real_time):
-                self.position_y = ev.get_value_unchecked(real_time)
-                return
+        value = self.judge_line.timeline.speed.sample(self.real_time)
+        self.position_y = 0 if value is None else value
 
     def adjust_rotation(self):
-        real_time = self.real_time
-        rotate_events = self.judge_line.rotate_events
-        for i in range(self.last_rotate_index, len(rotate_events)):
-            ev = rotate_events[i]
-            if ev.is_real_time_valid(real_time):
-                self.rotation = -ev.get_value_unchecked(real_time)
-                self.last_rotate_index = i
-                return
+        value = self.judge_line.timeline.rotate.sample(self.real_time)
+        self.rotation = 0 if value is None else -value
 
     def adjust_alpha(self):
-        real_time = self.real_time
-        alpha_events = self.judge_line.disappear_events
-        for i in range(self.last_alpha_index, len(alpha_events)):
-            ev = alpha_events[i]
-            if ev.is_real_time_valid(real_time):
-                alpha = int(ev.get_value_unchecked(real_time) * 255.0)
-                self.draw_line.set_alpha(alpha)
-                self.last_alpha_index = i
-                return
+        value = self.judge_line.timeline.disappear.sample(self.real_time)
+        self.set_line_alpha(255 if value is None else int(value * 255.0))
 
     def adjust_movement(self):
-        real_time = self.real_time
-        w, h = self.opt.width, self.opt.height
-        move_events = self.judge_line.move_events
-        for i in range(self.last_move_index, len(move_events)):
-            ev = move_events[i]
-            if ev.is_real_time_valid(real_time):
-                x, y = ev.get_value_unchecked(real_time)
-                self.line_x = int(w * x)
-                self.line_y = int(h * y)
-                self.last_move_index = i
-                return
+        # ahead of every event, the line keeps its initial state, the same as line_state_bake.
+        value = self.judge_line.timeline.move.sample(self.real_time)
+        if value is None:
+            self.line_x = self.line_y = 0
+        else:
+            x, y = value
+            self.line_x = int(self.opt.width * x)
+            self.line_y = int(self.opt.height * y)
+
+    def apply_baked_state(self, state: list[float]):
+        """
+        Applies a line state taken from a line_state_bake, instead of evaluating the events.\n
+        :param state: A row of baked state, indexed by LINE_STATE_*.
+        :return: None.
+        """
+        self.line_x = int(state[LINE_STATE_X])
+        self.line_y = int(state[LINE_STATE_Y])
+        self.rotation = state[LINE_STATE_ROTATION]
+        self.set_line_alpha(int(state[LINE_STATE_ALPHA]))
+        self.position_y = state[LINE_STATE_POSITION_Y]
 
     def advance_frame(self):
-        self.real_time += (1 / self.opt.fps)
-        '''
-        for k in self.instant_judged_map.keys():
-            if k < self.real_time:
-                self.instant_judged_map[k] = True
-                continue
-            break
-        '''
+        """Advances the clock by one frame and adjusts the line state. Only use it if the clock is not shared."""
+        self.clock.advance()
         self.adjust_line_state()
 
+    def update(self):
+        """Adjusts the line state to the current time of the clock."""
+        self.adjust_line_state()
+
+    def destroy(self):
+        if self.draw_line is not None:
+            self.draw_line.destroy()
+
+    def set_line_alpha(self, a: int):
+        """Sets the alpha of the line state. It is applied to the texture when the line is drawn."""
+        self.line_alpha = a
+
+    def apply_line_alpha(self, a: int):
+        """Applies an alpha to the line texture, skipping the SDL call if it is already applied."""
+        if a == self.applied_alpha:
+            self.counters.alpha_updates_skipped += 1
+            return
+        self.draw_line.set_alpha(a)
+        self.applied_alpha = a
+        self.counters.alpha_updates += 1
+
+    def is_line_offscreen(self) -> bool:
+        """
+        Checks whether the line rectangle misses the viewport, by testing the axes of both rectangles.\n
+        :return: True if no part of the line can be seen.
+        """
+        w, h = self.opt.width, self.opt.height
+        line_x, line_y = self.line_x, self.line_y
+        half_length, half_width = self.half_length, self.half_width
+        rad = pi / 180.0 * self.rotation
+        c = cos(rad)
+        s = sin(rad)
+
+        # the axes of the viewport: the bounding box of the line.
+        ex = abs(c) * half_length + abs(s) * half_width
+        ey = abs(s) * half_length + abs(c) * half_width
+        if line_x + ex < 0 or line_x - ex > w or line_y + ey < 0 or line_y - ey > h:
+            return True
+
+        # the axes of the line: project the viewport corners onto its direction and normal.
+        along = []
+        across = []
+        for cx, cy in ((0, 0), (w, 0), (0, h), (w, h)):
+            dx = cx - line_x
+            dy = cy - line_y
+            along.append(dx * c + dy * s)
+            across.append(dy * c - dx * s)
+        return (min(along) > half_length or max(along) < -half_length or
+                min(across) > half_width or max(across) < -half_width)
+
+    def is_line_visible(self) -> bool:
+        """
+        Checks whether the line is drawn, i.e. it is neither fully transparent nor off the viewport. Notes are drawn
+        regardless, since they stay visible on hidden lines.\n
+        :return: True if the line is drawn.
+        """
+        counters = self.counters
+        if self.line_alpha <= 0:
+            counters.lines_transparent += 1
+            return False
+        if self.is_line_offscreen():
+            counters.lines_offscreen += 1
+            return False
+        counters.lines_drawn += 1
+        return True
+
+    def draw_line_at(self, x: float, y: float, rotation: float, alpha: int):
+        """Draws the line with given state, e.g. a state taken from a frame descriptor."""
+        self.apply_line_alpha(alpha)
+        if self.batch is None:
+            self.draw_line.draw(x, y, rotation)
+        else:
+            self.draw_line.draw_batched(self.batch, x, y, rotation)
+
     def render_line(self):
-        self.draw_line.draw(self.line_x, self.line_y, self.rotation)
+        """
+        Draws the line, unless it is fully transparent or off the viewport.\n
+        :return: Whether the line is drawn.
+        """
+        if not self.is_line_visible():
+            return False
+        self.draw_line_at(self.line_x, self.line_y, self.rotation, self.line_alpha)
+        return True
+
+    @staticmethod
+    def get_note_kind(n: phi_note) -> int:
+        """Gets the index of the image of an instant note in global_resource.get_note_images()."""
+        return n.note_type - 1 + (4 if n.multi_highlight else 0)
 
     @staticmethod
     def get_instant_note_image(n: phi_note):
@@ -247,84 +533,494 @@ class judge_line_renderer:
             case _:
                 return None
         '''
+        if global_resource.note_atlas is not None:
+            if n.multi_highlight:
+                return global_resource.atlas_hl_map[n.note_type - 1]
+            return global_resource.atlas_single_map[n.note_type - 1]
         hl_map = [global_resource.tap_hl, global_resource.drag_hl, None, global_resource.flick_hl]
         single_map = [global_resource.tap, global_resource.drag, None, global_resource.flick]
         if n.multi_highlight:
             return hl_map[n.note_type - 1]
         return single_map[n.note_type - 1]
 
-    def draw_instant_notes_above(self):
+    def collect_instant_notes(self, note_index, direction: float, notes: array, judged_count: int) -> int:
+        """
+        Collects the visible instant (non-hold) notes on one side of the line.\n
+        Only the moving notes whose floor position falls into the on-screen window are visited, and the fixed notes
+        hit before the current time are skipped with the judged-prefix cursor.\n
+        :param note_index: The phi_note_index of the side to collect.
+        :param direction: 1 for notes above the line, -1 for notes below.
+        :param notes: The array to append FRAME_NOTE_FIELDS values per visible note to.
+        :param judged_count: The judged-prefix cursor of the fixed notes of the side.
+        :return: The cursor moved to the current time.
+        """
+        real_time = self.real_time
         w, h = self.opt.width, self.opt.height
         len_rat = w * 9.0 / 160.0
-        ns = self.opt.comparative_note_speed
-        sin_value = sin(pi / 180.0 * self.rotation)
-        cos_value = cos(pi / 180.0 * self.rotation)
+        note_scale = h * 0.6 * self.opt.comparative_note_speed
+        rotation = self.rotation
+        sin_value = sin(pi / 180.0 * rotation)
+        cos_value = cos(pi / 180.0 * rotation)
         base_note_height = 0.018457 * h
-        for n in self.judge_line.notes_above:
-            if n.note_type == NOTE_TYPE_HOLD:
+        line_x, line_y, position_y = self.line_x, self.line_y, self.position_y
+        visibility_check = self.opt.visibility_check
+        get_note_kind = judge_line_renderer.get_note_kind
+
+        # judged notes are not drawn; their hit effects are drawn by hit_effect_renderer.
+        judged_count = note_index.seek_judged(judged_count, real_time)
+        candidates = note_index.fixed[judged_count:] if judged_count > 0 else note_index.fixed
+
+        # no note further from the line center than the farthest screen corner can be seen.
+        reach = max(hypot(line_x, line_y), hypot(w - line_x, line_y),
+                    hypot(line_x, h - line_y), hypot(w - line_x, h - line_y)) + base_note_height
+        if note_index.min_speed > 0:
+            floor_reach = reach / (note_index.min_speed * note_scale)
+            low = position_y - (1e-3 * len_rat / (note_index.min_speed * note_scale) if visibility_check
+                                else floor_reach)
+            begin, end = note_index.get_floor_range(low, position_y + floor_reach)
+            if begin < end:
+                candidates = note_index.by_floor[begin:end] + candidates
+
+        visible = 0
+        for n in candidates:
+            if n.note_type == NOTE_TYPE_HOLD or n.real_time < real_time:
+                continue
+            dy = (n.floor_position - position_y) * n.speed * note_scale
+            if visibility_check and dy <= -1e-3 * len_rat:
                 continue
-            if self.instant_judged_map[n.real_time]:
+            if dy > reach or dy < -reach:
                 continue
-            if not self.instant_judged_map[n.real_time] and n.real_time < self.real_time:
-                # to do: draw animation here
-                pass
 
-            dy = (n.floor_position - self.position_y) * n.speed * h * 0.6 * ns
-            project_x = self.line_x + len_rat * n.position_x * cos_value
-            offset_x = project_x + dy * sin_value
+            along = len_rat * n.position_x
+            offset_x = line_x + along * cos_value + direction * dy * sin_value
+            offset_y = line_y + along * sin_value - direction * dy * cos_value
+
+            visible += 1
+            notes.extend((get_note_kind(n), offset_x, offset_y, rotation))
+        self.visible_notes += visible
+        return judged_count
+
+    def collect_notes(self, notes: array):
+        """Collects the visible instant notes on both sides of the line into an array of FRAME_NOTE_FIELDS values."""
+        self.visible_notes = 0
+        timeline = self.judge_line.timeline
+        self.judged_above = self.collect_instant_notes(timeline.notes_above, 1.0, notes, self.judged_above)
+        self.judged_below = self.collect_instant_notes(timeline.notes_below, -1.0, notes, self.judged_below)
+
+
+def draw_notes(notes: array, note_height: float, batch: sdl_draw_batch or None):
+    """
+    Draws the notes collected by judge_line_renderer.collect_notes().\n
+    :param notes: FRAME_NOTE_FIELDS values per note.
+    :param note_height: The height of a drawn note. The width keeps the aspect ratio of its image.
+    :param batch: The draw batch. None to draw every note directly.
+    :return: None.
+    """
+    images = global_resource.get_note_images()
+    for k in range(0, len(notes), FRAME_NOTE_FIELDS):
+        img = images[int(notes[k])]
+        if img is None:
+            continue
+        if batch is None:
+            img.draw(notes[k + 1], notes[k + 2], note_height * img.width / img.height, note_height, notes[k + 3])
+        else:
+            img.draw_batched(batch, notes[k + 1], notes[k + 2], note_height * img.width / img.height, note_height,
+                             notes[k + 3])
+
+
+class hit_effect_renderer:
+    """
+    Spawns and draws the hit effects of a chart. Effects are spawned from the note timeline that hit_effect_player
+    plays sounds from, and their positions are evaluated at the hit time of each note, so the effects alive at a
+    frame do not depend on the frames rendered before it.
+    """
+    __slots__ = ("note_list", "note_times", "note_lines", "index", "clock", "opt", "batch", "pool")
+
+    def __init__(self, list_of_notes: list[phi_note], line_renderers: list[judge_line_renderer],
+                 options: render_options, clock: frame_clock, batch: sdl_draw_batch, capacity: int = 256):
+        """
+        Initializes a new hit effect renderer.\n
+        :param list_of_notes: The notes sorted by real time, usually phi_chart.notes.
+        :param line_renderers: The renderers of the lines the notes belong to.
+        :param options: Render options, with the size of the render target.
+        :param clock: The shared frame clock.
+        :param batch: The shared draw batch.
+        :param capacity: The maximum number of effects alive at once.
+        """
+        self.note_list = list_of_notes
+        self.note_times: list[float] = [n.real_time for n in list_of_notes]
+        line_of_note = {}
+        for line_renderer in line_renderers:
+            for n in line_renderer.judge_line.notes_above + line_renderer.judge_line.notes_below:
+                line_of_note[id(n)] = line_renderer
+        self.note_lines: list[judge_line_renderer] = [line_of_note[id(n)] for n in list_of_notes]
+        self.index: int = 0
+        self.clock = clock
+        self.opt = options
+        self.batch = batch
+        self.pool = hit_effect_pool(capacity)
+
+    def get_hit_position(self, i: int) -> tuple[float, float]:
+        """Gets the screen position where the i-th note is hit, from the line state at its hit time."""
+        n = self.note_list[i]
+        timeline = self.note_lines[i].judge_line.timeline
+        move = timeline.move.sample(n.real_time)
+        rotation = timeline.rotate.sample(n.real_time)
+        line_x, line_y = (0.0, 0.0) if move is None else (int(self.opt.width * move[0]),
+                                                          int(self.opt.height * move[1]))
+        rad = 0.0 if rotation is None else -rotation * pi / 180.0
+        along = self.opt.width * 9.0 / 160.0 * n.position_x
+        return line_x + along * cos(rad), line_y + along * sin(rad)
+
+    def spawn_until(self, tm: float):
+        """Spawns the effects of every note hit before given time, skipping those which have already ended."""
+        pool = self.pool
+        earliest = tm - pool.duration
+        note_times = self.note_times
+        count = len(note_times)
+        while self.index < count and note_times[self.index] < tm:
+            i = self.index
+            if note_times[i] > earliest:
+                x, y = self.get_hit_position(i)
+                pool.spawn(note_times[i], x, y, i)
+            self.index += 1
+
+    def update(self):
+        """Retires the ended effects and spawns the effects of the notes hit before the current time."""
+        tm = self.clock.real_time
+        self.pool.retire(tm)
+        self.spawn_until(tm)
+
+    def seek(self):
+        """Rebuilds the effects alive at the current time of the clock."""
+        tm = self.clock.real_time
+        self.pool.clear()
+        self.index = bisect_right(self.note_times, tm - self.pool.duration)
+        self.spawn_until(tm)
+
+    def collect(self, effects: array):
+        """Collects the effects alive at the current time into an array of HIT_EFFECT_FIELDS values."""
+        self.pool.collect(self.clock.real_time, effects)
+
+    def draw_collected(self, effects: array):
+        h = self.opt.height
+        self.pool.draw_collected(self.batch, effects, global_resource.hit_effect_frames, h * 0.25, h * 0.012,
+                                 h * 0.09)
+
+    def draw(self):
+        h = self.opt.height
+        self.pool.draw(self.batch, self.clock.real_time, global_resource.hit_effect_frames, h * 0.25, h * 0.012,
+                       h * 0.09)
+
+
+class line_state_bake:
+    """
+    Represents the states of every judge line for every frame, computed before drawing starts.\n
+    The states are stored in one (frames, lines, LINE_STATE_FIELDS) float64 array in screen units, so they can be
+    applied to judge_line_renderer directly.
+    """
+    __slots__ = ("states", "fps", "frame_count", "line_count")
+
+    def __init__(self, lines: list[phi_judge_line], clock: frame_clock, frame_count: int, width: int, height: int):
+        """
+        Bakes the states of given lines.\n
+        :param lines: The judge lines to bake. Every line must have its event tables built.
+        :param clock: The frame clock, which maps frame indices to chart time.
+        :param frame_count: The number of frames to bake, starting at frame 0.
+        :param width: The width of the render area in pixels.
+        :param height: The height of the render area in pixels.
+        """
+        if np is None or any(line.tables is None for line in lines):
+            raise RuntimeError("Baking line states requires NumPy and the event tables of every line.")
+        self.fps = clock.fps
+        self.frame_count = frame_count
+        self.line_count = len(lines)
+        self.states = np.empty((frame_count, self.line_count, LINE_STATE_FIELDS), dtype=np.float64)
+
+        times = np.arange(frame_count, dtype=np.float64) / clock.fps - clock.offset
+        for i, line in enumerate(lines):
+            line.tables.evaluate(times, out=self.states[:, i, :])
+
+        # convert chart units to what judge_line_renderer uses.
+        states = self.states
+        states[:, :, LINE_STATE_X] = np.trunc(states[:, :, LINE_STATE_X] * width)
+        states[:, :, LINE_STATE_Y] = np.trunc(states[:, :, LINE_STATE_Y] * height)
+        np.negative(states[:, :, LINE_STATE_ROTATION], out=states[:, :, LINE_STATE_ROTATION])
+        states[:, :, LINE_STATE_ALPHA] = np.trunc(states[:, :, LINE_STATE_ALPHA] * 255.0)
+
+    @staticmethod
+    def estimate_nbytes(frame_count: int, line_count: int) -> int:
+        """Estimates the memory cost in bytes of a bake, before allocating it."""
+        return frame_count * line_count * LINE_STATE_FIELDS * 8
 
-            project_y = self.line_y + 0.6 * w * n.position_x * sin_value
-            offset_y = (project_y - len_rat * (n.floor_position - self.position_y) * n.speed * cos_value)
+    @property
+    def nbytes(self) -> int:
+        """The memory cost of the baked states in bytes."""
+        return self.states.nbytes
 
-            if self.opt.visibility_check and n.real_time > self.real_time:
-                if dy > -1e-3 * len_rat:
-                    if n.note_type == NOTE_TYPE_HOLD and n.speed == 0:
-                        continue
-                else:
-                    continue
+    def get_frame(self, frame_index: int) -> list[list[float]]:
+        """Gets the states of every line at given frame as Python floats."""
+        return self.states[frame_index].tolist()
 
-            note_height = base_note_height
-            img = judge_line_renderer.get_instant_note_image(n)
+
+def update_line_states(line_renderers: list[judge_line_renderer], baked: line_state_bake or None,
+                       frame_index: int):
+    """Updates every line to the current time of its clock, from the bake if it covers the frame."""
+    if baked is not None and 0 <= frame_index < baked.frame_count:
+        for line_renderer, state in zip(line_renderers, baked.get_frame(frame_index)):
+            line_renderer.apply_baked_state(state)
+    else:
+        for line_renderer in line_renderers:
+            line_renderer.update()
+
+
+def collect_frame(descriptor: frame_descriptor, clock: frame_clock, line_renderers: list[judge_line_renderer],
+                  hit_effects: hit_effect_renderer):
+    """
+    Fills a descriptor with what is drawn at the current frame of the clock. The lines and hit effects must be
+    updated to it already. Only the state is read, so the line renderers may have no window.\n
+    :param descriptor: The descriptor to fill.
+    :param clock: The shared frame clock.
+    :param line_renderers: The line renderers, in the order of the chart lines.
+    :param hit_effects: The hit effect renderer.
+    :return: None.
+    """
+    descriptor.reset(clock.frame_index, clock.real_time)
+    lines = descriptor.lines
+    for i, line_renderer in enumerate(line_renderers):
+        if line_renderer.is_line_visible():
+            lines.extend((i, line_renderer.line_x, line_renderer.line_y, line_renderer.rotation,
+                          line_renderer.line_alpha))
+    notes = descriptor.notes
+    for line_renderer in line_renderers:
+        line_renderer.collect_notes(notes)
+    hit_effects.collect(descriptor.effects)
 
 
 class chart_renderer:
-    __slots__ = ("chart_object", "judge_line_renderer_list", "window",
-                 "cover", "bg", "effect_sound_player", "real_time", "fps")
+    __slots__ = ("chart_object", "judge_line_renderer_list", "window", "owns_window",
+                 "cover", "bg", "effect_sound_player", "clock", "fps", "baked_states", "batch", "counters",
+                 "hit_effects", "sound_scheduler", "descriptor", "note_height", "options", "profiler", "resources",
+                 "play_sounds")
 
     def __init__(self, init_chart: phi_chart, render_opt: render_options, illustration_path: str = "",
-                 super_sampling: bool = False):
-        self.chart_object = init_chart
-        self.window = sdl_window("Autoplay", render_opt.width, render_opt.height, False, False, super_sampling)
+                 super_sampling: bool = False, window: sdl_window or None = None, play_sounds: bool = True,
+                 batched: bool = True, sound_scheduler=None, background: sdl_image or None = None,
+                 resources=None):
+        """
+        Initializes a new chart renderer.\n
+        :param init_chart: The chart to render.
+        :param render_opt: Render options.
+        :param illustration_path: The path to the illustration image. Empty for no background.
+        :param super_sampling: Whether to render at double resolution. Ignored if a window is given.
+        :param window: The window to render at, e.g. a hidden one for offline rendering. None to create a new
+            window, which is destroyed with the renderer.
+        :param play_sounds: Whether to play hit sounds.
+        :param batched: Whether to submit lines and notes in batches. It has no effect if the SDL library does not
+            support geometry rendering.
+        :param sound_scheduler: A hit_sound_scheduler which plays the hit sounds on the audio thread instead of at
+            frame time. None to play them from update_frame().
+        :param background: An illustration already cropped and scaled to the render size, e.g. loaded by
+            resource_loader.load_illustration(). It is used instead of illustration_path, and destroyed with the
+            renderer.
+        :param resources: A resource_manager to acquire the illustration from, scaled to the render size, instead of
+            loading it. The illustration is released to the manager with the renderer, not destroyed.
+        """
+        self.owns_window = window is None
+        if window is None:
+            window = sdl_window("Autoplay", render_opt.width, render_opt.height, False, False, super_sampling)
+        self.window = window
         self.judge_line_renderer_list = list[judge_line_renderer]()
         self.cover = sdl_transparent_cover(self.window.renderer, (0, 0, 0, render_opt.cover_alpha))
-        self.bg = None if illustration_path == "" else sdl_image.open_image(illustration_path, self.window.renderer,
-                                                                            (2048, 1080))
-
-        if self.bg is not None:
-            old = self.bg
-            self.bg = old.crop_to_fit(render_opt.width / render_opt.height)
-            old.destroy()
-
-        self.real_time = 0
+        self.bg: sdl_image or None = None
+        self.resources = resources
+        self.play_sounds = play_sounds
         self.fps = render_opt.fps
-        self.effect_sound_player = hit_effect_player(init_chart.notes)
+        self.batch = sdl_draw_batch(self.window.renderer, enabled=batched)
 
         render_opt = copy.copy(render_opt)
         if super_sampling:
             render_opt.width *= 2
             render_opt.height *= 2
+        self.options = render_opt  # the options the state is computed with, at the size of the render target.
+        self.descriptor = frame_descriptor()
+        self.note_height = 0.018457 * render_opt.height
+        # times every phase of the frames if set, see frame_profiler.
+        self.profiler: frame_profiler or None = None
+        self.load_chart(init_chart, illustration_path, background, sound_scheduler)
+
+    def load_chart(self, init_chart: phi_chart, illustration_path: str = "", background: sdl_image or None = None,
+                   sound_scheduler=None):
+        """
+        Replaces the chart and illustration, keeping the window, the draw batch and the options. The renderer is
+        positioned at frame 0 of the new chart, as a new renderer would be.\n
+        :param init_chart: The chart to render.
+        :param illustration_path: The path to the illustration image. Empty for no background.
+        :param background: An illustration already cropped and scaled to the render size, used instead of
+            illustration_path, see __init__().
+        :param sound_scheduler: The hit_sound_scheduler of the new chart. None to play the hit sounds from
+            update_frame().
+        :return: None.
+        """
+        self.unload_chart()
+        self.chart_object = init_chart
+        self.bg = background
+        if background is None and illustration_path != "" and self.resources is not None:
+            self.bg = self.resources.acquire_illustration(illustration_path, self.options.width, self.options.height)
+        elif background is None and illustration_path != "":
+            old = sdl_image.open_image(illustration_path, self.window.renderer, (2048, 1080))
+            self.bg = old.crop_to_fit(self.options.width / self.options.height)
+            old.destroy()
+
+        self.clock = frame_clock(self.fps, init_chart.offset)
+        self.baked_states: line_state_bake or None = None
+        self.sound_scheduler = sound_scheduler
+        self.effect_sound_player = hit_effect_player(init_chart.notes, self.clock,
+                                                     not self.play_sounds or sound_scheduler is not None)
+        self.counters = render_counters()
         for line in init_chart.lines:
-            self.judge_line_renderer_list.append(judge_line_renderer(line, self.window, render_opt))
+            self.judge_line_renderer_list.append(judge_line_renderer(line, self.window, self.options, self.clock,
+                                                                     self.batch, self.counters))
+        self.hit_effects = hit_effect_renderer(init_chart.notes, self.judge_line_renderer_list, self.options,
+                                               self.clock, self.batch)
 
-    def render_frame(self):
+    def unload_chart(self):
+        """Releases the line textures and the illustration of the current chart, if any."""
+        for line_renderer in self.judge_line_renderer_list:
+            line_renderer.destroy()
+        self.judge_line_renderer_list.clear()
+        if self.bg is not None:
+            if self.resources is not None and self.resources.owns(self.bg):
+                self.resources.release(self.bg)
+            else:
+                self.bg.destroy()
+        self.bg = None
+        self.chart_object = None
+        self.baked_states = None
+
+    @property
+    def real_time(self) -> float:
+        return self.clock.real_time
+
+    @property
+    def frame_index(self) -> int:
+        return self.clock.frame_index
+
+    def seek_frame(self, frame_index: int):
+        """
+        Positions every component at given frame, without playing the hit sounds in between.\n
+        :param frame_index: The frame to render next.
+        :return: None.
+        """
+        self.clock.seek_frame(frame_index)
+        self.effect_sound_player.seek()
+        self.hit_effects.seek()
+        # a running scheduler is the audio clock the frames follow, so it is not moved by the frames.
+        if self.sound_scheduler is not None and not self.sound_scheduler.running:
+            self.sound_scheduler.seek(self.clock.audio_time)
+
+    def bake_line_states(self, duration: float) -> line_state_bake:
+        """
+        Precomputes the states of every judge line for every frame of given duration. Frames covered by the bake
+        are drawn with table lookups instead of evaluating events.\n
+        :param duration: The duration in seconds to bake, usually the length of the song.
+        :return: The bake object. Its nbytes property reports the memory cost.
+        """
+        frame_count = int(duration * self.fps) + 1
+        opt = self.judge_line_renderer_list[0].opt if len(self.judge_line_renderer_list) > 0 else None
+        width, height = (opt.width, opt.height) if opt is not None else (self.window.width, self.window.height)
+        self.baked_states = line_state_bake(self.chart_object.lines, self.clock, frame_count, width, height)
+        return self.baked_states
+
+    def update_sounds(self):
+        """Plays the hit sounds up to the current frame, unless the sound scheduler plays them."""
+        self.effect_sound_player.update()
+
+    def update_frame(self):
+        """Plays the hit sounds and updates the state of every line and hit effect to the current frame."""
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.begin_frame(self.clock.frame_index)
+        self.update_sounds()
+        if profiler is not None:
+            profiler.mark(PHASE_SOUNDS)
+        self.hit_effects.update()
+        if profiler is not None:
+            profiler.mark(PHASE_EFFECTS_UPDATE)
+        update_line_states(self.judge_line_renderer_list, self.baked_states, self.clock.frame_index)
+        if profiler is not None:
+            profiler.mark(PHASE_LINES_UPDATE)
+
+    def collect_frame(self, descriptor: frame_descriptor):
+        """Fills a descriptor with what is drawn at the current state, see collect_frame()."""
+        if self.profiler is not None:
+            self.profiler.skip()
+        collect_frame(descriptor, self.clock, self.judge_line_renderer_list, self.hit_effects)
+        if self.profiler is not None:
+            self.profiler.mark(PHASE_COLLECT)
+
+    def submit_frame(self, descriptor: frame_descriptor):
+        """
+        Draws a frame descriptor to the renderer. It only issues draw calls, so the descriptor may be collected by
+        another renderer of the same chart and options, e.g. in a producer thread or process.\n
+        :param descriptor: The frame to draw.
+        :return: None.
+        """
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.skip()
+            submits = self.batch.submit_count
         self.window.renderer.clear()
-        self.effect_sound_player.play_time_less_than(self.real_time)
         if self.bg is not None:
             self.bg.tex.direct_copy_to_parent()
             self.cover.draw_cover()
-        for line_renderer in self.judge_line_renderer_list:
-            line_renderer.render_line()
+        if profiler is not None:
+            profiler.mark(PHASE_BACKGROUND)
+        line_renderers = self.judge_line_renderer_list
+        lines = descriptor.lines
+        for k in range(0, len(lines), FRAME_LINE_FIELDS):
+            line_renderers[int(lines[k])].draw_line_at(lines[k + 1], lines[k + 2], lines[k + 3], int(lines[k + 4]))
+        if profiler is not None:
+            profiler.mark(PHASE_LINES_DRAW)
+        draw_notes(descriptor.notes, self.note_height, self.batch)
+        if profiler is not None:
+            profiler.mark(PHASE_NOTES_DRAW)
+        self.hit_effects.draw_collected(descriptor.effects)
+        if profiler is not None:
+            profiler.mark(PHASE_EFFECTS_DRAW)
+        self.batch.flush()
+        self.counters.frames += 1
+        if profiler is not None:
+            profiler.mark(PHASE_FLUSH)
+            self.record_figures(descriptor, submits)
 
-        for line_renderer in self.judge_line_renderer_list:
-            line_renderer.advance_frame()
-        self.real_time += 1 / self.fps
+    def record_figures(self, descriptor: frame_descriptor, submits: int):
+        """Records what a frame drew to the profiler. Direct draws are counted as one draw call per object."""
+        line_count = len(descriptor.lines) // FRAME_LINE_FIELDS
+        note_count = len(descriptor.notes) // FRAME_NOTE_FIELDS
+        effect_count = len(descriptor.effects) // HIT_EFFECT_FIELDS
+        if self.batch.enabled:
+            draw_calls = self.batch.submit_count - submits
+        else:
+            pool = self.hit_effects.pool
+            sprites = 1 if global_resource.hit_effect_frames else 0
+            draw_calls = line_count + note_count + effect_count * (sprites + pool.particles)
+        self.profiler.set_figures(line_count, note_count, effect_count, draw_calls)
+
+    def draw_frame(self):
+        """Draws the current state to the renderer."""
+        self.collect_frame(self.descriptor)
+        self.submit_frame(self.descriptor)
+
+    def render_frame(self):
+        """Renders the current frame and advances the clock to the next one."""
+        self.update_frame()
+        self.draw_frame()
+        self.clock.advance()
+
+    def destroy(self):
+        """Releases the textures of this renderer, and the window if it was created by this renderer."""
+        self.unload_chart()
+        if self.owns_window and self.window is not None:
+            self.window.destroy()
+        self.window = None
@@ -0,0 +1,134 @@
+"""
+This module provides interval indices over judge line events, so the event in effect at any time can be found without
+scanning the whole event list.
+
+"""
+
+from bisect import bisect_left, bisect_right
+
+__all__ = ["phi_event_index", "phi_note_index", "phi_line_timeline"]
+
+
+class phi_event_index:
+    """
+    Represents an index over one kind of judge line events, ordered by real start time.\n
+    Lookups take O(log n) time for arbitrary jumps and O(1) time when the time only moves to the same or the next
+    event, which is the common case when rendering frame after frame. The cursor is only a hint, so the index may be
+    shared by several renderers.
+    """
+    __slots__ = ("events", "start_times", "count", "cursor")
+
+    def __init__(self, events: list):
+        """
+        Initializes a new index with given event list.\n
+        :param events: The rearranged event list taken from a judge line. It is sorted by start time if necessary.
+        """
+        start_times = [ev.real_start_time for ev in events]
+        if any(start_times[i] > start_times[i + 1] for i in range(len(start_times) - 1)):
+            events = sorted(events, key=lambda x: x.real_start_time)  # sorted() is stable.
+            start_times = [ev.real_start_time for ev in events]
+        self.events: list = events
+        self.start_times: list[float] = start_times
+        self.count: int = len(events)
+        self.cursor: int = 0
+
+    def find(self, real_time: float):
+        """
+        Finds the event in effect, which is the last event starting at or before given time.\n
+        :param real_time: The real time in seconds.
+        :return: The event object, or None if the time is ahead of every event.
+        """
+        start_times = self.start_times
+        count = self.count
+        c = self.cursor
+        if c < count and start_times[c] <= real_time:
+            if c + 1 == count or real_time < start_times[c + 1]:
+                return self.events[c]
+            if c + 2 == count or real_time < start_times[c + 2]:
+                self.cursor = c + 1
+                return self.events[c + 1]
+
+        i = bisect_right(start_times, real_time) - 1
+        if i < 0:
+            return None
+        self.cursor = i
+        return self.events[i]
+
+    def sample(self, real_time: float):
+        """
+        Gets the event value at given time.\n
+        If the time falls into a gap behind the event in effect, the value that event ends with is returned, so the
+        result only depends on the time, never on the previous lookups.\n
+        :param real_time: The real time in seconds.
+        :return: The value, or None if the time is ahead of every event.
+        """
+        ev = self.find(real_time)
+        if ev is None:
+            return None
+        if real_time < ev.real_end_time:
+            return ev.get_value_unchecked(real_time)
+        return ev.get_end_value()
+
+
+class phi_note_index:
+    """
+    Represents an index over the notes on one side of a judge line.\n
+    Notes moving towards the line are ordered by floor position, so the notes within a floor position window can be
+    found by bisection. Notes with a speed of 0 or less may stay anywhere on the screen, so they are kept aside,
+    ordered by real time, and visited from the first one not hit yet.
+    """
+    __slots__ = ("by_floor", "floor_positions", "fixed", "fixed_times", "min_speed")
+
+    def __init__(self, notes: list):
+        moving = [n for n in notes if n.speed > 0]
+        self.by_floor: list = sorted(moving, key=lambda x: x.floor_position)
+        self.floor_positions: list[float] = [n.floor_position for n in self.by_floor]
+        self.fixed: list = sorted((n for n in notes if n.speed <= 0), key=lambda x: x.real_time)
+        self.fixed_times: list[float] = [n.real_time for n in self.fixed]
+        self.min_speed: float = min((n.speed for n in moving), default=0.0)
+
+    def get_floor_range(self, low: float, high: float) -> tuple[int, int]:
+        """
+        Gets the range of notes whose floor position lies in [low, high].\n
+        :return: A (begin, end) index pair into by_floor.
+        """
+        return bisect_left(self.floor_positions, low), bisect_right(self.floor_positions, high)
+
+    def seek_judged(self, judged_count: int, real_time: float) -> int:
+        """
+        Moves a judged-prefix cursor over the fixed notes, so that it counts the fixed notes hit before given time.
+        The cursor is kept by the caller, since a chart may be rendered by several renderers at once. Time may move
+        backwards.\n
+        :param judged_count: The previous cursor, 0 at first.
+        :param real_time: The real time in seconds.
+        :return: The new cursor: fixed[cursor:] are the fixed notes not hit yet.
+        """
+        times = self.fixed_times
+        c = judged_count
+        count = len(times)
+        if c < count and times[c] < real_time:
+            c += 1
+            if c < count and times[c] < real_time:
+                c = bisect_left(times, real_time, c)
+        elif c > 0 and times[c - 1] >= real_time:
+            c = bisect_left(times, real_time, 0, c)
+        return c
+
+
+class phi_line_timeline:
+    """Represents the event and note indices of one judge line."""
+    __slots__ = ("speed", "move", "rotate", "disappear", "notes_above", "notes_below")
+
+    def __init__(self, speed_events: list, move_events: list, rotate_events: list, disappear_events: list,
+                 notes_above: list = (), notes_below: list = ()):
+        self.speed = phi_event_index(speed_events)
+        self.move = phi_event_index(move_events)
+        self.rotate = phi_event_index(rotate_events)
+        self.disappear = phi_event_index(disappear_events)
+        self.notes_above = phi_note_index(notes_above)
+        self.notes_below = phi_note_index(notes_below)
+
+    @classmethod
+    def from_judge_line(cls, line):
+        return cls(line.speed_events, line.move_events, line.rotate_events, line.disappear_events,
+                   line.notes_above, line.notes_below)
@@ -0,0 +1,196 @@
+"""
+This module provides columnar (array-backed) representations of judge line events.
+
+Every event kind of a judge line is stored as a set of contiguous float64 arrays, so the state of a line can be
+evaluated for a whole array of timestamps in one call. NumPy is an optional dependency: when it is unavailable,
+``tables_available`` is False and no table is built.
+
+"""
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; the object-based events keep working without it.
+    np = None
+
+__all__ = ["phi_event_table", "phi_line_tables", "tables_available",
+           "LINE_STATE_X", "LINE_STATE_Y", "LINE_STATE_ROTATION", "LINE_STATE_ALPHA", "LINE_STATE_POSITION_Y",
+           "LINE_STATE_FIELDS"]
+
+tables_available: bool = np is not None
+
+# column indices of the arrays returned by phi_line_tables.evaluate().
+LINE_STATE_X = 0
+LINE_STATE_Y = 1
+LINE_STATE_ROTATION = 2
+LINE_STATE_ALPHA = 3
+LINE_STATE_POSITION_Y = 4
+LINE_STATE_FIELDS = 5
+
+
+def _column(events: list, name: str, count: int):
+    return np.fromiter((getattr(ev, name) for ev in events), dtype=np.float64, count=count)
+
+
+class phi_event_table:
+    """
+    Represents one kind of judge line events as contiguous float64 arrays, sorted by real start time.\n
+    Columns which do not apply to the event kind are None.
+    """
+    __slots__ = ("real_start_time", "real_end_time", "start", "end", "start2", "end2", "floor_position", "value",
+                 "count")
+
+    def __init__(self, events: list, columns: tuple[str, ...]):
+        """
+        Builds a new table from a list of event objects.\n
+        :param events: The rearranged event list taken from a judge line.
+        :param columns: Names of the value columns to extract, besides the real start and end time.
+        """
+        self.count: int = len(events)
+        for name in ("start", "end", "start2", "end2", "floor_position", "value"):
+            setattr(self, name, None)
+        self.real_start_time = _column(events, "real_start_time", self.count)
+        self.real_end_time = _column(events, "real_end_time", self.count)
+        for name in columns:
+            setattr(self, name, _column(events, name, self.count))
+        self.sort(columns)
+
+    @classmethod
+    def from_arrays(cls, real_start_time, real_end_time, **columns):
+        """
+        Builds a table from float64 arrays which are already extracted, e.g. from the records of a compiled chart.
+        The arrays are used as they are, not copied.\n
+        :param real_start_time: The real start times in seconds.
+        :param real_end_time: The real end times in seconds.
+        :param columns: The value columns, by name.
+        :return: The table.
+        """
+        table = cls.__new__(cls)
+        table.count = len(real_start_time)
+        for name in ("start", "end", "start2", "end2", "floor_position", "value"):
+            setattr(table, name, columns.get(name))
+        table.real_start_time = real_start_time
+        table.real_end_time = real_end_time
+        table.sort(tuple(columns))
+        return table
+
+    def sort(self, columns: tuple[str, ...]):
+        """Sorts the rows by real start time, unless they are sorted already."""
+        if self.count > 1 and np.any(self.real_start_time[1:] < self.real_start_time[:-1]):
+            # keep the original order for events sharing the same start time.
+            order = np.argsort(self.real_start_time, kind="stable")
+            for name in ("real_start_time", "real_end_time") + columns:
+                setattr(self, name, getattr(self, name)[order])
+
+    @classmethod
+    def from_speed_events(cls, events: list):
+        return cls(events, ("floor_position", "value"))
+
+    @classmethod
+    def from_events(cls, events: list):
+        """Builds a table from format 1 events (rotation and alpha events)."""
+        return cls(events, ("start", "end"))
+
+    @classmethod
+    def from_move_events(cls, events: list):
+        return cls(events, ("start", "end", "start2", "end2"))
+
+    def locate(self, times):
+        """
+        Finds the event in effect for every timestamp.\n
+        The event in effect is the last one starting at or before the timestamp. If the timestamp falls behind the
+        end of that event, the time is clamped to its end, so gaps keep the value the previous event ended with.\n
+        :param times: A float64 array of real times in seconds.
+        :return: A tuple of (event indices, clamped times, validity mask). The table must not be empty.
+        """
+        indices = np.searchsorted(self.real_start_time, times, side="right") - 1
+        valid = indices >= 0
+        safe = np.maximum(indices, 0)
+        clamped = np.minimum(times, self.real_end_time[safe])
+        return safe, clamped, valid
+
+    def _progress(self, safe, clamped):
+        start_tm = self.real_start_time[safe]
+        duration = self.real_end_time[safe] - start_tm
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(duration > 0, (clamped - start_tm) / duration, 1.0)
+
+    def evaluate_speed(self, times, default: float = 0.0):
+        """Evaluates the floor position (position y) for every timestamp."""
+        if self.count == 0:
+            return np.full(len(times), default)
+        safe, clamped, valid = self.locate(times)
+        ret = (clamped - self.real_start_time[safe]) * self.value[safe] + self.floor_position[safe]
+        return np.where(valid, ret, default)
+
+    def evaluate(self, times, default: float = 0.0):
+        """Evaluates a format 1 event table (rotation or alpha) for every timestamp."""
+        if self.count == 0:
+            return np.full(len(times), default)
+        safe, clamped, valid = self.locate(times)
+        t2 = self._progress(safe, clamped)
+        ret = self.start[safe] * (1 - t2) + self.end[safe] * t2
+        return np.where(valid, ret, default)
+
+    def evaluate_move(self, times, default: tuple[float, float] = (0.0, 0.0)):
+        """Evaluates a movement event table for every timestamp, returning the x and y arrays."""
+        if self.count == 0:
+            return np.full(len(times), default[0]), np.full(len(times), default[1])
+        safe, clamped, valid = self.locate(times)
+        t2 = self._progress(safe, clamped)
+        t1 = 1 - t2
+        x = self.start[safe] * t1 + self.end[safe] * t2
+        y = 1 - self.start2[safe] * t1 - self.end2[safe] * t2
+        return np.where(valid, x, default[0]), np.where(valid, y, default[1])
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in self.__slots__
+                   if name != "count" and getattr(self, name) is not None)
+
+
+class phi_line_tables:
+    """Represents the columnar event tables of one judge line."""
+    __slots__ = ("speed", "move", "rotate", "disappear")
+
+    def __init__(self, speed_events: list, move_events: list, rotate_events: list, disappear_events: list):
+        self.speed = phi_event_table.from_speed_events(speed_events)
+        self.move = phi_event_table.from_move_events(move_events)
+        self.rotate = phi_event_table.from_events(rotate_events)
+        self.disappear = phi_event_table.from_events(disappear_events)
+
+    @classmethod
+    def from_judge_line(cls, line):
+        return cls(line.speed_events, line.move_events, line.rotate_events, line.disappear_events)
+
+    @classmethod
+    def from_tables(cls, speed: phi_event_table, move: phi_event_table, rotate: phi_event_table,
+                    disappear: phi_event_table):
+        """Initializes new line tables with tables which are already built, see phi_event_table.from_arrays()."""
+        tables = cls.__new__(cls)
+        tables.speed = speed
+        tables.move = move
+        tables.rotate = rotate
+        tables.disappear = disappear
+        return tables
+
+    def evaluate(self, times, out=None):
+        """
+        Evaluates the line state in chart units for every timestamp.\n
+        The columns are indexed by LINE_STATE_*: x and y are fractions of the screen size, rotation is the raw
+        event value in degrees, alpha lies in [0, 1] and position y is the floor position.\n
+        :param times: A sequence of real times in seconds.
+        :param out: An optional (len(times), LINE_STATE_FIELDS) float64 array to write into.
+        :return: The state array.
+        """
+        times = np.asarray(times, dtype=np.float64)
+        if out is None:
+            out = np.empty((len(times), LINE_STATE_FIELDS), dtype=np.float64)
+        out[:, LINE_STATE_X], out[:, LINE_STATE_Y] = self.move.evaluate_move(times)
+        out[:, LINE_STATE_ROTATION] = self.rotate.evaluate(times)
+        out[:, LINE_STATE_ALPHA] = self.disappear.evaluate(times, 1.0)
+        out[:, LINE_STATE_POSITION_Y] = self.speed.evaluate_speed(times)
+        return out
+
+    @property
+    def nbytes(self) -> int:
+        return self.speed.nbytes + self.move.nbytes + self.rotate.nbytes + self.disappear.nbytes
@@ -0,0 +1,53 @@
+"""
+This module provides the frame clock shared by every renderer of a chart.
+
+Time is derived from an integer frame index instead of being accumulated frame by frame, so it does not drift, and
+any frame can be reached in one call.
+
+"""
+
+__all__ = ["frame_clock"]
+
+
+class frame_clock:
+    """
+    Represents a frame clock.\n
+    The audio time of frame i is i / fps. The chart time (real_time) is the audio time minus the chart offset,
+    which is what events and notes are timed with.
+    """
+    __slots__ = ("fps", "offset", "frame_index")
+
+    def __init__(self, fps: int, offset: float = 0.0, frame_index: int = 0):
+        """
+        Initializes a new clock.\n
+        :param fps: Frames per second.
+        :param offset: The chart offset in seconds.
+        :param frame_index: The initial frame.
+        """
+        self.fps = fps
+        self.offset = offset
+        self.frame_index = frame_index
+
+    @property
+    def audio_time(self) -> float:
+        """The time in seconds since the song starts."""
+        return self.frame_index / self.fps
+
+    @property
+    def real_time(self) -> float:
+        """The chart time in seconds."""
+        return self.frame_index / self.fps - self.offset
+
+    def get_real_time(self, frame_index: int) -> float:
+        """Gets the chart time in seconds of given frame."""
+        return frame_index / self.fps - self.offset
+
+    def get_frame_index(self, real_time: float) -> int:
+        """Gets the frame nearest to given chart time."""
+        return round((real_time + self.offset) * self.fps)
+
+    def advance(self, frames: int = 1):
+        self.frame_index += frames
+
+    def seek_frame(self, frame_index: int):
+        self.frame_index = frame_index
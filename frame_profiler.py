@@ -0,0 +1,221 @@
+"""
+This module provides an opt-in per-phase frame profiler, and an overlay which draws its figures on screen.
+
+Attach a frame_profiler to chart_renderer.profiler to enable it. Every updated frame takes one row of a fixed-size
+ring: the milliseconds spent in each phase, and what the frame drew. When no profiler is attached, the renderer only
+pays one None check per phase.
+
+"""
+
+import csv
+import json
+import time
+from array import array
+
+from sdl_render import *
+try:
+    from sdl_text import sdl_font, sdl_glyph_cache, sdl_text_cache
+except ImportError:  # SDL_ttf is only required by profiler_overlay.
+    sdl_font = sdl_glyph_cache = sdl_text_cache = None
+
+__all__ = ["frame_profiler", "profiler_overlay", "PROFILER_PHASES", "PHASE_SOUNDS", "PHASE_EFFECTS_UPDATE",
+           "PHASE_LINES_UPDATE", "PHASE_COLLECT", "PHASE_BACKGROUND", "PHASE_LINES_DRAW", "PHASE_NOTES_DRAW",
+           "PHASE_EFFECTS_DRAW", "PHASE_FLUSH", "PHASE_PRESENT", "PHASE_OUTPUT"]
+
+PHASE_SOUNDS = 0  # hit_effect_player and the sound scheduler.
+PHASE_EFFECTS_UPDATE = 1  # spawning and retiring hit effects.
+PHASE_LINES_UPDATE = 2  # evaluating the line states, judge_line_renderer.update().
+PHASE_COLLECT = 3  # culling lines and finding the visible notes.
+PHASE_BACKGROUND = 4  # clearing, the illustration and the cover.
+PHASE_LINES_DRAW = 5
+PHASE_NOTES_DRAW = 6
+PHASE_EFFECTS_DRAW = 7
+PHASE_FLUSH = 8  # submitting the draw batch, and copying the super sampling layer to the window.
+PHASE_PRESENT = 9  # presenting or reading back the frame, timed by the render loop.
+PHASE_OUTPUT = 10  # writing the frame to a sink or an encoder, timed by offline rendering.
+
+PROFILER_PHASES: tuple[str, ...] = ("sounds", "effects_update", "lines_update", "collect", "background",
+                                    "lines_draw", "notes_draw", "effects_draw", "flush", "present", "output")
+_PHASE_COUNT = len(PROFILER_PHASES)
+
+# the figures recorded for every frame besides the phase timings.
+_FRAME_FIELDS: tuple[str, ...] = ("lines_drawn", "visible_notes", "hit_effects", "draw_calls")
+
+
+class frame_profiler:
+    """
+    Represents a ring of per-frame timings. begin_frame() starts a row, and every mark() adds the time since the
+    previous mark to a phase of the row, so a phase may be marked several times in a frame.
+    """
+    __slots__ = ("capacity", "frame_indices", "timings", "figures", "index", "count", "last_counter", "row")
+
+    def __init__(self, capacity: int = 1024):
+        """
+        Initializes a new profiler.\n
+        :param capacity: The number of most recent frames kept.
+        """
+        self.capacity = capacity
+        self.frame_indices = array("q", bytes(8 * capacity))
+        self.timings = array("d", bytes(8 * capacity * _PHASE_COUNT))
+        self.figures = array("q", bytes(8 * capacity * len(_FRAME_FIELDS)))
+        self.reset()
+
+    def reset(self):
+        self.index = 0
+        self.count = 0
+        self.row = -1  # the ring slot of the current frame, -1 before the first one.
+        self.last_counter = time.perf_counter()
+
+    def __len__(self):
+        return self.count
+
+    def begin_frame(self, frame_index: int):
+        """Starts a new row, which overwrites the oldest one when the ring is full."""
+        row = self.index
+        self.index = (row + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.row = row
+        self.frame_indices[row] = frame_index
+        timings = self.timings
+        for k in range(row * _PHASE_COUNT, (row + 1) * _PHASE_COUNT):
+            timings[k] = 0.0
+        figures = self.figures
+        for k in range(row * len(_FRAME_FIELDS), (row + 1) * len(_FRAME_FIELDS)):
+            figures[k] = 0
+        self.last_counter = time.perf_counter()
+
+    def mark(self, phase: int):
+        """Adds the time since the previous mark, or since begin_frame(), to a phase of the current frame."""
+        now = time.perf_counter()
+        if self.row >= 0:
+            self.timings[self.row * _PHASE_COUNT + phase] += now - self.last_counter
+        self.last_counter = now
+
+    def skip(self):
+        """Restarts the time of the next mark, so the time in between is not counted in any phase."""
+        self.last_counter = time.perf_counter()
+
+    def set_figures(self, lines_drawn: int, visible_notes: int, hit_effects: int, draw_calls: int):
+        """Records what the current frame drew."""
+        if self.row < 0:
+            return
+        k = self.row * len(_FRAME_FIELDS)
+        figures = self.figures
+        figures[k] = lines_drawn
+        figures[k + 1] = visible_notes
+        figures[k + 2] = hit_effects
+        figures[k + 3] = draw_calls
+
+    def get_rows(self) -> list[dict]:
+        """Gets the recorded frames from the oldest, with the timings in milliseconds."""
+        rows = []
+        start = (self.index - self.count) % self.capacity
+        for j in range(self.count):
+            row = (start + j) % self.capacity
+            timings = self.timings[row * _PHASE_COUNT:(row + 1) * _PHASE_COUNT]
+            figures = self.figures[row * len(_FRAME_FIELDS):(row + 1) * len(_FRAME_FIELDS)]
+            item = {"frame_index": self.frame_indices[row], "frame_ms": sum(timings) * 1000.0}
+            for name, value in zip(PROFILER_PHASES, timings):
+                item[name + "_ms"] = value * 1000.0
+            item.update(zip(_FRAME_FIELDS, figures))
+            rows.append(item)
+        return rows
+
+    def get_mean_row(self, frames: int or None = None) -> dict:
+        """
+        Gets the mean of every column over the most recent frames.\n
+        :param frames: The number of frames to average. None for every recorded frame.
+        :return: The mean row without a frame index. Every value is 0 if no frame is recorded.
+        """
+        count = self.count if frames is None else max(0, min(frames, self.count))
+        sums = [0.0] * (_PHASE_COUNT + len(_FRAME_FIELDS))
+        for j in range(count):
+            row = (self.index - 1 - j) % self.capacity
+            for p in range(_PHASE_COUNT):
+                sums[p] += self.timings[row * _PHASE_COUNT + p]
+            for f in range(len(_FRAME_FIELDS)):
+                sums[_PHASE_COUNT + f] += self.figures[row * len(_FRAME_FIELDS) + f]
+        scale = 1.0 / count if count > 0 else 0.0
+        mean = {"frame_ms": sum(sums[:_PHASE_COUNT]) * scale * 1000.0}
+        for p, name in enumerate(PROFILER_PHASES):
+            mean[name + "_ms"] = sums[p] * scale * 1000.0
+        for f, name in enumerate(_FRAME_FIELDS):
+            mean[name] = sums[_PHASE_COUNT + f] * scale
+        return mean
+
+    def get_percentile(self, percent: float, column: str = "frame_ms") -> float:
+        """Gets a percentile of a column over the recorded frames, or 0 if no frame is recorded."""
+        values = sorted(row[column] for row in self.get_rows())
+        if not values:
+            return 0.0
+        return values[min(len(values) - 1, int(percent / 100.0 * len(values)))]
+
+    def to_dict(self) -> dict:
+        return {"phases": list(PROFILER_PHASES), "mean": self.get_mean_row(),
+                "frame_ms_p50": self.get_percentile(50), "frame_ms_p95": self.get_percentile(95),
+                "frame_ms_p99": self.get_percentile(99), "frames": self.get_rows()}
+
+    def export_csv(self, path: str):
+        """Writes one row per recorded frame to a CSV file."""
+        fields = ["frame_index", "frame_ms"] + [name + "_ms" for name in PROFILER_PHASES] + list(_FRAME_FIELDS)
+        with open(path, "w", newline="") as file_stream:
+            writer = csv.DictWriter(file_stream, fields)
+            writer.writeheader()
+            writer.writerows(self.get_rows())
+
+    def export_json(self, path: str):
+        """Writes the summary and every recorded frame to a JSON file."""
+        with open(path, "w") as file_stream:
+            json.dump(self.to_dict(), file_stream, indent=2)
+
+
+class profiler_overlay:
+    """
+    Draws the figures of a profiler on screen, averaged over recent frames. The figures are updated every
+    refresh_interval seconds so they stay readable. The text is drawn from a glyph atlas, so no texture is uploaded per
+    frame.
+    """
+    __slots__ = ("font", "x", "y", "refresh_interval", "frames", "lines", "last_refresh", "texts")
+
+    def __init__(self, parent: sdl_renderer, font: sdl_font, x: int = 8, y: int = 8, refresh_interval: float = 0.25,
+                 frames: int = 60):
+        """
+        Initializes a new overlay.\n
+        :param parent: The renderer to draw at.
+        :param font: The font of the text.
+        :param x: The x coordinate of the top left corner.
+        :param y: The y coordinate of the top left corner.
+        :param refresh_interval: Seconds between updates of the figures.
+        :param frames: The number of recent frames averaged.
+        """
+        self.font = font
+        self.x = x
+        self.y = y
+        self.refresh_interval = refresh_interval
+        self.frames = frames
+        self.lines: list[str] = []
+        self.last_refresh = float("-inf")
+        self.texts = sdl_text_cache(sdl_glyph_cache.get(font, parent), 64)
+
+    def get_lines(self, profiler: frame_profiler) -> list[str]:
+        mean = profiler.get_mean_row(self.frames)
+        frame_ms = mean["frame_ms"]
+        lines = ["frame %.2f ms (%.0f fps)" % (frame_ms, 1000.0 / frame_ms if frame_ms > 0 else 0.0)]
+        lines += ["%s %.2f ms" % (name, mean[name + "_ms"]) for name in PROFILER_PHASES]
+        lines.append("lines %.0f  notes %.0f  effects %.0f  draw calls %.0f" %
+                     (mean["lines_drawn"], mean["visible_notes"], mean["hit_effects"], mean["draw_calls"]))
+        return lines
+
+    def draw(self, profiler: frame_profiler):
+        """Draws the overlay over the current frame, updating the figures if it is due."""
+        now = time.perf_counter()
+        if now - self.last_refresh >= self.refresh_interval:
+            self.lines = self.get_lines(profiler)
+            self.last_refresh = now
+        y = self.y
+        for line in self.lines:
+            y += self.texts.draw(line, self.x, y).h
+
+    def destroy(self):
+        """Drops the cached texts. The glyphs are shared, see sdl_glyph_cache.destroy_all()."""
+        self.texts.clear()
@@ -0,0 +1,177 @@
+"""
+This module provides a fixed-capacity pool of hit effects. Effects live in preallocated arrays, so spawning and
+drawing them creates no effect objects, and a dense burst of hits produces no garbage.
+
+"""
+
+import random
+from array import array
+
+from sdl_render import *
+
+__all__ = ["hit_effect_pool", "HIT_EFFECT_DURATION", "HIT_EFFECT_PERFECT_COLOR", "HIT_EFFECT_FIELDS"]
+
+HIT_EFFECT_DURATION = 0.5
+HIT_EFFECT_PERFECT_COLOR = (0xff, 0xec, 0xa0)
+HIT_EFFECT_FIELDS = 4  # the values of every collected effect: progress, x, y, particle variant.
+
+_PARTICLE_VARIANTS = 64
+
+
+class hit_effect_pool:
+    """
+    Represents a ring of hit effects, ordered by start time.\n
+    Every effect stores its start time, its center, and the index of its particle offsets in a shared table of
+    variants. Since every effect lasts the same duration, effects expire in the order they are spawned, so the ring
+    only retires from its head. When the ring is full, the oldest effect is dropped.\n
+    Effects must be spawned in the order of their start time. If time moves backwards, clear the pool and spawn the
+    effects alive at the new time again.
+    """
+    __slots__ = ("capacity", "duration", "particles", "start_times", "xs", "ys", "variants", "head", "size",
+                 "offsets", "colors", "dropped", "rect", "scratch")
+
+    def __init__(self, capacity: int = 256, duration: float = HIT_EFFECT_DURATION, particles: int = 4,
+                 color: tuple[int, int, int] = HIT_EFFECT_PERFECT_COLOR, seed: int = 0):
+        """
+        Initializes a new pool.\n
+        :param capacity: The maximum number of effects alive at once.
+        :param duration: The duration of every effect in seconds.
+        :param particles: The number of particles of every effect.
+        :param color: The rgb color of the particles.
+        :param seed: The seed of the particle offset table, so the effects are the same for every run.
+        """
+        self.capacity = capacity
+        self.duration = duration
+        self.particles = particles
+        self.start_times = array("d", bytes(8 * capacity))
+        self.xs = array("d", bytes(8 * capacity))
+        self.ys = array("d", bytes(8 * capacity))
+        self.variants = array("i", bytes(4 * capacity))
+        self.head = 0
+        self.size = 0
+        self.dropped = 0
+
+        # unit directions scaled by a random reach in [0.5, 1], particles * 2 values per variant.
+        rng = random.Random(seed)
+        offsets = []
+        for _ in range(_PARTICLE_VARIANTS * particles):
+            angle = rng.uniform(0.0, 2.0 * pi)
+            reach = rng.uniform(0.5, 1.0)
+            offsets += (cos(angle) * reach, sin(angle) * reach)
+        self.offsets = array("d", offsets)
+        # one color per alpha value, so fading particles do not build new tuples.
+        self.colors = [(*color, a) for a in range(256)]
+        self.rect = SDL_Rect()  # reused when particles are drawn directly.
+        self.scratch = array("d")  # reused by draw().
+
+    def __len__(self):
+        return self.size
+
+    def clear(self):
+        self.head = 0
+        self.size = 0
+
+    def spawn(self, start_time: float, x: float, y: float, seed: int):
+        """
+        Adds an effect.\n
+        :param start_time: The real time the effect starts at.
+        :param x: The x coordinate of the center.
+        :param y: The y coordinate of the center.
+        :param seed: Selects the particle offsets, e.g. the index of the note in the chart.
+        :return: None.
+        """
+        capacity = self.capacity
+        if self.size == capacity:
+            self.head = (self.head + 1) % capacity
+            self.size -= 1
+            self.dropped += 1
+        i = (self.head + self.size) % capacity
+        self.start_times[i] = start_time
+        self.xs[i] = x
+        self.ys[i] = y
+        self.variants[i] = seed % _PARTICLE_VARIANTS
+        self.size += 1
+
+    def retire(self, real_time: float):
+        """Removes the effects which have ended before given time."""
+        start_times = self.start_times
+        end = real_time - self.duration
+        while self.size > 0 and start_times[self.head] <= end:
+            self.head = (self.head + 1) % self.capacity
+            self.size -= 1
+
+    def collect(self, real_time: float, effects: array):
+        """
+        Collects the effects which have started at given time.\n
+        :param real_time: The real time in seconds.
+        :param effects: The array to append the progress in [0, 1), the center and the particle variant of every
+            effect to, HIT_EFFECT_FIELDS values per effect.
+        :return: None.
+        """
+        capacity = self.capacity
+        duration = self.duration
+        start_times, xs, ys, variants = self.start_times, self.xs, self.ys, self.variants
+        i = self.head
+        for _ in range(self.size):
+            progress = (real_time - start_times[i]) / duration
+            if progress >= 0:
+                effects.extend((progress, xs[i], ys[i], variants[i]))
+            i = (i + 1) % capacity
+
+    def draw(self, batch: sdl_draw_batch, real_time: float, frames: list or None, frame_size: float,
+             particle_size: float, particle_reach: float):
+        """Draws every effect at given time, see draw_collected()."""
+        effects = self.scratch
+        del effects[:]
+        self.collect(real_time, effects)
+        self.draw_collected(batch, effects, frames, frame_size, particle_size, particle_reach)
+
+    def draw_collected(self, batch: sdl_draw_batch, effects: array, frames: list or None, frame_size: float,
+                       particle_size: float, particle_reach: float):
+        """
+        Draws collected effects: the sprite frame of every effect, then its particles.\n
+        :param batch: The draw batch. Sprites are drawn first and particles next, so each takes one submission.
+        :param effects: The effects collected by collect(), possibly by another pool of the same particle count
+            and seed.
+        :param frames: The animation frames, drawables with draw_batched(), e.g. the regions of a sprite sheet.
+            None to draw the particles only.
+        :param frame_size: The width and height of a drawn frame.
+        :param particle_size: The width and height of a particle when it spawns.
+        :param particle_reach: The distance the particles fly.
+        :return: None.
+        """
+        count = len(effects)
+        if frames:
+            frame_count = len(frames)
+            for k in range(0, count, HIT_EFFECT_FIELDS):
+                frame = frames[min(int(effects[k] * frame_count), frame_count - 1)]
+                frame.draw_batched(batch, effects[k + 1], effects[k + 2], frame_size, frame_size, 0.0)
+
+        particles = self.particles
+        offsets, colors = self.offsets, self.colors
+        direct = not batch.enabled
+        renderer = batch.parent
+        raw_col = renderer.draw_color
+        rect = self.rect
+        for k in range(0, count, HIT_EFFECT_FIELDS):
+            progress = effects[k]
+            center_x = effects[k + 1]
+            center_y = effects[k + 2]
+            reach = particle_reach * (1.0 - (1.0 - progress) ** 3)  # ease out.
+            size = particle_size * (1.0 - progress * 0.5)
+            color = colors[int(255 * (1.0 - progress))]
+            j = int(effects[k + 3]) * particles * 2
+            for _ in range(particles):
+                x = center_x + offsets[j] * reach
+                y = center_y + offsets[j + 1] * reach
+                if direct:
+                    renderer.set_draw_color(*color)
+                    rect.x = int(x - size / 2)
+                    rect.y = int(y - size / 2)
+                    rect.w = rect.h = int(size)
+                    renderer.fill_area(rect)
+                else:
+                    batch.add_quad(None, x, y, size, size, 0.0, color=color)
+                j += 2
+        if direct:
+            renderer.set_draw_color(*raw_col)
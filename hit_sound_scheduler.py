@@ -0,0 +1,143 @@
+"""
+This module schedules hit sounds on the audio thread, so every sound starts at the exact sample its note is hit at,
+however long a frame takes to render.
+
+The note start samples are computed once. SDL_mixer's post-mix hook then walks them with a cursor, counting mixed
+samples as its clock, and adds the hit sounds into the stream. The render loop is not involved, so a stalled frame
+delays no sound. Each callback only visits the notes starting in the buffer it mixes and the sounds still playing,
+so its work does not grow with the chart. NumPy is required.
+
+"""
+
+import threading
+from bisect import bisect_left
+from ctypes import byref, c_int, c_uint16
+
+try:
+    import numpy as np
+except ImportError:  # only required by this module.
+    np = None
+
+import sdl2
+from sdl2.sdlmixer import Mix_QuerySpec, Mix_SetPostMix, mix_func
+
+from chart import phi_note
+from wav_audio import audio_file
+
+__all__ = ["hit_sound_scheduler"]
+
+
+def _chunk_to_array(sound: audio_file, channels: int):
+    """Copies the samples of a loaded chunk, which SDL_mixer stores in the device format, into an int16 array."""
+    chunk = sound.sound_object.contents
+    data = np.ctypeslib.as_array(chunk.abuf, shape=(chunk.alen,))
+    return data.view(np.int16)[:chunk.alen // (2 * channels) * channels].reshape(-1, channels).copy()
+
+
+class hit_sound_scheduler:
+    """
+    Represents a hit sound scheduler hooked into the SDL_mixer output.\n
+    Its clock is the number of samples mixed since start(), so audio_time may drive the renderer as well. The audio
+    thread starts every sound itself at the sample its note is hit at, whatever the render loop is doing.
+    """
+    __slots__ = ("rate", "channels", "note_starts", "note_sounds", "cursor", "voices", "position", "lock",
+                 "callback", "mix_buffer", "running")
+
+    def __init__(self, notes: list[phi_note], offset: float, sound_map: dict[int, audio_file]):
+        """
+        Initializes a new scheduler. The audio device must be open, see audio_file.init().\n
+        :param notes: The notes sorted by real time, usually phi_chart.notes.
+        :param offset: The chart offset in seconds. A note at real time t is hit at t + offset in the song.
+        :param sound_map: Maps note types to their hit sounds, e.g. global_resource.note_sound_map.
+        """
+        if np is None:
+            raise ImportError("NumPy is required for the hit sound scheduler.")
+        freq = c_int(0)
+        fmt = c_uint16(0)
+        channels = c_int(0)
+        if Mix_QuerySpec(byref(freq), byref(fmt), byref(channels)) == 0:
+            raise RuntimeError("The audio device is not open.")
+        if fmt.value != sdl2.AUDIO_S16SYS:
+            raise ValueError("The hit sound scheduler requires signed 16 bit native endian audio.")
+        self.rate = freq.value
+        self.channels = channels.value
+
+        arrays = {}
+        copies = {}  # sounds shared by several note types are copied once.
+        for note_type, sound in sound_map.items():
+            if sound is None:
+                continue
+            if id(sound) not in copies:
+                copies[id(sound)] = _chunk_to_array(sound, self.channels)
+            arrays[note_type] = copies[id(sound)]
+        scheduled = [n for n in notes if n.note_type in arrays]
+        self.note_starts: list[int] = [int(round((n.real_time + offset) * self.rate)) for n in scheduled]
+        self.note_sounds: list = [arrays[n.note_type] for n in scheduled]
+        self.cursor: int = 0  # the next note to start, only moved by the audio thread and seek().
+
+        self.voices: list = []  # (start sample, samples) pairs of the sounds playing.
+        self.position: int = 0
+        self.lock = threading.Lock()
+        self.mix_buffer = np.zeros((0, self.channels), dtype=np.int32)
+        self.callback = mix_func(self._post_mix)  # keeps the callback object alive while it is hooked.
+        self.running = False
+
+    @property
+    def audio_time(self) -> float:
+        """The time in seconds since the song starts, counted in mixed samples."""
+        return self.position / self.rate
+
+    def start(self, audio_time: float = 0.0):
+        """Hooks the scheduler into the mixer output, with its clock at given song time."""
+        self.seek(audio_time)
+        Mix_SetPostMix(self.callback, None)
+        self.running = True
+
+    def stop(self):
+        """Unhooks the scheduler. Sounds already playing are cut."""
+        if self.running:
+            Mix_SetPostMix(mix_func(0), None)
+            self.running = False
+
+    def seek(self, audio_time: float):
+        """Moves the clock to given song time, dropping the scheduled and playing sounds."""
+        position = int(round(audio_time * self.rate))
+        with self.lock:
+            self.voices = []
+            self.position = position
+            self.cursor = bisect_left(self.note_starts, position)
+
+    def _post_mix(self, udata, stream, length: int):
+        with self.lock:
+            channels = self.channels
+            frames = length // (2 * channels)
+            begin = self.position
+            end = begin + frames
+            voices = self.voices
+            starts = self.note_starts
+            count = len(starts)
+            c = self.cursor
+            while c < count and starts[c] < end:
+                voices.append((starts[c], self.note_sounds[c]))
+                c += 1
+            self.cursor = c
+
+            if voices:
+                out = np.ctypeslib.as_array(stream, shape=(length,)).view(np.int16).reshape(frames, channels)
+                if len(self.mix_buffer) < frames:
+                    self.mix_buffer = np.zeros((frames, channels), dtype=np.int32)
+                mix = self.mix_buffer[:frames]
+                mix[:] = out
+                remaining = []
+                for start, samples in voices:
+                    sound_end = start + len(samples)
+                    a = max(start, begin)
+                    b = min(sound_end, end)
+                    if a < b:
+                        mix[a - begin:b - begin] += samples[a - start:b - start]
+                    if sound_end > end:
+                        remaining.append((start, samples))
+                np.clip(mix, -32768, 32767, out=mix)
+                out[:] = mix
+                self.voices = remaining
+            self.position = end
@@ -0,0 +1,320 @@
+"""
+This module provides headless offline rendering. Frames are rendered by the software renderer into a hidden window,
+read back into one reused buffer and streamed to a frame sink: a raw or Y4M file, stdout, or an encoder process.
+
+No display and no audio device is required. Call init_headless() before creating any renderer.
+
+"""
+
+import argparse
+import ctypes
+import os
+import subprocess
+import sys
+from math import ceil
+
+from sdl2 import SDL_Init, SDL_INIT_VIDEO, SDL_SetHint, SDL_HINT_RENDER_DRIVER, SDL_GetError
+from sdl2.pixels import SDL_PIXELFORMAT_ABGR8888, SDL_PIXELFORMAT_ARGB8888, SDL_PIXELFORMAT_RGB24, \
+    SDL_PIXELFORMAT_IYUV
+
+from chart import phi_chart, open_chart_file
+from chart_renderer import chart_renderer, render_options
+from frame_profiler import PHASE_PRESENT, PHASE_OUTPUT
+from sdl_render import sdl_window, sdl_renderer, sdl_surface, SDL_FreeSurface
+from sdl_image import sdl_image
+from resource_loader import decode_illustration
+from resource_manager import resource_manager, find_skin_images
+
+__all__ = ["init_headless", "frame_reader", "frame_sink", "raw_frame_sink", "y4m_frame_sink", "encoder_pipe_sink",
+           "get_ffmpeg_command", "get_chart_duration", "offline_renderer", "PIXEL_FORMATS"]
+
+# name -> (SDL pixel format, ffmpeg pixel format name). Byte orders are as stored in memory.
+PIXEL_FORMATS: dict[str, tuple[int, str]] = {
+    "rgba": (SDL_PIXELFORMAT_ABGR8888, "rgba"),
+    "bgra": (SDL_PIXELFORMAT_ARGB8888, "bgra"),
+    "rgb24": (SDL_PIXELFORMAT_RGB24, "rgb24"),
+    "yuv420p": (SDL_PIXELFORMAT_IYUV, "yuv420p"),
+}
+
+
+def init_headless():
+    """Initializes SDL video for offline rendering: the dummy video driver unless set, and the software renderer."""
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    SDL_SetHint(SDL_HINT_RENDER_DRIVER, b"software")
+    if SDL_Init(SDL_INIT_VIDEO) != 0:
+        raise RuntimeError("SDL_Init failed: %s" % SDL_GetError().decode("utf-8", "replace"))
+
+
+class frame_reader:
+    """Reads the frames of a renderer into one preallocated buffer, which is reused for every frame."""
+    __slots__ = ("renderer", "width", "height", "pixel_format", "format_name", "pitch", "buffer", "c_buffer",
+                 "view")
+
+    def __init__(self, renderer: sdl_renderer, width: int, height: int, pixel_format: str = "rgba"):
+        """
+        Initializes a new reader.\n
+        :param renderer: The renderer to read from.
+        :param width: The width of the frames in pixels.
+        :param height: The height of the frames in pixels.
+        :param pixel_format: One of the keys of PIXEL_FORMATS. yuv420p requires even dimensions.
+        """
+        if pixel_format not in PIXEL_FORMATS:
+            raise ValueError("Unknown pixel format: %s" % pixel_format)
+        self.renderer = renderer
+        self.width = width
+        self.height = height
+        self.format_name = pixel_format
+        self.pixel_format = PIXEL_FORMATS[pixel_format][0]
+        if pixel_format == "yuv420p":
+            if width % 2 != 0 or height % 2 != 0:
+                raise ValueError("yuv420p frames require even width and height.")
+            self.pitch = width
+            size = width * height * 3 // 2
+        else:
+            self.pitch = width * (3 if pixel_format == "rgb24" else 4)
+            size = self.pitch * height
+        self.buffer = bytearray(size)
+        self.c_buffer = (ctypes.c_ubyte * size).from_buffer(self.buffer)
+        self.view = memoryview(self.buffer)
+
+    @property
+    def frame_size(self) -> int:
+        return len(self.buffer)
+
+    def read(self) -> memoryview:
+        """
+        Reads the current frame.\n
+        :return: A view of the internal buffer. It is overwritten by the next read.
+        """
+        if self.renderer.read_pixels(self.c_buffer, self.pixel_format, self.pitch) != 0:
+            raise RuntimeError("SDL_RenderReadPixels failed: %s" % SDL_GetError().decode("utf-8", "replace"))
+        return self.view
+
+
+class frame_sink:
+    """Represents a destination of rendered frames."""
+
+    def write(self, frame: memoryview):
+        raise NotImplementedError("Frame sink write operation not implemented.")
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class raw_frame_sink(frame_sink):
+    """Writes raw frames back to back into a binary stream. Path "-" stands for stdout."""
+    __slots__ = ("stream", "owns_stream")
+
+    def __init__(self, destination: str or object = "-"):
+        """
+        Initializes a new sink.\n
+        :param destination: A file path, "-" for stdout, or a writable binary stream.
+        """
+        if destination == "-":
+            self.stream = sys.stdout.buffer
+            self.owns_stream = False
+        elif isinstance(destination, str):
+            self.stream = open(destination, "wb")
+            self.owns_stream = True
+        else:
+            self.stream = destination
+            self.owns_stream = False
+
+    def write(self, frame: memoryview):
+        self.stream.write(frame)
+
+    def close(self):
+        if self.owns_stream:
+            self.stream.close()
+        else:
+            self.stream.flush()
+
+
+class y4m_frame_sink(raw_frame_sink):
+    """Writes frames as a YUV4MPEG2 stream. Frames must be read with the yuv420p pixel format."""
+    __slots__ = ("header_written", "header")
+
+    def __init__(self, destination: str or object, width: int, height: int, fps: int):
+        super(y4m_frame_sink, self).__init__(destination)
+        self.header = ("YUV4MPEG2 W%d H%d F%d:1 Ip A1:1 C420jpeg\n" % (width, height, fps)).encode("ascii")
+        self.header_written = False
+
+    def write(self, frame: memoryview):
+        if not self.header_written:
+            self.stream.write(self.header)
+            self.header_written = True
+        self.stream.write(b"FRAME\n")
+        self.stream.write(frame)
+
+
+def get_ffmpeg_command(output_path: str, width: int, height: int, fps: int, pixel_format: str = "rgba",
+                       codec_args: tuple[str, ...] = ("-c:v", "libx264", "-pix_fmt", "yuv420p"),
+                       audio_path: str = "") -> list[str]:
+    """
+    Builds an ffmpeg command line which encodes raw frames read from its stdin, muxed with the music of the chart if
+    an audio file is given. The output ends with the shorter of the two.
+    """
+    audio_args = ("-i", audio_path, "-c:a", "aac", "-shortest") if audio_path != "" else ()
+    return ["ffmpeg", "-loglevel", "error", "-y", "-f", "rawvideo", "-pix_fmt", PIXEL_FORMATS[pixel_format][1],
+            "-s", "%dx%d" % (width, height), "-r", str(fps), "-i", "-", *audio_args, *codec_args, output_path]
+
+
+class encoder_pipe_sink(frame_sink):
+    """Streams raw frames into the stdin of a local encoder process, e.g. ffmpeg."""
+    __slots__ = ("process",)
+
+    def __init__(self, command: list[str]):
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def write(self, frame: memoryview):
+        self.process.stdin.write(frame)
+
+    def close(self):
+        if self.process.stdin is not None and not self.process.stdin.closed:
+            self.process.stdin.close()
+        code = self.process.wait()
+        if code != 0:
+            raise RuntimeError("Encoder exited with code %d." % code)
+
+
+class offline_renderer:
+    """Renders a chart into a hidden window with the software renderer, and streams the frames to a sink."""
+    __slots__ = ("window", "renderer", "reader", "options")
+
+    def __init__(self, chart: phi_chart, options: render_options, illustration_path: str = "",
+                 pixel_format: str = "rgba", window: sdl_window or None = None, cache_dir: str or None = None,
+                 resources=None):
+        """
+        Initializes a new offline renderer.\n
+        :param chart: The chart to render.
+        :param options: Render options. The frame size is options.width x options.height.
+        :param illustration_path: The path to the illustration image. Empty for no background.
+        :param pixel_format: The pixel format of the frames, one of the keys of PIXEL_FORMATS.
+        :param window: A hidden window to reuse. None to create one, which is destroyed with this renderer.
+        :param cache_dir: The directory where the illustration scaled to the frame size is cached. None to scale it
+            without caching.
+        :param resources: A resource_manager of the window to acquire the illustration from, so charts sharing an
+            illustration load it once. cache_dir is ignored then, see resource_manager.cache_dir.
+        """
+        self.options = options
+        self.window = sdl_window("Autoplay", options.width, options.height, hidden=True, software=True) \
+            if window is None else window
+        background = None if resources is not None else self.load_background(illustration_path, cache_dir)
+        self.renderer = chart_renderer(chart, options, illustration_path, window=self.window, play_sounds=False,
+                                       background=background, resources=resources)
+        self.renderer.owns_window = window is None
+        self.reader = frame_reader(self.window.renderer, options.width, options.height, pixel_format)
+
+    def load_background(self, illustration_path: str, cache_dir: str or None = None) -> sdl_image or None:
+        """Loads an illustration scaled to the frame size, or returns None if the path is empty."""
+        if illustration_path == "":
+            return None
+        surface = decode_illustration(illustration_path, self.options.width, self.options.height, cache_dir)
+        try:
+            return sdl_image(sdl_surface(surface), self.window.renderer)
+        finally:
+            SDL_FreeSurface(surface)
+
+    def load_chart(self, chart: phi_chart, illustration_path: str = "", cache_dir: str or None = None):
+        """
+        Replaces the chart and illustration, keeping the window, the frame buffer and the options, see
+        chart_renderer.load_chart(). The next frame rendered is frame 0 of the new chart.\n
+        :param chart: The chart to render.
+        :param illustration_path: The path to the illustration image. Empty for no background.
+        :param cache_dir: The directory of the scaled illustration cache, unless the renderer has a resource_manager.
+        :return: None.
+        """
+        renderer = self.renderer
+        renderer.unload_chart()  # frees the previous illustration before the next one is loaded.
+        background = None if renderer.resources is not None else self.load_background(illustration_path, cache_dir)
+        renderer.load_chart(chart, illustration_path, background)
+
+    def get_frame_count(self, duration: float) -> int:
+        """Gets the number of frames covering given duration in seconds."""
+        return int(ceil(duration * self.options.fps))
+
+    def render(self, sink: frame_sink, frame_count: int, start_frame: int = 0) -> int:
+        """
+        Renders a range of frames into a sink.\n
+        :param sink: The frame sink.
+        :param frame_count: The number of frames to render.
+        :param start_frame: The first frame to render.
+        :return: The number of frames rendered.
+        """
+        renderer = self.renderer
+        reader = self.reader
+        renderer.seek_frame(start_frame)
+        profiler = renderer.profiler
+        for _ in range(frame_count):
+            renderer.render_frame()
+            if profiler is not None:
+                profiler.skip()
+            frame = reader.read()
+            if profiler is not None:
+                profiler.mark(PHASE_PRESENT)
+            sink.write(frame)
+            if profiler is not None:
+                profiler.mark(PHASE_OUTPUT)
+        return frame_count
+
+    def destroy(self):
+        self.renderer.destroy()
+
+
+def get_chart_duration(chart: phi_chart, tail: float = 1.0) -> float:
+    """Gets the duration in seconds from the chart start to the end of the last note, plus a tail."""
+    end = max((n.real_time + n.real_hold_time for n in chart.notes), default=0.0)
+    return max(0.0, end + chart.offset + tail)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Renders a chart offline into raw frames, a Y4M file or ffmpeg.")
+    parser.add_argument("chart", help="chart json file")
+    parser.add_argument("output", help="output file, or - for stdout")
+    parser.add_argument("--sink", choices=("raw", "y4m", "ffmpeg"), default="raw")
+    parser.add_argument("--pixel-format", choices=tuple(PIXEL_FORMATS.keys()), default="rgba",
+                        help="pixel format of raw and ffmpeg output; y4m always uses yuv420p")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--fps", type=int, default=60)
+    parser.add_argument("--illustration", default="", help="illustration image file")
+    parser.add_argument("--cache-dir", help="directory to cache the illustration scaled to the frame size in")
+    parser.add_argument("--skin", help="directory of note images named as global_resource.image_names, e.g. tap.png")
+    parser.add_argument("--hit-effect", default="", help="hit effect sprite sheet")
+    parser.add_argument("--duration", type=float, help="seconds to render; defaults to the end of the last note")
+    args = parser.parse_args()
+
+    init_headless()
+    chart = open_chart_file(args.chart)
+    options = render_options(args.width, args.height, args.fps)
+    pixel_format = "yuv420p" if args.sink == "y4m" else args.pixel_format
+    renderer = offline_renderer(chart, options, args.illustration, pixel_format, cache_dir=args.cache_dir)
+    resources = resource_manager(renderer.window.renderer)
+    if args.skin is not None:
+        resources.load_skin(find_skin_images(args.skin), atlas=True)
+    if args.hit_effect != "":
+        resources.load_hit_effect(args.hit_effect)
+    duration = get_chart_duration(chart) if args.duration is None else args.duration
+
+    if args.sink == "y4m":
+        sink = y4m_frame_sink(args.output, args.width, args.height, args.fps)
+    elif args.sink == "ffmpeg":
+        sink = encoder_pipe_sink(get_ffmpeg_command(args.output, args.width, args.height, args.fps, pixel_format))
+    else:
+        sink = raw_frame_sink(args.output)
+    try:
+        with sink:
+            renderer.render(sink, renderer.get_frame_count(duration))
+    finally:
+        resources.destroy()
+        renderer.destroy()
+
+
+if __name__ == "__main__":
+    main()
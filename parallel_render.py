@@ -0,0 +1,145 @@
+"""
+This module provides parallel segmented rendering. A song is split into frame ranges, every range is rendered by a
+worker process positioned directly at its first frame, and the outputs are joined in order into one frame sink. Each
+worker sets up its headless window, chart and images once, and reuses them for every range it renders.
+
+Every frame only depends on its frame index, so the joined output equals a single-process render. Worker processes
+are spawned, so callers must guard their entry point with ``if __name__ == "__main__":``.
+
+"""
+
+import atexit
+import multiprocessing
+import os
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from chart import open_chart_file
+from chart_renderer import render_options, global_resource
+from offline_render import init_headless, offline_renderer, raw_frame_sink, frame_sink
+from resource_loader import resource_loader
+
+__all__ = ["render_job", "split_frames", "init_segment_worker", "render_segment", "render_parallel"]
+
+_worker_renderer: offline_renderer or None = None  # the renderer of a worker process, see init_segment_worker().
+
+
+class render_job:
+    """Represents everything a worker process needs to render frames of a chart. It must stay picklable."""
+    __slots__ = ("chart_path", "options", "illustration_path", "image_paths", "pixel_format", "cache_dir")
+
+    def __init__(self, chart_path: str, options: render_options, illustration_path: str = "",
+                 image_paths: dict[str, str] or None = None, pixel_format: str = "rgba",
+                 cache_dir: str or None = None):
+        """
+        Initializes a new job.\n
+        :param chart_path: The path to the chart file.
+        :param options: Render options.
+        :param illustration_path: The path to the illustration image. Empty for no background.
+        :param image_paths: Note images to load, see global_resource.init_images().
+        :param pixel_format: The pixel format of the frames, see offline_render.PIXEL_FORMATS.
+        :param cache_dir: The directory of the scaled illustration cache, shared by the workers. None to scale it
+            in every worker.
+        """
+        self.chart_path = chart_path
+        self.options = options
+        self.illustration_path = illustration_path
+        self.image_paths = {} if image_paths is None else image_paths
+        self.pixel_format = pixel_format
+        self.cache_dir = cache_dir
+
+
+def split_frames(frame_count: int, segments: int) -> list[tuple[int, int]]:
+    """Splits frames into at most given number of contiguous (start frame, frame count) ranges of similar length."""
+    segments = max(1, min(segments, frame_count))
+    base, extra = divmod(frame_count, segments)
+    ranges = []
+    start = 0
+    for i in range(segments):
+        count = base + (1 if i < extra else 0)
+        ranges.append((start, count))
+        start += count
+    return ranges
+
+
+def init_segment_worker(job: render_job):
+    """Sets up the renderer of a worker process once: the headless window, the chart, the illustration and images."""
+    global _worker_renderer
+    init_headless()
+    with resource_loader() as loader:
+        # the note images decode while the chart is parsed.
+        images = {}
+        for name, path in job.image_paths.items():
+            if name not in global_resource.image_names:
+                raise ValueError("Unknown note image: %s" % name)
+            images[name] = loader.submit_image(path)
+        chart = open_chart_file(job.chart_path, compact=True)
+        renderer = offline_renderer(chart, job.options, job.illustration_path, job.pixel_format,
+                                    cache_dir=job.cache_dir)
+        try:
+            for name, future in images.items():
+                setattr(global_resource, name, loader.upload_image(future, renderer.window.renderer))
+        except BaseException:
+            renderer.destroy()
+            raise
+    _worker_renderer = renderer
+    atexit.register(renderer.destroy)
+
+
+def render_segment(start_frame: int, frame_count: int, output_path: str) -> int:
+    """
+    Renders a range of frames into a raw file, with the renderer of init_segment_worker(). This is the entry point of
+    the worker processes.\n
+    :return: The frame size in bytes.
+    """
+    renderer = _worker_renderer
+    with raw_frame_sink(output_path) as sink:
+        renderer.render(sink, frame_count, start_frame)
+    return renderer.reader.frame_size
+
+
+def _copy_frames(path: str, frame_size: int, frame_count: int, sink: frame_sink):
+    buffer = bytearray(frame_size)
+    view = memoryview(buffer)
+    with open(path, "rb") as file_stream:
+        for _ in range(frame_count):
+            if file_stream.readinto(buffer) != frame_size:
+                raise RuntimeError("Segment file %s is truncated." % path)
+            sink.write(view)
+
+
+def render_parallel(job: render_job, sink: frame_sink, frame_count: int, workers: int or None = None,
+                    segments: int or None = None, temp_dir: str or None = None) -> int:
+    """
+    Renders frames [0, frame_count) of a job in worker processes, and writes them to a sink in order.\n
+    :param job: The render job.
+    :param sink: The frame sink. It is written by the calling process only, frame by frame.
+    :param frame_count: The number of frames to render.
+    :param workers: The number of worker processes. None to use every core.
+    :param segments: The number of frame ranges. None for four per worker, so workers stay busy until the end. At
+        most workers + 1 ranges are rendered ahead of the sink, which bounds the space taken by segment files.
+    :param temp_dir: The directory of the intermediate segment files. None for the system default.
+    :return: The number of frames written.
+    """
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    segments = workers * 4 if segments is None else segments
+    ranges = split_frames(frame_count, segments)
+
+    with tempfile.TemporaryDirectory(dir=temp_dir) as directory:
+        paths = [os.path.join(directory, "segment_%d.raw" % i) for i in range(len(ranges))]
+        context = multiprocessing.get_context("spawn")  # every worker initializes SDL of its own.
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=init_segment_worker,
+                                 initargs=(job,)) as executor:
+            pending = deque()
+            submitted = 0
+            # join in order; later segments keep rendering while earlier ones are copied.
+            for (_, count), path in zip(ranges, paths):
+                while submitted < len(ranges) and len(pending) <= workers:
+                    start, next_count = ranges[submitted]
+                    pending.append(executor.submit(render_segment, start, next_count, paths[submitted]))
+                    submitted += 1
+                frame_size = pending.popleft().result()
+                _copy_frames(path, frame_size, count, sink)
+                os.remove(path)
+    return frame_count
@@ -0,0 +1,258 @@
+"""
+This module pipelines rendering: a producer computes the frame descriptors of the frames ahead, while the render
+thread only draws them.
+
+The producer has line and hit effect state of its own, built without a window, so it makes no SDL call. It stays at
+most depth frames ahead of the render thread. In a thread, the descriptors are recycled through a ring of depth slots,
+so none is allocated per frame; the two phases overlap on free-threaded builds and PyPy, and partly on CPython, since
+ctypes releases the GIL during SDL calls. In a process, which avoids the GIL on CPython, every descriptor is pickled
+through a bounded queue. Processes are spawned, so callers must guard their entry point with
+``if __name__ == "__main__":``.
+
+"""
+
+import multiprocessing
+import platform
+import queue
+import sys
+import threading
+
+from chart import phi_chart, open_chart_file
+from chart_renderer import *
+from frame_clock import frame_clock
+from offline_render import offline_renderer, frame_sink
+
+__all__ = ["frame_producer", "frame_pipeline", "is_free_threaded", "render_pipelined", "PIPELINE_MODES"]
+
+PIPELINE_MODES = ("thread", "process")
+
+
+def is_free_threaded() -> bool:
+    """Checks whether Python threads run in parallel: on a free-threaded build with the GIL disabled, or PyPy."""
+    if platform.python_implementation() == "PyPy":
+        return True
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled is not None and not is_gil_enabled()
+
+
+class frame_producer:
+    """Computes the frame descriptors of a chart frame by frame, without any window or SDL call."""
+    __slots__ = ("clock", "counters", "line_renderers", "hit_effects", "baked_states")
+
+    def __init__(self, chart: phi_chart, options: render_options, baked_states: line_state_bake or None = None):
+        """
+        Initializes a new producer at frame 0.\n
+        :param chart: The chart. Its timelines are only read, but their cursors move, so no other renderer may
+            update the same chart object at the same time.
+        :param options: Render options, at the size of the render target, e.g. chart_renderer.options.
+        :param baked_states: Line states to look up instead of evaluating events, e.g. chart_renderer.baked_states.
+        """
+        self.clock = frame_clock(options.fps, chart.offset)
+        self.counters = render_counters()
+        self.line_renderers = [judge_line_renderer(line, None, options, self.clock, None, self.counters)
+                               for line in chart.lines]
+        self.hit_effects = hit_effect_renderer(chart.notes, self.line_renderers, options, self.clock, None)
+        self.baked_states = baked_states
+
+    def seek_frame(self, frame_index: int):
+        """Positions the producer at given frame. The next descriptor produced is that of the frame."""
+        self.clock.seek_frame(frame_index)
+        self.hit_effects.seek()
+
+    def produce(self, descriptor: frame_descriptor):
+        """Fills a descriptor with the current frame and advances to the next one."""
+        self.hit_effects.update()
+        update_line_states(self.line_renderers, self.baked_states, self.clock.frame_index)
+        collect_frame(descriptor, self.clock, self.line_renderers, self.hit_effects)
+        self.counters.frames += 1
+        self.clock.advance()
+
+
+def _produce_in_thread(producer: frame_producer, frame_count: int, free: queue.Queue, filled: queue.Queue,
+                       stop_event: threading.Event):
+    try:
+        for _ in range(frame_count):
+            descriptor = free.get()
+            if descriptor is None or stop_event.is_set():
+                break
+            producer.produce(descriptor)
+            filled.put(descriptor)
+        filled.put(None)
+    except BaseException as e:
+        filled.put(e)
+
+
+def _produce_in_process(chart_path: str, options: render_options, start_frame: int, frame_count: int,
+                        filled, stop_event):
+    """The entry point of the producer process."""
+    try:
+        producer = frame_producer(open_chart_file(chart_path, compact=True), options)
+        producer.seek_frame(start_frame)
+        for _ in range(frame_count):
+            if stop_event.is_set():
+                break
+            # the queue pickles in a feeder thread later, so a descriptor cannot be reused.
+            descriptor = frame_descriptor()
+            producer.produce(descriptor)
+            filled.put(descriptor)
+        filled.put(None)
+    except BaseException as e:
+        filled.put(e)
+
+
+class frame_pipeline:
+    """
+    Draws the frames of a chart renderer from descriptors computed ahead by a producer thread or process.\n
+    While the pipeline runs, the state of the renderer is not updated: its lines, notes and hit effects are drawn
+    from the descriptors, and only its clock and hit sounds follow the frames drawn.
+    """
+    __slots__ = ("renderer", "depth", "mode", "chart_path", "producer", "worker", "free", "filled", "stop_event",
+                 "frames_left", "stalls")
+
+    def __init__(self, renderer: chart_renderer, depth: int = 4, mode: str or None = None,
+                 chart_path: str or None = None):
+        """
+        Initializes a new pipeline.\n
+        :param renderer: The chart renderer which draws the frames.
+        :param depth: The most frames the producer computes ahead.
+        :param mode: "thread" or "process", see PIPELINE_MODES. None for a process on CPython with the GIL if a chart
+            path is given, and a thread otherwise.
+        :param chart_path: The path to the chart file of the renderer, which a producer process loads.
+        """
+        if mode is None:
+            mode = "process" if chart_path is not None and not is_free_threaded() else "thread"
+        if mode not in PIPELINE_MODES:
+            raise ValueError("Unknown pipeline mode: %s" % mode)
+        if mode == "process" and chart_path is None:
+            raise ValueError("A producer process requires the path to the chart file.")
+        self.renderer = renderer
+        self.depth = max(1, depth)
+        self.mode = mode
+        self.chart_path = chart_path
+        self.producer: frame_producer or None = None
+        self.worker = None
+        self.free = None
+        self.filled = None
+        self.stop_event = None
+        self.frames_left = 0
+        self.stalls = 0  # frames the render thread waited for, because the producer fell behind.
+
+    @property
+    def running(self) -> bool:
+        return self.worker is not None
+
+    def start(self, start_frame: int, frame_count: int):
+        """
+        Starts producing frames [start_frame, start_frame + frame_count), and positions the renderer at the first.\n
+        :param start_frame: The first frame.
+        :param frame_count: The number of frames.
+        :return: None.
+        """
+        self.stop()
+        renderer = self.renderer
+        renderer.seek_frame(start_frame)
+        self.frames_left = frame_count
+        self.stalls = 0
+        if self.mode == "thread":
+            self.producer = frame_producer(renderer.chart_object, renderer.options, renderer.baked_states)
+            self.producer.seek_frame(start_frame)
+            self.free = queue.Queue()
+            for _ in range(self.depth):
+                self.free.put(frame_descriptor())
+            self.filled = queue.Queue()
+            self.stop_event = threading.Event()
+            self.worker = threading.Thread(target=_produce_in_thread, daemon=True,
+                                           args=(self.producer, frame_count, self.free, self.filled,
+                                                 self.stop_event))
+        else:
+            context = multiprocessing.get_context("spawn")
+            self.producer = None
+            self.free = None
+            self.filled = context.Queue(self.depth)
+            self.stop_event = context.Event()
+            self.worker = context.Process(target=_produce_in_process, daemon=True,
+                                          args=(self.chart_path, renderer.options, start_frame, frame_count,
+                                                self.filled, self.stop_event))
+        self.worker.start()
+
+    def get_descriptor(self) -> frame_descriptor or None:
+        """Waits for the next descriptor. None if every frame is drawn."""
+        if self.frames_left <= 0 or self.worker is None:
+            return None
+        if self.filled.empty():
+            self.stalls += 1
+        item = self.filled.get()
+        if isinstance(item, BaseException):
+            self.stop()
+            raise item
+        if item is None:
+            self.frames_left = 0
+            return None
+        self.frames_left -= 1
+        return item
+
+    def render_frame(self) -> bool:
+        """
+        Plays the hit sounds of the next frame, draws it and advances the clock of the renderer. The frame is not
+        presented.\n
+        :return: False if every frame is drawn already.
+        """
+        descriptor = self.get_descriptor()
+        if descriptor is None:
+            return False
+        renderer = self.renderer
+        renderer.update_sounds()
+        renderer.submit_frame(descriptor)
+        renderer.clock.advance()
+        if self.free is not None:
+            self.free.put(descriptor)
+        return True
+
+    def stop(self):
+        """Stops the producer, dropping the frames computed but not drawn."""
+        if self.worker is None:
+            return
+        self.stop_event.set()
+        if self.free is not None:
+            self.free.put(None)  # wakes the producer thread if it waits for a free slot.
+        # drain the queue, so a producer blocked on a full queue can see the stop event.
+        while self.worker.is_alive():
+            try:
+                self.filled.get(timeout=0.05)
+            except queue.Empty:
+                pass
+        self.worker.join()
+        if self.mode == "process":
+            self.filled.close()
+        self.worker = None
+        self.frames_left = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+def render_pipelined(renderer: offline_renderer, sink: frame_sink, frame_count: int, start_frame: int = 0,
+                     depth: int = 4, mode: str or None = None, chart_path: str or None = None) -> int:
+    """
+    Renders a range of frames into a sink, like offline_renderer.render(), with the frame state computed ahead by a
+    producer.\n
+    :param renderer: The offline renderer.
+    :param sink: The frame sink.
+    :param frame_count: The number of frames to render.
+    :param start_frame: The first frame to render.
+    :param depth: The most frames the producer computes ahead.
+    :param mode: "thread" or "process", see frame_pipeline.
+    :param chart_path: The path to the chart file, required by a producer process.
+    :return: The number of frames rendered.
+    """
+    reader = renderer.reader
+    count = 0
+    with frame_pipeline(renderer.renderer, depth, mode, chart_path) as pipeline:
+        pipeline.start(start_frame, frame_count)
+        while pipeline.render_frame():
+            sink.write(reader.read())
+            count += 1
+    return count
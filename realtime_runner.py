@@ -0,0 +1,301 @@
+"""
+This module provides the real-time main loop for previewing a chart with its music.
+
+The chart time follows an audio clock instead of counting rendered frames, so the preview stays in sync with the
+music however long frames take. The clock is the sample count of the hit sound scheduler if hit sounds are played,
+else the position of the music. When rendering falls behind, the frames in between are updated but not drawn. When
+it runs ahead, presenting waits until the next frame is due.
+
+"""
+
+import argparse
+import time
+from array import array
+from math import ceil
+
+from sdl2 import SDL_Init, SDL_INIT_VIDEO, SDL_INIT_AUDIO
+from sdl2.sdlmixer import Mix_LoadMUS, Mix_PlayMusic, Mix_SetMusicPosition, Mix_HaltMusic, Mix_FreeMusic, \
+    Mix_GetError, Mix_GetMusicPosition, Mix_PlayingMusic
+
+from chart import open_chart_file
+from chart_renderer import chart_renderer, render_options, global_resource
+from frame_profiler import frame_profiler, profiler_overlay, PHASE_FLUSH, PHASE_PRESENT
+from hit_sound_scheduler import hit_sound_scheduler
+from resource_manager import resource_manager, find_skin_images, find_hit_sounds
+from wav_audio import audio_file
+
+__all__ = ["pacing_stats", "wall_clock", "music_clock", "realtime_runner"]
+
+
+class pacing_stats:
+    """Collects the intervals between presented frames, and counts the frames presented and dropped."""
+    __slots__ = ("capacity", "frame_times", "index", "count", "frames_presented", "frames_dropped", "frames_jumped")
+
+    def __init__(self, capacity: int = 4096):
+        """
+        Initializes new statistics.\n
+        :param capacity: The number of most recent frame times kept for percentiles.
+        """
+        self.capacity = capacity
+        self.frame_times = array("d", bytes(8 * capacity))
+        self.reset()
+
+    def reset(self):
+        self.index = 0
+        self.count = 0
+        self.frames_presented = 0
+        self.frames_dropped = 0  # updated but not drawn, to catch up with the audio.
+        self.frames_jumped = 0  # neither updated nor drawn, when too far behind to catch up frame by frame.
+
+    def add_frame_time(self, seconds: float):
+        self.frame_times[self.index] = seconds
+        self.index = (self.index + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.frames_presented += 1
+
+    def get_percentile(self, percent: float) -> float:
+        """Gets a percentile of the recent frame times in seconds, or 0 if no frame is presented yet."""
+        if self.count == 0:
+            return 0.0
+        times = sorted(self.frame_times[:self.count] if self.count < self.capacity else self.frame_times)
+        return times[min(self.count - 1, int(percent / 100.0 * self.count))]
+
+    def to_dict(self) -> dict:
+        times = self.frame_times[:self.count] if self.count < self.capacity else self.frame_times
+        return {"frames_presented": self.frames_presented, "frames_dropped": self.frames_dropped,
+                "frames_jumped": self.frames_jumped,
+                "frame_time_p50": self.get_percentile(50), "frame_time_p95": self.get_percentile(95),
+                "frame_time_p99": self.get_percentile(99), "frame_time_max": max(times, default=0.0)}
+
+
+class wall_clock:
+    """
+    Represents an audio clock which follows the wall time since start(). Use it when neither a hit_sound_scheduler
+    nor music is available; they all provide start() and audio_time.
+    """
+    __slots__ = ("start_counter", "start_time")
+
+    def __init__(self):
+        self.start_counter = time.perf_counter()
+        self.start_time = 0.0
+
+    def start(self, audio_time: float = 0.0):
+        self.start_counter = time.perf_counter()
+        self.start_time = audio_time
+
+    @property
+    def audio_time(self) -> float:
+        return time.perf_counter() - self.start_counter + self.start_time
+
+
+class music_clock:
+    """
+    Represents an audio clock which follows the position of the playing music, from Mix_GetMusicPosition(). The
+    mixer moves the position once per mixed buffer, so the time in between is interpolated with the wall time, at
+    most max_step seconds ahead. When the music has ended, or its format reports no position, the wall time goes on.
+    """
+    __slots__ = ("music", "max_step", "last_position", "last_counter")
+
+    def __init__(self, music, max_step: float = 0.1):
+        """
+        Initializes a new clock.\n
+        :param music: The Mix_Music being played.
+        :param max_step: The most seconds interpolated past the last position the mixer reported.
+        """
+        self.music = music
+        self.max_step = max_step
+        self.last_position = 0.0
+        self.last_counter = time.perf_counter()
+
+    def start(self, audio_time: float = 0.0):
+        self.last_position = audio_time
+        self.last_counter = time.perf_counter()
+
+    @property
+    def audio_time(self) -> float:
+        now = time.perf_counter()
+        position = Mix_GetMusicPosition(self.music) if Mix_PlayingMusic() else -1.0
+        if position < 0:
+            return self.last_position + now - self.last_counter
+        if position != self.last_position:
+            self.last_position = position
+            self.last_counter = now
+        return position + min(now - self.last_counter, self.max_step)
+
+
+class realtime_runner:
+    """Runs a chart renderer in real time, synced to an audio clock, and presents the frames to its window."""
+    __slots__ = ("renderer", "audio_clock", "music_path", "max_catch_up", "stats", "running", "overlay")
+
+    def __init__(self, renderer: chart_renderer, audio_clock=None, music_path: str or None = None,
+                 max_catch_up: int = 8, overlay: profiler_overlay or None = None):
+        """
+        Initializes a new runner.\n
+        :param renderer: The chart renderer, with a visible window.
+        :param audio_clock: The clock the chart time follows, an object with start() and audio_time, e.g. a
+            hit_sound_scheduler. None for a music_clock of the music, or a wall_clock without music.
+        :param music_path: The music file to play from the start of the song. None to play no music.
+        :param max_catch_up: The most frames updated without drawing to catch up. Further behind, the renderer
+            seeks to the audio clock instead.
+        :param overlay: The overlay to draw the figures of renderer.profiler with. None to draw no overlay.
+        """
+        self.renderer = renderer
+        self.audio_clock = audio_clock
+        self.music_path = music_path
+        self.max_catch_up = max_catch_up
+        self.stats = pacing_stats()
+        self.running = False
+        self.overlay = overlay
+
+    def stop(self):
+        """Stops run() after the current frame."""
+        self.running = False
+
+    def present_frame(self):
+        """Draws the current frame of the renderer and presents it, through the super sampling layer if any."""
+        window = self.renderer.window
+        profiler = self.renderer.profiler
+        window.try_use_super_sampling_layer()
+        self.renderer.draw_frame()
+        window.render_layer_to_window()
+        if profiler is not None:
+            profiler.mark(PHASE_FLUSH)
+            if self.overlay is not None:
+                self.overlay.draw(profiler)
+            profiler.skip()  # the overlay is not part of the frame it measures.
+        window.renderer.present()
+        if profiler is not None:
+            profiler.mark(PHASE_PRESENT)
+
+    def run(self, duration: float or None = None, start_time: float = 0.0) -> pacing_stats:
+        """
+        Plays the chart until the duration passes, the window is closed or stop() is called.\n
+        :param duration: Seconds of song to play. None to play until stopped.
+        :param start_time: The song time to start at, in seconds.
+        :return: The pacing statistics.
+        """
+        renderer = self.renderer
+        window = renderer.window
+        clock = renderer.clock
+        stats = self.stats
+        fps = renderer.fps
+        end_frame = None if duration is None else int(round((start_time + duration) * fps))
+        stats.reset()
+
+        music = None
+        if self.music_path is not None:
+            music = Mix_LoadMUS(self.music_path.encode("utf-8"))
+            if not music:
+                raise RuntimeError("Failed to load music: %s" % Mix_GetError().decode("utf-8", "replace"))
+        audio_clock = self.audio_clock
+        if audio_clock is None:
+            audio_clock = wall_clock() if music is None else music_clock(music)
+        try:
+            renderer.seek_frame(int(ceil(start_time * fps)))
+            if music is not None:
+                Mix_PlayMusic(music, 1)
+                if start_time > 0:
+                    Mix_SetMusicPosition(start_time)
+            audio_clock.start(start_time)
+            last_present = time.perf_counter()
+            self.running = True
+
+            while self.running and window.is_window_available():
+                window.handle_events()
+                if not window.is_window_available():
+                    break
+                frame_index = clock.frame_index
+                if end_frame is not None and frame_index >= end_frame:
+                    break
+
+                # ahead of the audio: wait until the frame is due.
+                wait = frame_index / fps - audio_clock.audio_time
+                if wait > 0:
+                    time.sleep(wait)
+                    continue
+
+                # behind the audio: update the frames in between without drawing them.
+                target = int(audio_clock.audio_time * fps)
+                behind = target - frame_index
+                if behind > self.max_catch_up:
+                    renderer.seek_frame(target)
+                    stats.frames_jumped += behind
+                else:
+                    for _ in range(behind):
+                        renderer.update_frame()
+                        clock.advance()
+                    stats.frames_dropped += max(0, behind)
+
+                renderer.update_frame()
+                self.present_frame()
+                clock.advance()
+                now = time.perf_counter()
+                stats.add_frame_time(now - last_present)
+                last_present = now
+        finally:
+            self.running = False
+            if music is not None:
+                Mix_HaltMusic()
+                Mix_FreeMusic(music)
+        return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Previews a chart in real time with its music.")
+    parser.add_argument("chart", help="chart json file")
+    parser.add_argument("--music", help="music file")
+    parser.add_argument("--illustration", default="", help="illustration image file")
+    parser.add_argument("--skin", help="directory of note images named as global_resource.image_names, e.g. tap.png")
+    parser.add_argument("--hit-sounds", help="directory of tap.wav, drag.wav and flick.wav; no hit sounds if unset")
+    parser.add_argument("--hit-effect", default="", help="hit effect sprite sheet")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--fps", type=int, default=60)
+    parser.add_argument("--duration", type=float, help="seconds to play; plays until the window is closed if unset")
+    parser.add_argument("--profile", help="write per-phase frame timings to this .csv or .json file")
+    parser.add_argument("--overlay-font", help="ttf font file; draws the frame timings on screen")
+    args = parser.parse_args()
+
+    SDL_Init(SDL_INIT_VIDEO | SDL_INIT_AUDIO)
+    audio_file.init()
+    chart = open_chart_file(args.chart)
+    # the hit sounds are played by the scheduler on the audio thread, not at frame time.
+    renderer = chart_renderer(chart, render_options(args.width, args.height, args.fps), args.illustration,
+                              play_sounds=False)
+    resources = resource_manager(renderer.window.renderer)
+    resources.load_skin(find_skin_images(args.skin) if args.skin is not None else {},
+                        find_hit_sounds(args.hit_sounds) if args.hit_sounds is not None else None, atlas=True)
+    if args.hit_effect != "":
+        resources.load_hit_effect(args.hit_effect)
+    scheduler = None
+    if args.hit_sounds is not None:
+        scheduler = hit_sound_scheduler(chart.notes, chart.offset, global_resource.note_sound_map)
+    overlay = None
+    if args.profile is not None or args.overlay_font is not None:
+        renderer.profiler = frame_profiler()
+    if args.overlay_font is not None:
+        from sdl_text import sdl_font, sdl_glyph_cache  # SDL_ttf is only required for the overlay.
+        sdl_font.init()
+        overlay = profiler_overlay(renderer.window.renderer, sdl_font.open_ttf(args.overlay_font, 14))
+    try:
+        stats = realtime_runner(renderer, scheduler, args.music, overlay=overlay).run(args.duration)
+        print(stats.to_dict())
+        if args.profile is not None:
+            if args.profile.endswith(".json"):
+                renderer.profiler.export_json(args.profile)
+            else:
+                renderer.profiler.export_csv(args.profile)
+    finally:
+        if scheduler is not None:
+            scheduler.stop()
+        if overlay is not None:
+            overlay.destroy()
+            sdl_glyph_cache.destroy_all()
+            overlay.font.destroy()
+        resources.destroy()
+        renderer.destroy()
+        audio_file.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+This module loads the images and sounds of a render on a thread pool.
+
+Files are decoded by worker threads. IMG_Load and Mix_LoadWAV are C calls which release the GIL, so files decode in
+parallel. Textures are only created by the upload methods, on the thread which owns the renderer.
+
+Illustrations are scaled and cropped to the render size by the workers, and kept in an on-disk cache keyed by the hash
+of the file and the target size. Later jobs load a small PNG instead of the full image, and the renderer copies the
+background without scaling it every frame.
+
+"""
+
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor, Future
+
+from sdl2.sdlimage import IMG_Load, IMG_SavePNG, IMG_GetError
+from sdl2.sdlmixer import Mix_LoadWAV, Mix_GetError
+
+from sdl_render import *
+from sdl_image import sdl_image
+from wav_audio import audio_file
+from chart_renderer import global_resource, render_resource
+
+__all__ = ["decode_image", "get_fit_rect", "scale_to_fit", "get_illustration_cache_path", "decode_illustration",
+           "resource_loader"]
+
+
+def decode_image(path: str):
+    """
+    Decodes an image file into a new ARGB8888 surface. It makes no renderer call, so any thread may call it.\n
+    :param path: The path to the image.
+    :return: A pointer to the surface, which the caller frees.
+    """
+    loaded = IMG_Load(path.encode("utf-8"))
+    if not loaded:
+        raise RuntimeError("Failed to load %s: %s" % (path, IMG_GetError().decode("utf-8", "replace")))
+    try:
+        converted = SDL_ConvertSurfaceFormat(loaded, SDL_PIXELFORMAT_ARGB8888, 0)
+    finally:
+        SDL_FreeSurface(loaded)
+    if not converted:
+        raise RuntimeError("Failed to convert %s: %s" % (path, SDL_GetError().decode("utf-8", "replace")))
+    return converted
+
+
+def get_fit_rect(width: int, height: int, width_height_rat: float) -> SDL_Rect:
+    """Gets the centered rectangle of given ratio which covers most of an image, as sdl_image.crop_to_fit() cuts."""
+    if width / height > width_height_rat:
+        narrowed_width = int(height * width_height_rat)
+        return SDL_Rect((width - narrowed_width) // 2, 0, narrowed_width, height)
+    narrowed_height = int(width / width_height_rat)
+    return SDL_Rect(0, (height - narrowed_height) // 2, width, narrowed_height)
+
+
+def scale_to_fit(surface, width: int, height: int):
+    """
+    Crops an ARGB8888 surface to the ratio of given size, and scales it to the size with linear filtering.\n
+    :param surface: A pointer to the surface. It is not freed.
+    :param width: The target width.
+    :param height: The target height.
+    :return: A pointer to a new surface, which the caller frees.
+    """
+    source = surface.contents
+    area = get_fit_rect(source.w, source.h, width / height)
+    scaled = SDL_CreateRGBSurfaceWithFormat(0, width, height, 32, SDL_PIXELFORMAT_ARGB8888)
+    if not scaled:
+        raise RuntimeError("Failed to create a surface: %s" % SDL_GetError().decode("utf-8", "replace"))
+    if SDL_SoftStretchLinear(surface, byref(area), scaled, None) != 0:
+        SDL_FreeSurface(scaled)
+        raise RuntimeError("Failed to scale a surface: %s" % SDL_GetError().decode("utf-8", "replace"))
+    return scaled
+
+
+def get_illustration_cache_path(cache_dir: str, path: str, width: int, height: int) -> str:
+    """Gets the path of the cached copy of an illustration scaled to given size, named by the hash of the file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file_stream:
+        for block in iter(lambda: file_stream.read(1 << 20), b""):
+            digest.update(block)
+    return os.path.join(cache_dir, "%s_%dx%d.png" % (digest.hexdigest(), width, height))
+
+
+def decode_illustration(path: str, width: int, height: int, cache_dir: str or None = None):
+    """
+    Decodes an illustration cropped and scaled to given size, through the on-disk cache if a directory is given.\n
+    :param path: The path to the illustration.
+    :param width: The width of the render target.
+    :param height: The height of the render target.
+    :param cache_dir: The directory of the cache. None to scale the image every time.
+    :return: A pointer to an ARGB8888 surface, which the caller frees.
+    """
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = get_illustration_cache_path(cache_dir, path, width, height)
+        if os.path.exists(cache_path):
+            return decode_image(cache_path)
+    surface = decode_image(path)
+    try:
+        scaled = scale_to_fit(surface, width, height)
+    finally:
+        SDL_FreeSurface(surface)
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        # written aside and renamed, so concurrent jobs never read a partial file.
+        temp_path = "%s.%d.tmp" % (cache_path, os.getpid())
+        if IMG_SavePNG(scaled, temp_path.encode("utf-8")) == 0:
+            os.replace(temp_path, cache_path)
+    return scaled
+
+
+def _decode_sound(path: str) -> audio_file:
+    sound = Mix_LoadWAV(path.encode("utf-8"))
+    if not sound:
+        raise RuntimeError("Failed to load %s: %s" % (path, Mix_GetError().decode("utf-8", "replace")))
+    return audio_file(sound)
+
+
+class resource_loader:
+    """
+    Decodes images and sounds on a thread pool. Submit every file first, then upload them, so the files decode in
+    parallel while the first textures are created.
+    """
+    __slots__ = ("executor", "cache_dir")
+
+    def __init__(self, workers: int or None = None, cache_dir: str or None = None):
+        """
+        Initializes a new loader.\n
+        :param workers: The number of decoding threads. None for the default of ThreadPoolExecutor.
+        :param cache_dir: The directory of the scaled illustrations. None to disable the cache.
+        """
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="resource_loader")
+        self.cache_dir = cache_dir
+
+    def submit_image(self, path: str) -> Future:
+        """Starts decoding an image. The future gives a surface pointer for upload_image()."""
+        return self.executor.submit(decode_image, path)
+
+    def submit_illustration(self, path: str, width: int, height: int) -> Future:
+        """Starts decoding an illustration cropped and scaled to given size, see decode_illustration()."""
+        return self.executor.submit(decode_illustration, path, width, height, self.cache_dir)
+
+    def submit_sound(self, path: str) -> Future:
+        """Starts decoding a wav file into an audio_file. The audio device must be open, see audio_file.init()."""
+        return self.executor.submit(_decode_sound, path)
+
+    @staticmethod
+    def upload_image(future: Future, parent: sdl_renderer) -> sdl_image:
+        """Waits for a decoded image and creates its texture. Call it on the thread which owns the renderer."""
+        surface = future.result()
+        try:
+            return sdl_image(sdl_surface(surface), parent)
+        finally:
+            SDL_FreeSurface(surface)
+
+    def load_images(self, paths: dict[str, str], parent: sdl_renderer) -> dict[str, sdl_image]:
+        """Decodes images in parallel and uploads them, keyed as given."""
+        futures = {name: self.submit_image(path) for name, path in paths.items()}
+        return {name: self.upload_image(future, parent) for name, future in futures.items()}
+
+    def load_illustration(self, path: str, width: int, height: int, parent: sdl_renderer) -> sdl_image:
+        """Loads an illustration scaled to the render size, e.g. for the background parameter of chart_renderer."""
+        return self.upload_image(self.submit_illustration(path, width, height), parent)
+
+    def load_global_resources(self, parent: sdl_renderer, image_paths: dict[str, str],
+                              sound_paths: dict[str, str] or None = None):
+        """
+        Loads the note images and hit sounds into global_resource, decoding every file in parallel.\n
+        :param parent: The renderer the textures belong to.
+        :param image_paths: Maps image names to file paths, as global_resource.init_images().
+        :param sound_paths: Maps "tap", "drag" and "flick" to wav files. None to load no sound.
+        :return: None.
+        """
+        for name in image_paths:
+            if name not in global_resource.image_names:
+                raise ValueError("Unknown note image: %s" % name)
+        sound_paths = {} if sound_paths is None else sound_paths
+        for name in sound_paths:
+            if name not in ("tap", "drag", "flick"):
+                raise ValueError("Unknown hit sound: %s" % name)
+        sound_futures = {name: self.submit_sound(path) for name, path in sound_paths.items()}
+        for name, image in self.load_images(image_paths, parent).items():
+            setattr(global_resource, name, image)
+        for name, future in sound_futures.items():
+            setattr(global_resource, name + "_sound", future.result())
+        if sound_futures:
+            global_resource.generate_note_sound_map()
+
+    def load_render_resource(self, img_path: str, wav_path: str, parent: sdl_renderer) -> render_resource:
+        """Loads an illustration and a song in parallel, as render_resource.open_file()."""
+        sound = self.submit_sound(wav_path)
+        image = self.upload_image(self.submit_image(img_path), parent)
+        return render_resource(image, sound.result())
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
@@ -0,0 +1,372 @@
+"""
+This module provides a resource manager, which owns the textures and sounds of a long-running process.
+
+Every resource is keyed by the hash of its file, so identical files are loaded once whatever their paths. Resources
+are reference counted: acquire() hands out a shared resource and release() returns it. A released resource stays
+loaded for reuse, until the estimated memory of all resources exceeds the budget; then the resources nobody holds are
+destroyed, the least recently released first. Resources in use are never evicted, even over budget.
+
+"""
+
+import hashlib
+import os
+from collections import OrderedDict
+
+from sdl2.sdlmixer import Mix_LoadWAV, Mix_GetError
+
+from sdl_render import *
+from sdl_image import sdl_image
+from sdl_atlas import sdl_texture_atlas
+from wav_audio import audio_file
+from chart_renderer import global_resource, render_resource
+from resource_loader import decode_image, decode_illustration, resource_loader
+
+__all__ = ["resource_entry", "resource_manager", "get_file_digest", "find_skin_images", "find_hit_sounds",
+           "RESOURCE_IMAGE", "RESOURCE_ILLUSTRATION", "RESOURCE_SOUND", "RESOURCE_NOTE_ATLAS", "RESOURCE_HIT_EFFECT"]
+
+RESOURCE_IMAGE = "image"
+RESOURCE_ILLUSTRATION = "illustration"
+RESOURCE_SOUND = "sound"
+RESOURCE_NOTE_ATLAS = "note_atlas"
+RESOURCE_HIT_EFFECT = "hit_effect"
+
+_SKIN_SOUND_NAMES = ("tap", "drag", "flick")
+
+# (absolute path, modification time, size) -> sha256 hex digest, so unchanged files are hashed once.
+_digests: dict[tuple[str, int, int], str] = {}
+
+
+def get_file_digest(path: str) -> str:
+    """Gets the SHA-256 hex digest of a file, remembered until the file changes."""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    digest = _digests.get(key)
+    if digest is None:
+        hasher = hashlib.sha256()
+        with open(path, "rb") as file_stream:
+            for block in iter(lambda: file_stream.read(1 << 20), b""):
+                hasher.update(block)
+        digest = hasher.hexdigest()
+        _digests[key] = digest
+    return digest
+
+
+def find_skin_images(directory: str) -> dict[str, str]:
+    """
+    Finds the note images of a skin directory, named as global_resource.image_names, e.g. tap.png and tap_hl.png.\n
+    :param directory: The skin directory.
+    :return: Maps image names to the files found, for load_skin().
+    """
+    paths = {}
+    for name in global_resource.image_names:
+        path = os.path.join(directory, name + ".png")
+        if os.path.isfile(path):
+            paths[name] = path
+    if not paths:
+        raise FileNotFoundError("No note image found in %s." % directory)
+    return paths
+
+
+def find_hit_sounds(directory: str) -> dict[str, str]:
+    """
+    Finds the hit sounds of a skin directory: tap.wav, drag.wav and flick.wav, which must all exist.\n
+    :param directory: The directory of the sounds.
+    :return: Maps "tap", "drag" and "flick" to the files, for load_skin().
+    """
+    paths = {name: os.path.join(directory, name + ".wav") for name in _SKIN_SOUND_NAMES}
+    missing = [path for path in paths.values() if not os.path.isfile(path)]
+    if missing:
+        raise FileNotFoundError("Missing hit sounds: %s" % ", ".join(missing))
+    return paths
+
+
+class resource_entry:
+    """Represents one loaded resource, with its reference count and its estimated memory."""
+    __slots__ = ("key", "kind", "resource", "nbytes", "refcount")
+
+    def __init__(self, key: tuple, kind: str, resource, nbytes: int):
+        self.key = key
+        self.kind = kind
+        self.resource = resource
+        self.nbytes = nbytes
+        self.refcount = 0
+
+    def destroy(self):
+        self.resource.destroy()
+        self.resource = None
+
+
+class resource_manager:
+    """Owns reference-counted images, illustrations and sounds, evicting unused ones under a memory budget."""
+    __slots__ = ("parent", "budget", "loader", "cache_dir", "entries", "handles", "unused", "total_bytes", "hits",
+                 "misses", "evictions", "skin", "hit_effect")
+
+    def __init__(self, parent: sdl_renderer, budget: int = 256 << 20, loader: resource_loader or None = None,
+                 cache_dir: str or None = None):
+        """
+        Initializes a new resource manager.\n
+        :param parent: The renderer the textures belong to.
+        :param budget: The estimated memory in bytes the resources may take before unused ones are evicted.
+        :param loader: The loader which decodes the files of load_skin() in parallel. None to decode them one by one.
+        :param cache_dir: The on-disk cache of scaled illustrations, see resource_loader.decode_illustration().
+        """
+        self.parent = parent
+        self.budget = budget
+        self.loader = loader
+        self.cache_dir = cache_dir
+        self.entries: dict[tuple, resource_entry] = {}
+        self.handles: dict[int, resource_entry] = {}  # id(resource) -> entry, for release().
+        self.unused: OrderedDict[tuple, resource_entry] = OrderedDict()  # entries with no reference, oldest first.
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.skin: dict[str, object] = {}  # global_resource attribute names -> resources set by load_skin().
+        self.hit_effect: sdl_texture_atlas or None = None  # set by load_hit_effect().
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _use(self, key: tuple):
+        """Takes a reference to a loaded entry, or returns None if the key is not loaded."""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry.refcount == 0:
+            del self.unused[key]
+        entry.refcount += 1
+        self.hits += 1
+        return entry.resource
+
+    def _add(self, key: tuple, kind: str, resource, nbytes: int):
+        entry = resource_entry(key, kind, resource, nbytes)
+        entry.refcount = 1
+        self.entries[key] = entry
+        self.handles[id(resource)] = entry
+        self.total_bytes += nbytes
+        self.misses += 1
+        self.evict()
+        return resource
+
+    def _upload(self, key: tuple, kind: str, surface, free: bool = True) -> sdl_image:
+        """Creates the texture of a decoded surface, and frees the surface unless free is False."""
+        try:
+            image = sdl_image(sdl_surface(surface), self.parent)
+        finally:
+            if free:
+                SDL_FreeSurface(surface)
+        return self._add(key, kind, image, image.width * image.height * 4)
+
+    def get_image_key(self, path: str) -> tuple:
+        return RESOURCE_IMAGE, get_file_digest(path)
+
+    def get_illustration_key(self, path: str, width: int, height: int) -> tuple:
+        return RESOURCE_ILLUSTRATION, get_file_digest(path), width, height
+
+    def get_sound_key(self, path: str) -> tuple:
+        return RESOURCE_SOUND, get_file_digest(path)
+
+    def get_note_atlas_key(self, image_paths: dict[str, str]) -> tuple:
+        return RESOURCE_NOTE_ATLAS, tuple(sorted((name, get_file_digest(path)) for name, path in image_paths.items()))
+
+    def get_hit_effect_key(self, path: str, columns: int, rows: int) -> tuple:
+        return RESOURCE_HIT_EFFECT, get_file_digest(path), columns, rows
+
+    def acquire_image(self, path: str) -> sdl_image:
+        """Gets the image of a file, loading it unless an identical file is loaded. Release it with release()."""
+        key = self.get_image_key(path)
+        image = self._use(key)
+        if image is None:
+            image = self._upload(key, RESOURCE_IMAGE, decode_image(path))
+        return image
+
+    def acquire_illustration(self, path: str, width: int, height: int) -> sdl_image:
+        """Gets an illustration cropped and scaled to given size, e.g. the background of chart_renderer."""
+        key = self.get_illustration_key(path, width, height)
+        image = self._use(key)
+        if image is None:
+            image = self._upload(key, RESOURCE_ILLUSTRATION, decode_illustration(path, width, height, self.cache_dir))
+        return image
+
+    def acquire_sound(self, path: str) -> audio_file:
+        """Gets the sound of a wav file. The audio device must be open, see audio_file.init()."""
+        key = self.get_sound_key(path)
+        sound = self._use(key)
+        if sound is None:
+            chunk = Mix_LoadWAV(path.encode("utf-8"))
+            if not chunk:
+                raise RuntimeError("Failed to load %s: %s" % (path, Mix_GetError().decode("utf-8", "replace")))
+            sound = self._add(key, RESOURCE_SOUND, audio_file(chunk), chunk.contents.alen)
+        return sound
+
+    def acquire_render_resource(self, img_path: str, wav_path: str) -> render_resource:
+        """Gets the illustration and song of a chart. Release it with release_render_resource()."""
+        return render_resource(self.acquire_image(img_path), self.acquire_sound(wav_path))
+
+    def release_render_resource(self, resource: render_resource):
+        self.release(resource.illustration_image)
+        self.release(resource.audio_file)
+
+    def owns(self, resource) -> bool:
+        """Checks whether a resource was handed out by this manager."""
+        return id(resource) in self.handles
+
+    def release(self, resource):
+        """Returns a reference to a resource. It stays loaded until the budget requires its memory."""
+        entry = self.handles.get(id(resource))
+        if entry is None or entry.refcount <= 0:
+            raise ValueError("The resource is not held from this manager.")
+        entry.refcount -= 1
+        if entry.refcount == 0:
+            self.unused[entry.key] = entry
+            self.evict()
+
+    def evict(self, budget: int or None = None) -> int:
+        """
+        Destroys unused resources, the least recently released first, until the memory fits the budget.\n
+        :param budget: The budget in bytes. None for the budget of the manager; 0 to evict every unused resource.
+        :return: The number of resources evicted.
+        """
+        budget = self.budget if budget is None else budget
+        count = 0
+        while self.total_bytes > budget and self.unused:
+            _, entry = self.unused.popitem(last=False)
+            del self.entries[entry.key]
+            del self.handles[id(entry.resource)]
+            self.total_bytes -= entry.nbytes
+            entry.destroy()
+            count += 1
+        self.evictions += count
+        return count
+
+    def load_skin(self, image_paths: dict[str, str], sound_paths: dict[str, str] or None = None,
+                  atlas: bool = False):
+        """
+        Acquires the note images and hit sounds and sets them on global_resource, releasing the previous skin. Images
+        not loaded yet are decoded in parallel if the manager has a loader. A note atlas not acquired from this
+        manager is destroyed, since get_note_images() would keep returning its regions.\n
+        :param image_paths: Maps image names to file paths, as global_resource.init_images().
+        :param sound_paths: Maps "tap", "drag" and "flick" to wav files. None to load no sound.
+        :param atlas: Whether to pack the images into a note atlas, see global_resource.use_note_atlas(). The atlas
+            is a resource of the manager too, packed from the same decoded surfaces as the images.
+        :return: None.
+        """
+        sound_paths = {} if sound_paths is None else sound_paths
+        for name in image_paths:
+            if name not in global_resource.image_names:
+                raise ValueError("Unknown note image: %s" % name)
+        for name in sound_paths:
+            if name not in _SKIN_SOUND_NAMES:
+                raise ValueError("Unknown hit sound: %s" % name)
+
+        skin = {}
+        futures = {}
+        surfaces = {}  # image keys -> decoded surfaces, kept until the atlas is packed.
+        atlas_key = self.get_note_atlas_key(image_paths) if atlas and image_paths else None
+        # the surfaces of loaded images are only decoded again to pack an atlas which is not loaded.
+        decode_all = atlas_key is not None and atlas_key not in self.entries
+        try:
+            keys = {name: self.get_image_key(path) for name, path in image_paths.items()}
+            if self.loader is not None:
+                for name, path in image_paths.items():
+                    key = keys[name]
+                    if (decode_all or key not in self.entries) and key not in futures:
+                        futures[key] = self.loader.submit_image(path)
+            for name, path in image_paths.items():
+                key = keys[name]
+                if (decode_all or key not in self.entries) and key not in surfaces:
+                    surfaces[key] = futures.pop(key).result() if key in futures else decode_image(path)
+                image = self._use(key)
+                if image is None:
+                    image = self._upload(key, RESOURCE_IMAGE, surfaces[key], free=False)
+                skin[name] = image
+            if atlas_key is not None:
+                note_atlas = self._use(atlas_key)
+                if note_atlas is None:
+                    note_atlas = sdl_texture_atlas.from_surfaces({name: surfaces[key] for name, key in keys.items()},
+                                                                 self.parent)
+                    self._add(atlas_key, RESOURCE_NOTE_ATLAS, note_atlas, note_atlas.width * note_atlas.height * 4)
+                skin["note_atlas"] = note_atlas
+            for name, path in sound_paths.items():
+                skin[name + "_sound"] = self.acquire_sound(path)
+        except BaseException:
+            # the previous skin stays; nothing acquired for the new one is kept.
+            for resource in skin.values():
+                self.release(resource)
+            for future in futures.values():
+                if future.exception() is None:
+                    SDL_FreeSurface(future.result())
+            raise
+        finally:
+            for surface in surfaces.values():
+                SDL_FreeSurface(surface)
+
+        self.release_skin()
+        if image_paths:
+            global_resource.destroy_note_atlas()
+        self.skin = skin
+        for name, resource in skin.items():
+            setattr(global_resource, name, resource)
+        if sound_paths:
+            global_resource.generate_note_sound_map()
+        if atlas_key is not None:
+            global_resource.use_note_atlas(skin["note_atlas"])
+
+    def release_skin(self):
+        """Releases the skin set by load_skin() and clears it, and the note atlas, from global_resource."""
+        note_atlas = self.skin.get("note_atlas")
+        if note_atlas is not None and global_resource.note_atlas is note_atlas:
+            global_resource.use_note_atlas(None)
+        elif any(name in global_resource.image_names for name in self.skin):
+            global_resource.destroy_note_atlas()
+        for name, resource in self.skin.items():
+            if getattr(global_resource, name, None) is resource:
+                setattr(global_resource, name, None)
+            self.release(resource)
+        if any(name.endswith("_sound") for name in self.skin):
+            global_resource.note_sound_map = None
+        self.skin = {}
+
+    def load_hit_effect(self, path: str, columns: int = 5, rows: int = 6):
+        """
+        Acquires the hit effect sprite sheet and sets it on global_resource, releasing the previous one. A sheet not
+        acquired from this manager is destroyed.\n
+        :param path: The path to the sprite sheet, see global_resource.init_hit_effect().
+        :param columns: The number of frames in a row.
+        :param rows: The number of rows.
+        :return: None.
+        """
+        key = self.get_hit_effect_key(path, columns, rows)
+        sheet = self._use(key)
+        if sheet is None:
+            sheet = sdl_texture_atlas.from_grid(path, self.parent, columns, rows)
+            self._add(key, RESOURCE_HIT_EFFECT, sheet, sheet.width * sheet.height * 4)
+        self.release_hit_effect()
+        global_resource.destroy_hit_effect()
+        self.hit_effect = sheet
+        global_resource.use_hit_effect(sheet)
+
+    def release_hit_effect(self):
+        """Releases the sheet set by load_hit_effect() and clears it from global_resource."""
+        if self.hit_effect is None:
+            return
+        if global_resource.hit_effect_atlas is self.hit_effect:
+            global_resource.use_hit_effect(None)
+        self.release(self.hit_effect)
+        self.hit_effect = None
+
+    def to_dict(self) -> dict:
+        return {"entries": len(self.entries), "unused": len(self.unused), "total_bytes": self.total_bytes,
+                "budget": self.budget, "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def destroy(self):
+        """Destroys every resource, including those still held. Use it when the renderer goes away."""
+        self.release_skin()
+        self.release_hit_effect()
+        for entry in self.entries.values():
+            entry.destroy()
+        self.entries.clear()
+        self.handles.clear()
+        self.unused.clear()
+        self.total_bytes = 0
@@ -0,0 +1,180 @@
+"""
+This module provides texture atlases: several images packed into one texture, drawn by their sub-rectangles, so that
+drawing different images does not switch textures.
+
+"""
+
+from math import sqrt
+
+from sdl_render import *
+from sdl2.sdlimage import IMG_Load, IMG_GetError
+
+__all__ = ["sdl_atlas_region", "sdl_texture_atlas"]
+
+
+class sdl_atlas_region:
+    """Represents one image in a texture atlas. It can be drawn like an sdl_image."""
+    __slots__ = ("atlas", "src", "dst", "uv", "width", "height")
+
+    def __init__(self, atlas, x: int, y: int, w: int, h: int):
+        self.atlas = atlas
+        self.src = SDL_Rect(x, y, w, h)
+        self.dst = SDL_Rect()  # reused by draw().
+        self.width = w
+        self.height = h
+        self.uv = (x / atlas.width, y / atlas.height, (x + w) / atlas.width, (y + h) / atlas.height)
+
+    def draw(self, x_center: float, y_center: float, w: float, h: float, angle: float):
+        """
+        Draws the region scaled to w x h, rotated around its center.\n
+        :param x_center: The x coordinate of the center.
+        :param y_center: The y coordinate of the center.
+        :param w: The width to draw.
+        :param h: The height to draw.
+        :param angle: The degree that the region rotates clockwise.
+        :return: None.
+        """
+        tex = self.atlas.tex
+        dst = self.dst
+        dst.x = int(x_center - w / 2)
+        dst.y = int(y_center - h / 2)
+        dst.w = int(w)
+        dst.h = int(h)
+        SDL_RenderCopyEx(tex.parent.handle, tex.handle, self.src, dst, angle, NULL_POINT, SDL_FLIP_NONE)
+
+    def draw_batched(self, batch: sdl_draw_batch, x_center: float, y_center: float, w: float, h: float,
+                     angle: float):
+        """Adds the region to a draw batch, or draws it directly if batching is disabled."""
+        if batch.enabled:
+            batch.add_quad(self.atlas.tex, x_center, y_center, w, h, angle, self.uv)
+        else:
+            self.draw(x_center, y_center, w, h, angle)
+
+
+class sdl_texture_atlas:
+    """Represents a texture atlas, with named regions."""
+    __slots__ = ("tex", "regions", "width", "height")
+
+    def __init__(self, tex: sdl_texture, regions: dict[str, tuple[int, int, int, int]]):
+        self.tex = tex
+        self.width = tex.width
+        self.height = tex.height
+        self.regions: dict[str, sdl_atlas_region] = {
+            name: sdl_atlas_region(self, *rect) for name, rect in regions.items()
+        }
+
+    def get_region(self, name: str) -> sdl_atlas_region or None:
+        return self.regions.get(name)
+
+    @staticmethod
+    def pack(sizes: dict[str, tuple[int, int]], padding: int = 2, max_size: int = 8192) \
+            -> tuple[int, int, dict[str, tuple[int, int, int, int]]]:
+        """
+        Packs rectangles into shelves, the tallest first.\n
+        :param sizes: Maps names to (width, height).
+        :param padding: The transparent gap around every rectangle, which keeps filtering from bleeding.
+        :param max_size: The maximum width and height of the atlas.
+        :return: The atlas width, height, and the (x, y, w, h) of every name.
+        """
+        widest = max((w for w, _ in sizes.values()), default=1) + padding * 2
+        area = sum((w + padding * 2) * (h + padding * 2) for w, h in sizes.values())
+        width = 1
+        while width < max(widest, sqrt(area)):
+            width *= 2
+        width = min(width, max_size)
+        if widest > width:
+            raise ValueError("An image is wider than the maximum atlas size.")
+
+        rects = {}
+        x = y = shelf_height = 0
+        for name, (w, h) in sorted(sizes.items(), key=lambda item: -item[1][1]):
+            if x + w + padding * 2 > width:
+                x = 0
+                y += shelf_height
+                shelf_height = 0
+            rects[name] = (x + padding, y + padding, w, h)
+            x += w + padding * 2
+            shelf_height = max(shelf_height, h + padding * 2)
+        height = y + shelf_height
+        if height > max_size:
+            raise ValueError("Images do not fit in the maximum atlas size.")
+        return width, max(height, 1), rects
+
+    @classmethod
+    def from_grid(cls, path: str, parent: sdl_renderer, columns: int, rows: int):
+        """
+        Loads a sprite sheet as an atlas of equally sized frames, named "0", "1", ... row by row.\n
+        :param path: The path to the sprite sheet.
+        :param parent: The renderer the texture belongs to.
+        :param columns: The number of frames in a row.
+        :param rows: The number of rows.
+        :return: The atlas.
+        """
+        sheet = IMG_Load(path.encode())
+        if not sheet:
+            raise RuntimeError("Failed to load %s: %s" % (path, IMG_GetError().decode("utf-8", "replace")))
+        try:
+            tex = sdl_texture.from_surface(sdl_surface(sheet), parent)
+        finally:
+            SDL_FreeSurface(sheet)
+        w = tex.width // columns
+        h = tex.height // rows
+        return cls(tex, {str(i): (i % columns * w, i // columns * h, w, h) for i in range(columns * rows)})
+
+    def get_frames(self) -> list[sdl_atlas_region]:
+        """Gets the regions named by frame numbers, as made by from_grid(), in order."""
+        frames = []
+        while str(len(frames)) in self.regions:
+            frames.append(self.regions[str(len(frames))])
+        return frames
+
+    @classmethod
+    def from_files(cls, paths: dict[str, str], parent: sdl_renderer, padding: int = 2, max_size: int = 8192):
+        """
+        Loads images and packs them into a new atlas texture.\n
+        :param paths: Maps region names to image file paths.
+        :param parent: The renderer the atlas texture belongs to.
+        :param padding: The transparent gap around every image.
+        :param max_size: The maximum width and height of the atlas.
+        :return: The atlas.
+        """
+        surfaces = {}
+        try:
+            for name, path in paths.items():
+                loaded = IMG_Load(path.encode())
+                if not loaded:
+                    raise RuntimeError("Failed to load %s: %s" % (path, IMG_GetError().decode("utf-8", "replace")))
+                converted = SDL_ConvertSurfaceFormat(loaded, SDL_PIXELFORMAT_ARGB8888, 0)
+                SDL_FreeSurface(loaded)
+                if not converted:
+                    raise RuntimeError("Failed to convert %s: %s" % (path, SDL_GetError().decode("utf-8", "replace")))
+                surfaces[name] = converted
+            return cls.from_surfaces(surfaces, parent, padding, max_size)
+        finally:
+            for s in surfaces.values():
+                SDL_FreeSurface(s)
+
+    @classmethod
+    def from_surfaces(cls, surfaces: dict, parent: sdl_renderer, padding: int = 2, max_size: int = 8192):
+        """Packs SDL surfaces (pointers) into a new atlas texture. The surfaces are not freed."""
+        sizes = {name: (s.contents.w, s.contents.h) for name, s in surfaces.items()}
+        width, height, rects = cls.pack(sizes, padding, max_size)
+        atlas_surface = SDL_CreateRGBSurfaceWithFormat(0, width, height, 32, SDL_PIXELFORMAT_ARGB8888)
+        if not atlas_surface:
+            raise RuntimeError("Failed to create a %dx%d atlas surface: %s" %
+                               (width, height, SDL_GetError().decode("utf-8", "replace")))
+        try:
+            for name, s in surfaces.items():
+                x, y, w, h = rects[name]
+                SDL_SetSurfaceBlendMode(s, SDL_BLENDMODE_NONE)  # copy the alpha channel as is.
+                SDL_BlitSurface(s, None, atlas_surface, byref(SDL_Rect(x, y, w, h)))
+            tex = sdl_texture.from_surface(sdl_surface(atlas_surface), parent)
+        finally:
+            SDL_FreeSurface(atlas_surface)
+        return cls(tex, rects)
+
+    def destroy(self):
+        if self.tex is not None:
+            self.tex.destroy()
+        self.tex = None
+        self.regions.clear()
@@ -4,11 +4,12 @@ from ctypes import cast, c_void_p, POINTER, c_uint8
 
 
 class sdl_image:
-    __slots__ = ("tex", "width", "height", "parent")
+    __slots__ = ("tex", "width", "height", "parent", "dst")
 
     def __init__(self, data: sdl_surface or None, parent: sdl_renderer):
         """Using given SDL surface and renderer to initialize a new image instance."""
         self.parent = parent
+        self.dst = SDL_Rect()  # reused by draw().
         if data is None or parent is None:
             self.tex = None
             self.width = 0
@@ -51,6 +52,31 @@ class sdl_image:
     def set_alpha(self, a: int):
         self.tex.set_alpha(a)
 
+    def draw(self, x_center: float, y_center: float, w: float, h: float, angle: float):
+        """
+        Draws the whole image scaled to w x h, rotated around its center.\n
+        :param x_center: The x coordinate of the center.
+        :param y_center: The y coordinate of the center.
+        :param w: The width to draw.
+        :param h: The height to draw.
+        :param angle: The degree that the image rotates clockwise.
+        :return: None.
+        """
+        dst = self.dst
+        dst.x = int(x_center - w / 2)
+        dst.y = int(y_center - h / 2)
+        dst.w = int(w)
+        dst.h = int(h)
+        self.tex.direct_rotate_copy_to_parent(dst, angle)
+
+    def draw_batched(self, batch: sdl_draw_batch, x_center: float, y_center: float, w: float, h: float,
+                     angle: float):
+        """Adds the image to a draw batch, or draws it directly if batching is disabled."""
+        if batch.enabled:
+            batch.add_quad(self.tex, x_center, y_center, w, h, angle)
+        else:
+            self.draw(x_center, y_center, w, h, angle)
+
     def copy(self):
         return self.crop(0, 0, self.width, self.height)
 
@@ -65,6 +91,7 @@ class sdl_image:
     def open_image(cls, path: str, parent: sdl_renderer, file_size: (int, int) = (-1, -1)):
         s = IMG_Load(path.encode())
         ret = cls(sdl_surface(s), parent)
-        ret.width, ret.height = file_size
+        if file_size != (-1, -1):
+            ret.width, ret.height = file_size
         SDL_FreeSurface(s)
         return ret
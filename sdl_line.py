@@ -4,7 +4,7 @@ __all__ = ["sdl_line", ]
 
 class sdl_line:
     """Represents a line object which can be drawn to SDL renderer."""
-    __slots__ = ("tex", "parent", "w", "h")
+    __slots__ = ("tex", "parent", "w", "h", "color", "batch_color", "dst", "center")
 
     def __init__(self, parent: sdl_renderer, w: int, h: int, init_color=(255, 255, 255, 255)):
         self.parent = parent
@@ -12,6 +12,11 @@ class sdl_line:
         # Directly generate a new texture to fill.
         self.tex = sdl_texture.generate(parent, w, h, texture_access.render_target)
         self.w, self.h = w, h
+        self.color = tuple(init_color)
+        self.batch_color = self.color
+        # reused by every draw call, only the position changes.
+        self.dst = SDL_Rect(0, 0, w, h)
+        self.center = SDL_Point(w // 2, h // 2)
         raw_target = parent.get_render_target()
         parent.set_render_texture(self.tex)
         raw_col = parent.get_draw_color()
@@ -22,6 +27,8 @@ class sdl_line:
 
     def set_alpha(self, a: int):
         self.tex.set_alpha(a)
+        r, g, b, init_a = self.color
+        self.batch_color = (r, g, b, init_a * a // 255)
 
     def draw(self, x_center: int, y_center: int, rotation: float):
         """
@@ -31,9 +38,18 @@ class sdl_line:
         :param rotation: The degree that the line rotates.
         :return: None
         """
-        dst = SDL_Rect(x_center - self.w // 2, y_center - self.h // 2, self.w, self.h)
-        SDL_RenderCopyEx(self.parent.handle, self.tex.handle, POINTER(SDL_Rect)(), byref(dst), c_double(rotation),
-                         SDL_Point(self.w // 2, self.h // 2), SDL_RendererFlip(0))
+        dst = self.dst
+        center = self.center
+        dst.x = int(x_center) - center.x
+        dst.y = int(y_center) - center.y
+        SDL_RenderCopyEx(self.parent.handle, self.tex.handle, NULL_RECT, dst, rotation, center, SDL_FLIP_NONE)
+
+    def draw_batched(self, batch: sdl_draw_batch, x_center: int, y_center: int, rotation: float):
+        """Adds current line to a draw batch as a filled quad, or draws it directly if batching is disabled."""
+        if batch.enabled:
+            batch.add_quad(None, x_center, y_center, self.w, self.h, rotation, color=self.batch_color)
+        else:
+            self.draw(x_center, y_center, rotation)
 
     def destroy(self):
         self.tex.destroy()
@@ -4,8 +4,19 @@ import copy
 from sdl2 import *
 from sdl2.render import *
 from sdl2.video import *
-from ctypes import byref, c_int, c_uint, c_uint8, c_void_p, c_double, POINTER
+from ctypes import byref, c_int, c_uint, c_uint8, c_void_p, c_double, c_float, cast, POINTER
 from functools import singledispatch
+from math import sin, cos, pi
+
+try:
+    from sdl2.render import SDL_RenderGeometryRaw
+except ImportError:  # pysdl2 older than 0.9.11.
+    SDL_RenderGeometryRaw = None
+
+
+# shared null arguments, so that the hot paths do not allocate a new null pointer for every call.
+NULL_RECT = POINTER(SDL_Rect)()
+NULL_POINT = POINTER(SDL_Point)()
 
 
 def none_call_back(placeholder: object):
@@ -18,30 +29,35 @@ class render_target:
 
 
 class sdl_renderer:
-    __slots__ = ("handle", "width", "height", "parent")
+    __slots__ = ("handle", "width", "height", "parent", "draw_color")
 
-    def __init__(self, parent):
+    def __init__(self, parent, software: bool = False):
         self.parent = parent
         self.width = parent.width
         self.height = parent.height
-        self.handle = SDL_CreateRenderer(parent.handle, c_int(-1), SDL_RENDERER_ACCELERATED)
+        flags = SDL_RENDERER_SOFTWARE if software else SDL_RENDERER_ACCELERATED
+        self.handle = SDL_CreateRenderer(parent.handle, c_int(-1), flags)
         SDL_SetRenderDrawBlendMode(self.handle, SDL_BLENDMODE_BLEND)
-
-    def set_draw_color(self, r: int, g: int, b: int, a: int):
-        """Sets the drawing color. The color is used for clear as well."""
-        cr = c_uint8(r)
-        cg = c_uint8(g)
-        cb = c_uint8(b)
-        ca = c_uint8(a)
-        SDL_SetRenderDrawColor(self.handle, cr, cg, cb, ca)
-
-    def get_draw_color(self) -> tuple[int, int, int, int]:
         r = c_uint8(0)
         g = c_uint8(0)
         b = c_uint8(0)
         a = c_uint8(0)
         SDL_GetRenderDrawColor(self.handle, byref(r), byref(g), byref(b), byref(a))
-        return r.value, g.value, b.value, a.value
+        self.draw_color: tuple[int, int, int, int] = (r.value, g.value, b.value, a.value)
+
+    def set_draw_color(self, r: int, g: int, b: int, a: int):
+        """
+        Sets the drawing color. The color is used for clear as well.\n
+        The color is cached, so setting the same color again costs no SDL call. Do not change the drawing color of
+        the handle with SDL directly.
+        """
+        color = (r, g, b, a)
+        if color != self.draw_color:
+            SDL_SetRenderDrawColor(self.handle, r, g, b, a)
+            self.draw_color = color
+
+    def get_draw_color(self) -> tuple[int, int, int, int]:
+        return self.draw_color
 
     def clear(self):
         """Clears the renderer with drawing color."""
@@ -57,7 +73,17 @@ class sdl_renderer:
 
     def fill(self):
         """Fills the entire renderer with drawing color."""
-        SDL_RenderFillRect(self.handle, POINTER(SDL_Rect)())
+        SDL_RenderFillRect(self.handle, NULL_RECT)
+
+    def read_pixels(self, buffer, pixel_format: int, pitch: int) -> int:
+        """
+        Reads the pixels of the current render target, converting them to given format.\n
+        :param buffer: A writable ctypes buffer large enough for the whole target.
+        :param pixel_format: An SDL pixel format, e.g. SDL_PIXELFORMAT_ABGR8888 or SDL_PIXELFORMAT_IYUV.
+        :param pitch: The length in bytes of a row (of the first plane for planar formats).
+        :return: 0 on success, or a negative SDL error code.
+        """
+        return SDL_RenderReadPixels(self.handle, NULL_RECT, pixel_format, buffer, pitch)
 
     def get_render_target(self):
         return SDL_GetRenderTarget(self.handle)
@@ -166,7 +192,7 @@ class sdl_window(render_target):
                 state.set_interruption()
 
     def __init__(self, caption: str, w: int, h: int, fullScreen: bool = False, borderless: bool = False,
-                 super_sampling: bool = False):
+                 super_sampling: bool = False, hidden: bool = False, software: bool = False):
         if fullScreen:
             mode = SDL_DisplayMode()
             SDL_GetCurrentDisplayMode(0, byref(mode))
@@ -174,7 +200,7 @@ class sdl_window(render_target):
             h = mode.h
         self.internal_width = self.width = w
         self.internal_height = self.height = h
-        flags = SDL_WINDOW_ALLOW_HIGHDPI | SDL_WINDOW_SHOWN
+        flags = SDL_WINDOW_ALLOW_HIGHDPI | (SDL_WINDOW_HIDDEN if hidden else SDL_WINDOW_SHOWN)
 
         if borderless:
             flags |= SDL_WINDOW_BORDERLESS
@@ -184,7 +210,7 @@ class sdl_window(render_target):
         if super_sampling:
             self.width *= 2
             self.height *= 2
-        self.renderer: sdl_renderer = sdl_renderer(self)
+        self.renderer: sdl_renderer = sdl_renderer(self, software)
         self.handler = event_handler(self)
         self.handler.add_callback(sdl_window.basic_sdl_event_handler)
         if super_sampling:
@@ -259,6 +285,9 @@ class sdl_surface:
         self.handle = ptr
         self.width = -1
         self.height = -1
+        if ptr:
+            self.width = ptr.contents.w
+            self.height = ptr.contents.h
 
     @classmethod
     def generate(cls, w: int, h: int, depth: int = 32) -> surface:
@@ -358,24 +387,19 @@ class sdl_texture(render_target):
         SDL_UpdateTexture(self.handle, POINTER(SDL_Rect)(), pointer, c_int(int(width * depth)))
 
     def direct_copy_to_parent(self):
-        null_p = POINTER(SDL_Rect)()
-        SDL_RenderCopy(self.parent.handle, self.handle, null_p, null_p)
+        SDL_RenderCopy(self.parent.handle, self.handle, NULL_RECT, NULL_RECT)
 
     def crop_copy_to_parent(self, source: SDL_Rect, destination: SDL_Rect):
         SDL_RenderCopy(self.parent.handle, self.handle, byref(source), byref(destination))
 
     def copy_to_parent(self, area: SDL_Rect):
-        SDL_RenderCopy(self.parent.handle, self.handle, POINTER(SDL_Rect)(), byref(area))
+        SDL_RenderCopy(self.parent.handle, self.handle, NULL_RECT, area)
 
     def rotate_copy_to_parent(self, area: SDL_Rect, center: SDL_Point, angle: float):
-        c_angle = c_double(angle)
-        SDL_RenderCopyEx(self.parent.handle, self.handle, c_void_p(0), byref(area),
-                         c_angle, byref(center), SDL_FLIP_NONE)
+        SDL_RenderCopyEx(self.parent.handle, self.handle, NULL_RECT, area, angle, center, SDL_FLIP_NONE)
 
     def direct_rotate_copy_to_parent(self, area: SDL_Rect, angle: float):
-        c_angle = c_double(angle)
-        SDL_RenderCopyEx(self.parent.handle, self.handle, c_void_p(0), byref(area),
-                         c_angle, c_void_p(0), SDL_FLIP_NONE)
+        SDL_RenderCopyEx(self.parent.handle, self.handle, NULL_RECT, area, angle, NULL_POINT, SDL_FLIP_NONE)
 
     def is_texture_available(self):
         return self.handle != 0
@@ -401,3 +425,100 @@ class sdl_texture(render_target):
 
     def get_id(self):
         return self.handle
+
+
+def is_geometry_supported() -> bool:
+    """Checks whether the loaded SDL library provides SDL_RenderGeometryRaw, which was added in SDL 2.0.18."""
+    if SDL_RenderGeometryRaw is None:
+        return False
+    version = SDL_version()
+    SDL_GetVersion(byref(version))
+    return (version.major, version.minor, version.patch) >= (2, 0, 18)
+
+
+class sdl_draw_batch:
+    """
+    Collects rotated quads of a frame into preallocated vertex and index buffers, and submits them with one
+    SDL_RenderGeometryRaw call per run of quads sharing a texture, instead of one SDL_RenderCopyEx call per object.\n
+    The quads are drawn in the order they are added. Call flush() before drawing anything else directly, and at the
+    end of the frame. If the SDL library does not support geometry rendering, enabled is False and the drawable
+    objects fall back to their per-call draw methods.
+    """
+    __slots__ = ("parent", "capacity", "enabled", "texture", "count", "xy", "uv", "colors", "indices",
+                 "xy_pointer", "uv_pointer", "color_pointer", "submit_count")
+
+    def __init__(self, parent: sdl_renderer, capacity: int = 1024, enabled: bool = True):
+        """
+        Initializes a new batch.\n
+        :param parent: The renderer to draw at.
+        :param capacity: The number of quads the buffers hold. A full batch is flushed automatically.
+        :param enabled: Whether to batch at all. It is turned off if geometry rendering is not supported.
+        """
+        self.parent = parent
+        self.capacity = capacity
+        self.enabled = enabled and is_geometry_supported()
+        self.texture = None
+        self.count = 0
+        self.submit_count = 0
+
+        # 4 vertices per quad: x and y, u and v, and an rgba color each.
+        self.xy = (c_float * (capacity * 8))()
+        self.uv = (c_float * (capacity * 8))()
+        self.colors = (c_uint8 * (capacity * 16))()
+        self.xy_pointer = cast(self.xy, POINTER(c_float))
+        self.uv_pointer = cast(self.uv, POINTER(c_float))
+        self.color_pointer = cast(self.colors, POINTER(SDL_Color))
+        # two triangles per quad, never changed.
+        indices = []
+        for i in range(0, capacity * 4, 4):
+            indices += (i, i + 1, i + 2, i, i + 2, i + 3)
+        self.indices = (c_int * (capacity * 6))(*indices)
+
+    def add_quad(self, texture, x_center: float, y_center: float, w: float, h: float, angle: float,
+                 uv: tuple[float, float, float, float] = (0.0, 0.0, 1.0, 1.0),
+                 color: tuple[int, int, int, int] = (255, 255, 255, 255)):
+        """
+        Adds a rotated quad to the batch.\n
+        :param texture: The sdl_texture to sample, or None for a quad filled with color.
+        :param x_center: The x coordinate of the center.
+        :param y_center: The y coordinate of the center.
+        :param w: The width of the quad.
+        :param h: The height of the quad.
+        :param angle: The degree that the quad rotates clockwise around its center.
+        :param uv: The normalized (u0, v0, u1, v1) texture rectangle.
+        :param color: The rgba color, which modulates the texture.
+        :return: None.
+        """
+        if texture is not self.texture or self.count == self.capacity:
+            self.flush()
+            self.texture = texture
+        rad = angle * (pi / 180.0)
+        c = cos(rad)
+        s = sin(rad)
+        # half extents of the quad along its rotated x and y axes.
+        ax = w * 0.5 * c
+        ay = w * 0.5 * s
+        bx = -h * 0.5 * s
+        by = h * 0.5 * c
+        k = self.count * 8
+        self.xy[k:k + 8] = (x_center - ax - bx, y_center - ay - by, x_center + ax - bx, y_center + ay - by,
+                            x_center + ax + bx, y_center + ay + by, x_center - ax + bx, y_center - ay + by)
+        u0, v0, u1, v1 = uv
+        self.uv[k:k + 8] = (u0, v0, u1, v0, u1, v1, u0, v1)
+        self.colors[k * 2:k * 2 + 16] = color * 4
+        self.count += 1
+
+    def flush(self):
+        """Submits the pending quads to the renderer."""
+        count = self.count
+        if count == 0:
+            return
+        texture = self.texture
+        SDL_RenderGeometryRaw(self.parent.handle, None if texture is None else texture.handle,
+                              self.xy_pointer, 8, self.color_pointer, 4, self.uv_pointer, 8, count * 4,
+                              self.indices, count * 6, 4)
+        self.count = 0
+        self.submit_count += 1
+
+    def reset_stats(self):
+        self.submit_count = 0
@@ -1,17 +1,26 @@
-from ctypes import POINTER
+from collections import OrderedDict
+from ctypes import POINTER, byref, c_int, cast, c_void_p
 
 from sdl2.sdlttf import *
-from sdl_render import sdl_surface, sdl_texture, sdl_renderer
-from sdl2 import SDL_Rect, SDL_Surface, SDL_FreeSurface
+from sdl_render import sdl_surface, sdl_texture, sdl_renderer, sdl_draw_batch
+from sdl_atlas import sdl_texture_atlas, sdl_atlas_region
+from sdl2 import SDL_Rect, SDL_Surface, SDL_FreeSurface, SDL_Color, SDL_RenderCopy, SDL_UpdateTexture, \
+    SDL_ConvertSurfaceFormat, SDL_GetError, SDL_PIXELFORMAT_ARGB8888
+
+# the glyphs rasterized when a glyph cache is created.
+DEFAULT_CHARSET = "".join(chr(c) for c in range(0x20, 0x7f))
+
+_GLYPH_PADDING = 1  # the transparent gap around every glyph in a page, which keeps filtering from bleeding.
 
 
 class sdl_font:
-    __slots__ = ("p_font", "font_size")
+    __slots__ = ("p_font", "font_size", "file_path")
     library_initialized: bool = False
 
-    def __init__(self, ttf_font, size: int):
+    def __init__(self, ttf_font, size: int, file_path: str or None = None):
         self.p_font = ttf_font
         self.font_size = size
+        self.file_path = file_path  # None if unknown, e.g. for fonts opened from memory.
 
     def destroy(self):
         if self.p_font is None:
@@ -22,7 +31,7 @@ class sdl_font:
     @classmethod
     def open_ttf(cls, file_path: str, font_size: int):
         ptr = TTF_OpenFont(file_path.encode("utf-8"), font_size)
-        return cls(ptr, font_size)
+        return cls(ptr, font_size, file_path)
 
     @classmethod
     def init(cls):
@@ -42,12 +51,12 @@ class sdl_text:
 
     def __init__(self, text: str, font: sdl_font,
                  parent: sdl_renderer, foreground_color: tuple[int, int, int] = (255, 255, 255, 255)):
-        self.font = sdl_font
+        self.font = font
         self.text = text
         self.col = SDL_Color(foreground_color[0], foreground_color[1], foreground_color[2], foreground_color[3])
-        s = TTF_RenderText_Blended(font.p_font, text.encode("utf-8"), self.col)
+        s = TTF_RenderUTF8_Blended(font.p_font, text.encode("utf-8"), self.col)
         self.tex = sdl_texture.from_surface(sdl_surface(s), parent)
-        surface_copy: SDL_Surface = s.content
+        surface_copy: SDL_Surface = s.contents
         self.w = surface_copy.w
         self.h = surface_copy.h
         SDL_FreeSurface(s)
@@ -55,3 +64,255 @@ class sdl_text:
     def draw(self, area: SDL_Rect):
         self.tex.copy_to_parent(area)
 
+    def destroy(self):
+        self.tex.destroy()
+
+
+
+class sdl_glyph:
+    """Represents one rasterized glyph: its region in an atlas page and how far it moves the pen."""
+    __slots__ = ("region", "offset_x", "advance")
+
+    def __init__(self, region: sdl_atlas_region or None, offset_x: int, advance: int):
+        self.region = region  # None for glyphs with no pixels, e.g. spaces.
+        self.offset_x = offset_x
+        self.advance = advance
+
+
+class sdl_glyph_cache:
+    """
+    Represents the glyphs of one font, size and color, each rasterized once into atlas textures.\n
+    Glyphs are shelf-packed into fixed-size pages as they are first used, and a new page is only started when the last
+    one is full, so text in large scripts such as CJK shares a few textures. Packed glyphs never move, so the regions
+    handed out stay valid.
+    """
+    __slots__ = ("font", "parent", "color", "col", "glyphs", "pages", "height", "kerning", "kerning_font",
+                 "page_size", "pen_x", "shelf_y", "shelf_height")
+    caches: dict = {}
+
+    def __init__(self, font: sdl_font, parent: sdl_renderer, color: tuple[int, int, int, int] = (255, 255, 255, 255),
+                 charset: str = DEFAULT_CHARSET, page_size: int = 512):
+        """
+        Initializes a new glyph cache. Use get() to share caches between texts.\n
+        :param font: The font.
+        :param parent: The renderer the atlas textures belong to.
+        :param color: The rgba color of the glyphs.
+        :param charset: The characters rasterized at once.
+        :param page_size: The width and height of every page. It is enlarged to fit several lines of the font.
+        """
+        self.font = font
+        self.parent = parent
+        self.color = tuple(color)
+        self.col = SDL_Color(*self.color)
+        self.glyphs: dict[str, sdl_glyph] = {}
+        self.pages: list[sdl_texture_atlas] = []
+        self.height = TTF_FontHeight(font.p_font)
+        self.kerning = TTF_GetFontKerning(font.p_font) != 0
+        # SDL_ttf places glyphs in 26.6 fixed point, but only tells whole pixel kerning. The same font 64 times larger
+        # tells it in 1/64 pixels. None to round kerning to whole pixels, if the font file is unknown.
+        self.kerning_font = None
+        if self.kerning and font.file_path is not None:
+            self.kerning_font = TTF_OpenFont(font.file_path.encode("utf-8"), font.font_size * 64) or None
+        self.page_size = max(page_size, 4 * self.height)
+        # the free space of the last page: the pen on the current shelf, and the shelf top and height.
+        self.pen_x = self.shelf_y = self.shelf_height = 0
+        self.add_glyphs(charset)
+
+    @classmethod
+    def get(cls, font: sdl_font, parent: sdl_renderer, color: tuple[int, int, int, int] = (255, 255, 255, 255)):
+        """Gets the shared glyph cache of a font, size and color, creating it on first use."""
+        key = (cast(font.p_font, c_void_p).value, font.font_size, tuple(color), cast(parent.handle, c_void_p).value)
+        cache = cls.caches.get(key)
+        if cache is None:
+            cache = cls(font, parent, color)
+            cls.caches[key] = cache
+        return cache
+
+    @classmethod
+    def destroy_all(cls):
+        """Destroys every shared glyph cache, e.g. before the fonts or the renderer are destroyed."""
+        for cache in cls.caches.values():
+            cache.destroy()
+        cls.caches.clear()
+
+    def add_glyphs(self, text: str):
+        """Rasterizes the characters of given text which are not cached yet, into the free space of the pages."""
+        p_font = self.font.p_font
+        minx, maxx, miny, maxy, advance = c_int(0), c_int(0), c_int(0), c_int(0), c_int(0)
+        for ch in text:
+            if ch in self.glyphs:
+                continue
+            if TTF_GlyphMetrics32(p_font, ord(ch), byref(minx), byref(maxx), byref(miny), byref(maxy),
+                                  byref(advance)) != 0:
+                minx.value = maxx.value = advance.value = 0
+            # the glyph surface starts at the pen, or left of it if the glyph overhangs.
+            glyph = sdl_glyph(None, min(0, minx.value), advance.value)
+            self.glyphs[ch] = glyph
+            if maxx.value <= minx.value:
+                continue
+            rendered = TTF_RenderGlyph32_Blended(p_font, ord(ch), self.col)
+            if not rendered:
+                continue
+            converted = SDL_ConvertSurfaceFormat(rendered, SDL_PIXELFORMAT_ARGB8888, 0)
+            SDL_FreeSurface(rendered)
+            if not converted:
+                raise RuntimeError("Failed to convert a glyph: %s" % SDL_GetError().decode("utf-8", "replace"))
+            try:
+                glyph.region = self.pack_glyph(converted)
+            finally:
+                SDL_FreeSurface(converted)
+
+    def add_page(self):
+        """Starts a new empty page, which the next glyphs are packed into."""
+        size = self.page_size
+        tex = sdl_texture.generate(self.parent, size, size)
+        SDL_UpdateTexture(tex.handle, None, bytes(size * size * 4), size * 4)  # transparent, for the gaps.
+        self.pages.append(sdl_texture_atlas(tex, {}))
+        self.pen_x = self.shelf_y = _GLYPH_PADDING
+        self.shelf_height = 0
+
+    def pack_glyph(self, surface) -> sdl_atlas_region:
+        """Copies an ARGB8888 glyph surface into the free space of the last page, starting a page if it is full."""
+        w, h = surface.contents.w, surface.contents.h
+        size = self.page_size
+        if w + _GLYPH_PADDING * 2 > size or h + _GLYPH_PADDING * 2 > size:
+            raise ValueError("A glyph of %dx%d does not fit in a page of %d." % (w, h, size))
+        if self.pages and self.pen_x + w + _GLYPH_PADDING > size:
+            self.pen_x = _GLYPH_PADDING
+            self.shelf_y += self.shelf_height
+            self.shelf_height = 0
+        if not self.pages or self.shelf_y + h + _GLYPH_PADDING > size:
+            self.add_page()
+        page = self.pages[-1]
+        x, y = self.pen_x, self.shelf_y
+        SDL_UpdateTexture(page.tex.handle, byref(SDL_Rect(x, y, w, h)), surface.contents.pixels,
+                          surface.contents.pitch)
+        self.pen_x += w + _GLYPH_PADDING
+        self.shelf_height = max(self.shelf_height, h + _GLYPH_PADDING)
+        region = sdl_atlas_region(page, x, y, w, h)
+        page.regions[str(len(page.regions))] = region
+        return region
+
+    def layout(self, text: str):
+        """Places the glyphs of given text, rasterizing the missing ones."""
+        self.add_glyphs(text)
+        return sdl_text_layout(self, text)
+
+    def get_kerning(self, previous: str, ch: str) -> int:
+        """Gets the kerning between two characters in 26.6 fixed point, i.e. 1/64 pixels."""
+        if self.kerning_font is not None:
+            return TTF_GetFontKerningSizeGlyphs32(self.kerning_font, ord(previous), ord(ch))
+        return TTF_GetFontKerningSizeGlyphs32(self.font.p_font, ord(previous), ord(ch)) << 6
+
+    def destroy(self):
+        for page in self.pages:
+            page.destroy()
+        self.pages.clear()
+        self.glyphs.clear()
+        if self.kerning_font is not None:
+            TTF_CloseFont(self.kerning_font)
+            self.kerning_font = None
+
+
+class sdl_text_layout:
+    """
+    Represents a line of text placed with a glyph cache. It is drawn as one sub-rectangle copy per glyph from the
+    atlas, or added to a draw batch.
+    """
+    __slots__ = ("text", "regions", "xs", "dsts", "w", "h")
+
+    def __init__(self, cache: sdl_glyph_cache, text: str):
+        self.text = text
+        self.regions: list[sdl_atlas_region] = []
+        self.xs: list[int] = []
+        glyphs = cache.glyphs
+        x = 0  # the pen in 26.6 fixed point, like TTF_RenderUTF8, so fractional kerning adds up the same.
+        previous = None
+        for ch in text:
+            glyph = glyphs[ch]
+            if cache.kerning and previous is not None:
+                x += cache.get_kerning(previous, ch)
+            if glyph.region is not None:
+                self.regions.append(glyph.region)
+                self.xs.append((x >> 6) + glyph.offset_x)
+            x += glyph.advance << 6
+            previous = ch
+        x >>= 6
+        # like TTF_RenderUTF8, a glyph overhanging the start moves the whole line right, so no pixel is cut off.
+        shift = max(0, -min(self.xs, default=0))
+        if shift > 0:
+            self.xs = [offset + shift for offset in self.xs]
+        # reused by draw(), only the position changes.
+        self.dsts = [SDL_Rect(0, 0, region.width, region.height) for region in self.regions]
+        self.w = max([x + shift] + [offset + region.width for offset, region in zip(self.xs, self.regions)])
+        self.h = cache.height
+
+    def draw(self, x: int, y: int, batch: sdl_draw_batch or None = None):
+        """
+        Draws the text with its top left corner at given position.\n
+        :param x: The x coordinate of the left edge.
+        :param y: The y coordinate of the top edge.
+        :param batch: The draw batch to add the glyphs to. None to copy every glyph directly.
+        :return: None.
+        """
+        if batch is not None and batch.enabled:
+            for region, offset in zip(self.regions, self.xs):
+                w, h = region.width, region.height
+                batch.add_quad(region.atlas.tex, x + offset + w / 2, y + h / 2, w, h, 0.0, region.uv)
+            return
+        x = int(x)
+        y = int(y)
+        for region, offset, dst in zip(self.regions, self.xs, self.dsts):
+            tex = region.atlas.tex
+            dst.x = x + offset
+            dst.y = y
+            SDL_RenderCopy(tex.parent.handle, tex.handle, region.src, dst)
+
+
+class sdl_text_cache:
+    """
+    Represents a least recently used cache of text layouts, so repeated strings such as a score or a combo counter
+    are laid out once.
+    """
+    __slots__ = ("glyphs", "capacity", "layouts", "hits", "misses", "evictions")
+
+    def __init__(self, glyphs: sdl_glyph_cache, capacity: int = 256):
+        """
+        Initializes a new text cache.\n
+        :param glyphs: The glyph cache the texts are drawn with.
+        :param capacity: The maximum number of layouts kept.
+        """
+        self.glyphs = glyphs
+        self.capacity = capacity
+        self.layouts: OrderedDict[str, sdl_text_layout] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.layouts)
+
+    def get(self, text: str) -> sdl_text_layout:
+        """Gets the layout of given text, laying it out if it is not cached."""
+        layouts = self.layouts
+        layout = layouts.get(text)
+        if layout is not None:
+            layouts.move_to_end(text)
+            self.hits += 1
+            return layout
+        self.misses += 1
+        layout = self.glyphs.layout(text)
+        layouts[text] = layout
+        if len(layouts) > self.capacity:
+            layouts.popitem(last=False)
+            self.evictions += 1
+        return layout
+
+    def draw(self, text: str, x: int, y: int, batch: sdl_draw_batch or None = None) -> sdl_text_layout:
+        """Draws given text with its top left corner at given position, see sdl_text_layout.draw()."""
+        layout = self.get(text)
+        layout.draw(x, y, batch)
+        return layout
+
+    def clear(self):
+        self.layouts.clear()
@@ -18,10 +18,11 @@ class sdl_transparent_cover:
         Draws current cover to the renderer. This operation is not thread-safe.\n
         :return: None.
         """
-        raw_col = self.parent.get_draw_color()
-        self.parent.set_draw_color(self.r, self.g, self.b, self.a)
-        self.parent.fill()
-        self.parent.set_draw_color(*raw_col)
+        parent = self.parent
+        raw_col = parent.draw_color  # cached by the renderer, so no SDL call is needed to read it.
+        parent.set_draw_color(self.r, self.g, self.b, self.a)
+        SDL_RenderFillRect(parent.handle, NULL_RECT)
+        parent.set_draw_color(*raw_col)
 
     def draw_ranged_cover(self, area: SDL_Rect):
         """
@@ -29,10 +30,11 @@ class sdl_transparent_cover:
         :param area: A SDL rectangle structure, indicating where is drawn.
         :return: None.
         """
-        raw_col = self.parent.get_draw_color()
-        self.parent.set_draw_color(self.r, self.g, self.b, self.a)
-        self.parent.fill_area(area)
-        self.parent.set_draw_color(*raw_col)
+        parent = self.parent
+        raw_col = parent.draw_color
+        parent.set_draw_color(self.r, self.g, self.b, self.a)
+        SDL_RenderFillRect(parent.handle, area)
+        parent.set_draw_color(*raw_col)
 
     def set_alpha(self, a: int):
         self.a = a
@@ -28,3 +28,9 @@ class audio_file:
 
     def async_play(self):
         self.currently_used_channel = Mix_PlayChannel(-1, self.sound_object, 0)
+
+    def destroy(self):
+        if self.sound_object:
+            Mix_FreeChunk(self.sound_object)
+        self.sound_object = None
+        self.currently_used_channel = -1